@@ -0,0 +1,62 @@
+"""Compare the json codecs of AsyncpgSQLDatabase on wide JSON rows.
+
+This measures the encoding and decoding that asyncpg does for every json / jsonb
+value (without a database connection).
+"""
+import argparse
+import timeit
+
+from clean_python.sql import JsonCodec
+from clean_python.sql import OrjsonCodec
+from clean_python.sql.asyncpg_sql_database import JSONB_VERSION
+
+
+def wide_row(i: int, width: int) -> dict:
+    return {
+        f"field_{j}": [
+            i * j,
+            f"value {i} {j}",
+            i / (j + 1),
+            j % 2 == 0,
+            None,
+            {"nested": [i, j]},
+        ][j % 6]
+        for j in range(width)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = [wide_row(i, args.width) for i in range(args.rows)]
+    encoded = [JsonCodec().dumps(x) for x in rows]
+    raw = [JSONB_VERSION + x.encode() for x in encoded]
+
+    print(f"{args.rows} rows of {args.width} fields, best of {args.repeat} (ms)")
+    for codec in (JsonCodec(), OrjsonCodec()):
+        name = codec.__class__.__name__
+        dumps = min(
+            timeit.repeat(
+                lambda: [codec.dumps(x) for x in rows], number=1, repeat=args.repeat
+            )
+        )
+        loads = min(
+            timeit.repeat(
+                lambda: [codec.loads(x) for x in encoded],
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(f"{name:>12}: dumps {dumps * 1000:8.1f}  loads {loads * 1000:8.1f}")
+    passthrough = min(
+        timeit.repeat(lambda: [x[1:] for x in raw], number=1, repeat=args.repeat)
+    )
+    print(f"{'raw_jsonb':>12}: loads {passthrough * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 import inject
 from sqlalchemy import text
 
+from clean_python import ThreadedGateway
 from clean_python.fastapi import get
 from clean_python.fastapi import Resource
 from clean_python.fastapi import Service
@@ -26,17 +27,47 @@ URL = "postgres:postgres@localhost:5432"
 DB = "sqlcomparison"
 POOL_SIZE = 50
 
+VARIANT = os.environ["SQL_COMPARISON"]
+
 SQLDatabaseImpl = {
     "sqlalchemy_sync": SQLAlchemySyncSQLDatabase,
+    "sqlalchemy_threaded": SQLAlchemySyncSQLDatabase,
     "sqlalchemy_async": SQLAlchemyAsyncSQLDatabase,
     "asyncpg": AsyncpgSQLDatabase,
-}[os.environ["SQL_COMPARISON"]]
+}[VARIANT]
 
 
 USE_SYNC = issubclass(SQLDatabaseImpl, SyncSQLDatabase)
 
 
-if USE_SYNC:
+if VARIANT == "sqlalchemy_threaded":
+    # the sync stack, exposed as async gateway running on a dedicated thread pool
+
+    def bootstrap(x: inject.Binder) -> None:
+        x.bind(SyncSQLDatabase, SQLDatabaseImpl(f"{URL}/{DB}", pool_size=POOL_SIZE))
+
+    class SQLComparisonResource(Resource, version=v(1), name="sql-comparison"):
+        def __init__(self):
+            self.sync_gateway = TestModelSyncGateway()
+            self.gateway = ThreadedGateway(self.sync_gateway, max_workers=POOL_SIZE)
+            self.manage = ManageTestModel(TestModelRepository(self.gateway))
+
+        @get("/sleep/{ms}")
+        async def sleep(self, ms: int):
+            return await self.gateway.run(
+                self.sync_gateway.provider.execute,
+                text("SELECT pg_sleep(:sec)").bindparams(sec=ms / 1000),
+            )
+
+        @get("/raw/{id}")
+        async def raw(self, id: int):
+            return await self.gateway.get(id)
+
+        @get("/get/{id}")
+        async def get(self, id: int) -> TestModel:
+            return await self.manage.retrieve(id)
+
+elif USE_SYNC:
 
     def bootstrap(x: inject.Binder) -> None:
         x.bind(SyncSQLDatabase, SQLDatabaseImpl(f"{URL}/{DB}", pool_size=POOL_SIZE))
@@ -1,8 +1,11 @@
 # (c) Nelen & Schuurmans
 
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
 from typing import Any
 from typing import Generic
 from typing import List
+from typing import overload
 from typing import TypeVar
 
 import backoff
@@ -11,6 +14,7 @@ from clean_python.base.domain import Conflict
 from clean_python.base.domain import Filter
 from clean_python.base.domain import Id
 from clean_python.base.domain import Json
+from clean_python.base.domain import Metric
 from clean_python.base.domain import Page
 from clean_python.base.domain import PageOptions
 from clean_python.base.domain import Repository
@@ -43,7 +47,13 @@ class Manage(Generic[T]):
     async def create(self, values: Json) -> T:
         return await self.repo.add(values)
 
-    async def update(self, id: Id, values: Json, retry_on_conflict: bool = True) -> T:
+    async def update(
+        self,
+        id: Id,
+        values: Json,
+        retry_on_conflict: bool = True,
+        existing: T | None = None,
+    ) -> T:
         """This update has a built-in retry function that can be switched off.
 
         This because some gateways (SQLGateway, ApiGateway) may raise Conflict
@@ -53,7 +63,16 @@ class Manage(Generic[T]):
 
         If the repo.update is not idempotent (which is atypical), retries should be
         switched off.
+
+        The `existing` object (if it was read before) is used for the first attempt,
+        see Repository.update. The retries read the object again.
         """
+        if existing is not None:
+            try:
+                return await self.repo.update(id, values, existing=existing)
+            except Conflict:
+                if not retry_on_conflict:
+                    raise
         if retry_on_conflict:
             return await self._update_with_retries(id, values)
         else:
@@ -74,10 +93,41 @@ class Manage(Generic[T]):
     ) -> Page[T]:
         return await self.repo.by(key, value, params=params)
 
+    @overload
     async def filter(
-        self, filters: List[Filter], params: PageOptions | None = None
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        fields: None = None,
     ) -> Page[T]:
-        return await self.repo.filter(filters, params=params)
+        ...
+
+    @overload
+    async def filter(
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        *,
+        fields: List[str],
+    ) -> Page[Json]:
+        ...
+
+    async def filter(
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        fields: List[str] | None = None,
+    ) -> Page[T] | Page[Json]:
+        # only pass fields if given, for repositories that don't support it
+        if fields is None:
+            return await self.repo.filter(filters, params=params)
+        return await self.repo.filter(filters, params=params, fields=fields)
+
+    async def iterate(
+        self, filters: List[Filter], batch_size: int = 1000
+    ) -> AsyncIterator[T]:
+        async for item in self.repo.iterate(filters, batch_size=batch_size):
+            yield item
 
     async def count(self, filters: List[Filter]) -> int:
         return await self.repo.count(filters)
@@ -85,6 +135,11 @@ class Manage(Generic[T]):
     async def exists(self, filters: List[Filter]) -> bool:
         return await self.repo.exists(filters)
 
+    async def aggregate(
+        self, filters: List[Filter], group_by: List[str], metrics: List[Metric]
+    ) -> List[Json]:
+        return await self.repo.aggregate(filters, group_by, metrics)
+
 
 class SyncManage(Generic[T]):
     repo: SyncRepository[T]
@@ -136,13 +191,46 @@ class SyncManage(Generic[T]):
     def by(self, key: str, value: Any, params: PageOptions | None = None) -> Page[T]:
         return self.repo.by(key, value, params=params)
 
+    @overload
     def filter(
-        self, filters: List[Filter], params: PageOptions | None = None
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        fields: None = None,
     ) -> Page[T]:
-        return self.repo.filter(filters, params=params)
+        ...
+
+    @overload
+    def filter(
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        *,
+        fields: List[str],
+    ) -> Page[Json]:
+        ...
+
+    def filter(
+        self,
+        filters: List[Filter],
+        params: PageOptions | None = None,
+        fields: List[str] | None = None,
+    ) -> Page[T] | Page[Json]:
+        # only pass fields if given, for repositories that don't support it
+        if fields is None:
+            return self.repo.filter(filters, params=params)
+        return self.repo.filter(filters, params=params, fields=fields)
+
+    def iterate(self, filters: List[Filter], batch_size: int = 1000) -> Iterator[T]:
+        return self.repo.iterate(filters, batch_size=batch_size)
 
     def count(self, filters: List[Filter]) -> int:
         return self.repo.count(filters)
 
     def exists(self, filters: List[Filter]) -> bool:
         return self.repo.exists(filters)
+
+    def aggregate(
+        self, filters: List[Filter], group_by: List[str], metrics: List[Metric]
+    ) -> List[Json]:
+        return self.repo.aggregate(filters, group_by, metrics)
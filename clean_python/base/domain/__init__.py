@@ -1,3 +1,4 @@
+from .aggregate import *  # NOQA
 from .context import *  # NOQA
 from .domain_event import *  # NOQA
 from .domain_service import *  # NOQA
@@ -7,5 +8,6 @@ from .gateway import *  # NOQA
 from .pagination import *  # NOQA
 from .repository import *  # NOQA
 from .root_entity import *  # NOQA
+from .rows import *  # NOQA
 from .types import *  # NOQA
 from .value_object import *  # NOQA
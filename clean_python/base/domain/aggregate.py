@@ -0,0 +1,84 @@
+# (c) Nelen & Schuurmans
+
+from enum import Enum
+from typing import Any
+
+from pydantic import model_validator
+
+from .types import Json
+from .value_object import ValueObject
+
+__all__ = ["AggregateFunction", "Metric"]
+
+
+class AggregateFunction(str, Enum):
+    COUNT = "count"
+    SUM = "sum"
+    MIN = "min"
+    MAX = "max"
+    AVG = "avg"
+
+
+class Metric(ValueObject):
+    """An aggregate of a field, like in SQL: null values are ignored.
+
+    The result is stored under `name`, which defaults to "<function>_<field>". Without
+    a field, the count is the number of records.
+    """
+
+    function: AggregateFunction
+    field: str | None = None
+    name: str | None = None
+
+    @model_validator(mode="after")
+    def verify_field(self):
+        if self.field is None and self.function is not AggregateFunction.COUNT:
+            raise ValueError(
+                f"The aggregate function '{self.function.value}' needs a field"
+            )
+        return self
+
+    @property
+    def label(self) -> str:
+        if self.name is not None:
+            return self.name
+        elif self.field is None:
+            return self.function.value
+        return f"{self.function.value}_{self.field}"
+
+    def compute(self, records: list[Json]) -> Any:
+        if self.field is None:
+            return len(records)
+        values = [x[self.field] for x in records if x.get(self.field) is not None]
+        if self.function is AggregateFunction.COUNT:
+            return len(values)
+        elif not values:
+            return None
+        elif self.function is AggregateFunction.SUM:
+            return sum(values)
+        elif self.function is AggregateFunction.MIN:
+            return min(values)
+        elif self.function is AggregateFunction.MAX:
+            return max(values)
+        else:
+            return sum(values) / len(values)
+
+
+def aggregate_records(
+    records: list[Json], group_by: list[str], metrics: list[Metric]
+) -> list[Json]:
+    """Aggregate records in Python, like SQL's GROUP BY (ordered by the groups)"""
+    groups: dict[tuple[Any, ...], list[Json]] = {}
+    for record in records:
+        key = tuple(record.get(x) for x in group_by)
+        groups.setdefault(key, []).append(record)
+    if not group_by and not groups:
+        # without GROUP BY, SQL returns a single row (with a count of 0)
+        groups[()] = []
+    return [
+        {
+            **dict(zip(group_by, key)),
+            **{x.label: x.compute(groups[key]) for x in metrics},
+        }
+        for key in sorted(groups, key=lambda k: [(v is None, v) for v in k])
+    ]
@@ -1,12 +1,14 @@
 # (c) Nelen & Schuurmans
 
 import os
+import time
 from contextvars import ContextVar
 from uuid import UUID
 
 from pydantic import AnyUrl
 from pydantic import FileUrl
 
+from .exceptions import DeadlineExceeded
 from .types import Id
 from .value_object import ValueObject
 
@@ -48,6 +50,12 @@ class Context:
         self._correlation_id_value: ContextVar[UUID | None] = ContextVar(
             "correlation_id", default=None
         )
+        self._read_your_writes_value: ContextVar[bool] = ContextVar(
+            "read_your_writes", default=False
+        )
+        self._deadline_value: ContextVar[float | None] = ContextVar(
+            "deadline", default=None
+        )
 
     @property
     def path(self) -> AnyUrl:
@@ -81,5 +89,35 @@ class Context:
     def correlation_id(self, value: UUID | None) -> None:
         self._correlation_id_value.set(value)
 
+    @property
+    def read_your_writes(self) -> bool:
+        """If True, all queries go to the primary database (see RoutingSQLDatabase)"""
+        return self._read_your_writes_value.get()
+
+    @read_your_writes.setter
+    def read_your_writes(self, value: bool) -> None:
+        self._read_your_writes_value.set(value)
+
+    @property
+    def deadline(self) -> float | None:
+        """The time (see time.monotonic) at which the current request is abandoned"""
+        return self._deadline_value.get()
+
+    @deadline.setter
+    def deadline(self, value: float | None) -> None:
+        self._deadline_value.set(value)
+
+    def time_remaining(self) -> float | None:
+        """The number of seconds until the deadline (None if there is no deadline)
+
+        Raises DeadlineExceeded if the deadline has passed.
+        """
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return remaining
+
 
 ctx = Context()
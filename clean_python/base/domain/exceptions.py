@@ -17,6 +17,7 @@ __all__ = [
     "BadRequest",
     "Unauthorized",
     "BadRequest",
+    "DeadlineExceeded",
 ]
 
 
@@ -103,3 +104,8 @@ class Unauthorized(Exception):
 
 class PermissionDenied(Exception):
     pass
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, msg: str = "the request deadline was exceeded"):
+        super().__init__(msg)
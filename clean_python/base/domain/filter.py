@@ -8,7 +8,18 @@ from pydantic import model_validator
 from .types import Id
 from .value_object import ValueObject
 
-__all__ = ["Filter", "ComparisonFilter", "ComparisonOperator"]
+__all__ = [
+    "Filter",
+    "ComparisonFilter",
+    "ComparisonOperator",
+    "OrFilter",
+    "NotFilter",
+    "IsNullFilter",
+    "BetweenFilter",
+    "PrefixFilter",
+    "ILikeFilter",
+    "ContainsFilter",
+]
 
 
 class Filter(ValueObject):
@@ -37,3 +48,65 @@ class ComparisonFilter(Filter):
         if len(self.values) != 1:
             raise ValueError("ComparisonFilter needs to have exactly one value")
         return self
+
+
+class OrFilter(Filter):
+    """Matches if any of the filters matches"""
+
+    field: str = ""
+    values: list[Any] = []
+    filters: list[Filter]
+
+
+class NotFilter(Filter):
+    """Matches if the filters do not all match.
+
+    Note that in SQL, a comparison with NULL never matches, also when negated.
+    """
+
+    field: str = ""
+    values: list[Any] = []
+    filters: list[Filter]
+
+
+class IsNullFilter(Filter):
+    """Matches if the field is null (None); negate with NotFilter"""
+
+    values: list[Any] = []
+
+
+class BetweenFilter(Filter):
+    """Matches if the field is between the 2 values (inclusive)"""
+
+    @model_validator(mode="after")
+    def verify_two_values(self):
+        if len(self.values) != 2:
+            raise ValueError("BetweenFilter needs to have exactly two values")
+        return self
+
+
+class PrefixFilter(Filter):
+    """Matches if the (text) field starts with the value"""
+
+    @model_validator(mode="after")
+    def verify_one_value(self):
+        if len(self.values) != 1:
+            raise ValueError("PrefixFilter needs to have exactly one value")
+        return self
+
+
+class ILikeFilter(Filter):
+    """Matches if the (text) field matches the LIKE pattern, case-insensitively
+
+    In the pattern, "%" matches any sequence of characters and "_" any character.
+    """
+
+    @model_validator(mode="after")
+    def verify_one_value(self):
+        if len(self.values) != 1:
+            raise ValueError("ILikeFilter needs to have exactly one value")
+        return self
+
+
+class ContainsFilter(Filter):
+    """Matches if the (array or json array) field contains all values"""
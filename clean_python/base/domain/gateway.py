@@ -1,30 +1,104 @@
 # (c) Nelen & Schuurmans
 
 from abc import ABC
+from collections.abc import AsyncIterator
 from collections.abc import Callable
+from collections.abc import Iterator
 from datetime import datetime
 
+from .aggregate import aggregate_records
+from .aggregate import Metric
 from .exceptions import DoesNotExist
 from .filter import Filter
 from .pagination import PageOptions
+from .rows import Rows
 from .types import Id
 from .types import Json
 
 __all__ = ["Gateway", "SyncGateway"]
 
 
+def project(records: list[Json], fields: list[str] | None) -> list[Json]:
+    """Keep only the given fields (and the "id") of the records"""
+    if fields is None:
+        return records
+    keys = ["id", *(x for x in fields if x != "id")]
+    return [{k: x[k] for k in keys if k in x} for x in records]
+
+
+def _is_complete_first_page(params: PageOptions, n_records: int) -> bool:
+    return params.offset == 0 and params.cursor is None and n_records < params.limit
+
+
 class Gateway(ABC):
     async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
+        """Return the matching records. With `fields`, only those (and the "id")."""
         raise NotImplementedError()
 
+    async def filter_rows(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Rows:
+        """Like filter(), but returning the records in a compact form"""
+        # only pass fields if given, for subclasses that don't support it
+        if fields is None:
+            return Rows.from_dicts(await self.filter(filters, params=params))
+        return Rows.from_dicts(await self.filter(filters, params=params, fields=fields))
+
+    async def iter_filter(
+        self, filters: list[Filter], batch_size: int = 1000
+    ) -> AsyncIterator[Json]:
+        """Iterate over all matching records, fetching them in batches"""
+        offset = 0
+        while True:
+            records = await self.filter(
+                filters, params=PageOptions(limit=batch_size, offset=offset)
+            )
+            for record in records:
+                yield record
+            if len(records) < batch_size:
+                break
+            offset += batch_size
+
+    async def filter_with_total(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> tuple[list[Json], int]:
+        """Return the (paginated) records and the total number of matching records"""
+        # only pass fields if given, for subclasses that don't support it
+        if fields is None:
+            records = await self.filter(filters, params=params)
+        else:
+            records = await self.filter(filters, params=params, fields=fields)
+        total = len(records)
+        # when using pagination, we may need to do a count
+        # except in a typical 'first page' situation with few records
+        if params is not None and not _is_complete_first_page(params, total):
+            total = await self.count(filters)
+        return records, total
+
     async def count(self, filters: list[Filter]) -> int:
         return len(await self.filter(filters, params=None))
 
     async def exists(self, filters: list[Filter]) -> bool:
         return len(await self.filter(filters, params=PageOptions(limit=1))) > 0
 
+    async def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        """Compute the metrics per group of records with equal `group_by` fields"""
+        records = await self.filter(filters, params=None)
+        return aggregate_records(records, group_by, metrics)
+
     async def get(self, id: Id) -> Json | None:
         result = await self.filter([Filter(field="id", values=[id])], params=None)
         return result[0] if result else None
@@ -32,6 +106,9 @@ class Gateway(ABC):
     async def add(self, item: Json) -> Json:
         raise NotImplementedError()
 
+    async def add_many(self, items: list[Json]) -> list[Json]:
+        return [await self.add(x) for x in items]
+
     async def update(
         self, item: Json, if_unmodified_since: datetime | None = None
     ) -> Json:
@@ -48,25 +125,96 @@ class Gateway(ABC):
         except DoesNotExist:
             return await self.add(item)
 
+    async def upsert_many(self, items: list[Json]) -> list[Json]:
+        return [await self.upsert(x) for x in items]
+
     async def remove(self, id: Id) -> bool:
         raise NotImplementedError()
 
+    async def remove_filtered(self, filters: list[Filter]) -> int:
+        """Remove all records matching the filters, returns the number removed"""
+        records = await self.filter(filters, params=None)
+        return sum([await self.remove(x["id"]) for x in records])
+
+    async def update_filtered(self, filters: list[Filter], values: Json) -> int:
+        """Update all records matching the filters, returns the number updated"""
+        records = await self.filter(filters, params=None)
+        for record in records:
+            await self.update({**record, **values, "id": record["id"]})
+        return len(records)
+
 
 # This is a copy-paste from clean_python.Gateway, but with all the async / await removed
 
 
 class SyncGateway:
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
+        """Return the matching records. With `fields`, only those (and the "id")."""
         raise NotImplementedError()
 
+    def filter_rows(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Rows:
+        """Like filter(), but returning the records in a compact form"""
+        # only pass fields if given, for subclasses that don't support it
+        if fields is None:
+            return Rows.from_dicts(self.filter(filters, params=params))
+        return Rows.from_dicts(self.filter(filters, params=params, fields=fields))
+
+    def iter_filter(
+        self, filters: list[Filter], batch_size: int = 1000
+    ) -> Iterator[Json]:
+        """Iterate over all matching records, fetching them in batches"""
+        offset = 0
+        while True:
+            records = self.filter(
+                filters, params=PageOptions(limit=batch_size, offset=offset)
+            )
+            yield from records
+            if len(records) < batch_size:
+                break
+            offset += batch_size
+
+    def filter_with_total(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> tuple[list[Json], int]:
+        """Return the (paginated) records and the total number of matching records"""
+        # only pass fields if given, for subclasses that don't support it
+        if fields is None:
+            records = self.filter(filters, params=params)
+        else:
+            records = self.filter(filters, params=params, fields=fields)
+        total = len(records)
+        # when using pagination, we may need to do a count
+        # except in a typical 'first page' situation with few records
+        if params is not None and not _is_complete_first_page(params, total):
+            total = self.count(filters)
+        return records, total
+
     def count(self, filters: list[Filter]) -> int:
         return len(self.filter(filters, params=None))
 
     def exists(self, filters: list[Filter]) -> bool:
         return len(self.filter(filters, params=PageOptions(limit=1))) > 0
 
+    def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        """Compute the metrics per group of records with equal `group_by` fields"""
+        records = self.filter(filters, params=None)
+        return aggregate_records(records, group_by, metrics)
+
     def get(self, id: Id) -> Json | None:
         result = self.filter([Filter(field="id", values=[id])], params=None)
         return result[0] if result else None
@@ -74,6 +222,9 @@ class SyncGateway:
     def add(self, item: Json) -> Json:
         raise NotImplementedError()
 
+    def add_many(self, items: list[Json]) -> list[Json]:
+        return [self.add(x) for x in items]
+
     def update(self, item: Json, if_unmodified_since: datetime | None = None) -> Json:
         raise NotImplementedError()
 
@@ -89,5 +240,20 @@ class SyncGateway:
         except DoesNotExist:
             return self.add(item)
 
+    def upsert_many(self, items: list[Json]) -> list[Json]:
+        return [self.upsert(x) for x in items]
+
     def remove(self, id: Id) -> bool:
         raise NotImplementedError()
+
+    def remove_filtered(self, filters: list[Filter]) -> int:
+        """Remove all records matching the filters, returns the number removed"""
+        records = self.filter(filters, params=None)
+        return sum([self.remove(x["id"]) for x in records])
+
+    def update_filtered(self, filters: list[Filter], values: Json) -> int:
+        """Update all records matching the filters, returns the number updated"""
+        records = self.filter(filters, params=None)
+        for record in records:
+            self.update({**record, **values, "id": record["id"]})
+        return len(records)
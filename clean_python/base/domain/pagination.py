@@ -2,23 +2,60 @@
 
 from collections.abc import Sequence
 from typing import Generic
+from typing import Literal
 from typing import TypeVar
 
 from pydantic import BaseModel
+from pydantic import model_validator
 
 from .types import Id
 
-__all__ = ["Page", "PageOptions"]
+__all__ = ["Page", "PageOptions", "SortKey"]
 
 T = TypeVar("T")
 
 
+class SortKey(BaseModel):
+    """A field to sort by.
+
+    By default, null values come last when ascending and first when descending.
+    """
+
+    field: str
+    ascending: bool = True
+    nulls: Literal["first", "last"] | None = None
+
+
 class PageOptions(BaseModel):
+    """Pagination options.
+
+    Either use `offset` or `cursor` (keyset pagination). The `cursor` is the id of
+    the last item of the previous page, see `Page.next_cursor`.
+
+    Sort by multiple fields with `sort`, which overrides `order_by` and `ascending`.
+    """
+
     limit: int
     offset: int = 0
     order_by: str = "id"
     ascending: bool = True
     cursor: Id | None = None
+    sort: list[SortKey] = []
+
+    @model_validator(mode="after")
+    def set_order_by_from_sort(self):
+        if self.sort:
+            self.order_by = self.sort[0].field
+            self.ascending = self.sort[0].ascending
+        return self
+
+    def sort_keys(self) -> list[SortKey]:
+        """The fields to sort by, up to and including "id" (the tiebreaker)"""
+        keys = self.sort or [SortKey(field=self.order_by, ascending=self.ascending)]
+        for i, key in enumerate(keys):
+            if key.field == "id":
+                return keys[: i + 1]
+        return [*keys, SortKey(field="id", ascending=keys[-1].ascending)]
 
 
 class Page(BaseModel, Generic[T]):
@@ -26,3 +63,4 @@ class Page(BaseModel, Generic[T]):
     items: Sequence[T]
     limit: int | None = None
     offset: int | None = None
+    next_cursor: Id | None = None
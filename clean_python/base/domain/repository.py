@@ -1,16 +1,21 @@
 # (c) Nelen & Schuurmans
 
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
 from datetime import datetime
 from typing import Any
 from typing import Generic
+from typing import overload
 from typing import TypeVar
 
+from .aggregate import Metric
 from .exceptions import DoesNotExist
 from .filter import Filter
 from .gateway import Gateway
 from .gateway import SyncGateway
 from .pagination import Page
 from .pagination import PageOptions
+from .rows import Rows
 from .types import Id
 from .types import Json
 from .value_object import ValueObject
@@ -18,6 +23,26 @@ from .value_object import ValueObject
 __all__ = ["Repository", "SyncRepository"]
 
 T = TypeVar("T", bound=ValueObject)
+S = TypeVar("S")
+
+
+def _next_cursor(params: PageOptions | None, records: list[Json]) -> Id | None:
+    # a full page may be followed by a next page
+    if params is None or not records or len(records) < params.limit:
+        return None
+    return records[-1]["id"]
+
+
+def _page(
+    params: PageOptions | None, records: list[Json], total: int, items: list[S]
+) -> Page[S]:
+    return Page(
+        total=total,
+        limit=params.limit if params else None,
+        offset=params.offset if params else None,
+        next_cursor=_next_cursor(params, records),
+        items=items,
+    )
 
 
 class Repository(Generic[T]):
@@ -40,22 +65,63 @@ class Repository(Generic[T]):
     ) -> Page[T]:
         return await self.filter([Filter(field=key, values=[value])], params=params)
 
+    @overload
     async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: None = None,
     ) -> Page[T]:
-        records = await self.gateway.filter(filters, params=params)
-        total = len(records)
-        # when using pagination, we may need to do a count in the db
-        # except in a typical 'first page' situation with few records
-        if params is not None and not (params.offset == 0 and total < params.limit):
-            total = await self.count(filters)
-        return Page(
-            total=total,
-            limit=params.limit if params else None,
-            offset=params.offset if params else None,
-            items=[self.entity(**x) for x in records],
+        ...
+
+    @overload
+    async def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        *,
+        fields: list[str],
+    ) -> Page[Json]:
+        ...
+
+    async def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Page[T] | Page[Json]:
+        """Return a page of entities.
+
+        With `fields`, the items are dictionaries with only the given fields (and the
+        id) instead of entities, as they would not pass validation. Use a response
+        model that allows that, for instance Page[Json].
+        """
+        if fields is not None:
+            records, total = await self.gateway.filter_with_total(
+                filters, params=params, fields=fields
+            )
+            return _page(params, records, total, records)
+        records, total = await self.gateway.filter_with_total(filters, params=params)
+        return _page(params, records, total, [self.entity(**x) for x in records])
+
+    async def filter_items(
+        self, filters: list[Filter], params: PageOptions | None = None
+    ) -> list[T]:
+        """Like filter(), but without the total and using the compact Gateway.filter_rows"""
+        return self._rows_to_entities(
+            await self.gateway.filter_rows(filters, params=params)
         )
 
+    def _rows_to_entities(self, rows: Rows) -> list[T]:
+        keys = rows.keys
+        return [self.entity(**dict(zip(keys, x))) for x in rows.values]
+
+    async def iterate(
+        self, filters: list[Filter], batch_size: int = 1000
+    ) -> AsyncIterator[T]:
+        async for record in self.gateway.iter_filter(filters, batch_size=batch_size):
+            yield self.entity(**record)
+
     async def get(self, id: Id) -> T:
         res = await self.gateway.get(id)
         if res is None:
@@ -69,11 +135,34 @@ class Repository(Generic[T]):
         created = await self.gateway.add(item.model_dump())
         return self.entity(**created)
 
-    async def update(self, id: Id, values: Json, optimistic: bool = True) -> T:
+    async def add_many(self, items: list[T | Json]) -> list[T]:
+        values = [
+            (self.entity.create(**x) if isinstance(x, dict) else x).model_dump()
+            for x in items
+        ]
+        return [self.entity(**x) for x in await self.gateway.add_many(values)]
+
+    async def update(
+        self,
+        id: Id,
+        values: Json,
+        optimistic: bool = True,
+        existing: T | None = None,
+    ) -> T:
+        """Update the object with `values`, validating the result.
+
+        With `optimistic`, the update raises Conflict if the object was modified after
+        it was read. Pass the `existing` object if it was read before (for instance
+        earlier in the request): then it is not read again, so that the update is a
+        single statement on gateways that support `if_unmodified_since`.
+        """
         if not values:
             return await self.get(id)
         if optimistic:
-            existing = await self.get(id)
+            if existing is None:
+                existing = await self.get(id)
+            elif getattr(existing, "id", None) != id:
+                raise ValueError("The existing object must have the same id")
             updated_at = getattr(existing, "updated_at", None)
             if not isinstance(updated_at, datetime):
                 raise ValueError(
@@ -93,6 +182,10 @@ class Repository(Generic[T]):
         upserted = await self.gateway.upsert(values)
         return self.entity(**upserted)
 
+    async def upsert_many(self, items: list[T]) -> list[T]:
+        values = [x.model_dump() for x in items]
+        return [self.entity(**x) for x in await self.gateway.upsert_many(values)]
+
     async def remove(self, id: Id) -> bool:
         return await self.gateway.remove(id)
 
@@ -102,6 +195,11 @@ class Repository(Generic[T]):
     async def exists(self, filters: list[Filter]) -> bool:
         return await self.gateway.exists(filters)
 
+    async def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        return await self.gateway.aggregate(filters, group_by, metrics)
+
 
 # This is a copy-paste from Repository, but with all the async / await removed
 
@@ -124,21 +222,58 @@ class SyncRepository(Generic[T]):
     def by(self, key: str, value: Any, params: PageOptions | None = None) -> Page[T]:
         return self.filter([Filter(field=key, values=[value])], params=params)
 
+    @overload
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: None = None,
     ) -> Page[T]:
-        records = self.gateway.filter(filters, params=params)
-        total = len(records)
-        # when using pagination, we may need to do a count in the db
-        # except in a typical 'first page' situation with few records
-        if params is not None and not (params.offset == 0 and total < params.limit):
-            total = self.count(filters)
-        return Page(
-            total=total,
-            limit=params.limit if params else None,
-            offset=params.offset if params else None,
-            items=[self.entity(**x) for x in records],
-        )
+        ...
+
+    @overload
+    def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        *,
+        fields: list[str],
+    ) -> Page[Json]:
+        ...
+
+    def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Page[T] | Page[Json]:
+        """Return a page of entities.
+
+        With `fields`, the items are dictionaries with only the given fields (and the
+        id) instead of entities, as they would not pass validation. Use a response
+        model that allows that, for instance Page[Json].
+        """
+        if fields is not None:
+            records, total = self.gateway.filter_with_total(
+                filters, params=params, fields=fields
+            )
+            return _page(params, records, total, records)
+        records, total = self.gateway.filter_with_total(filters, params=params)
+        return _page(params, records, total, [self.entity(**x) for x in records])
+
+    def filter_items(
+        self, filters: list[Filter], params: PageOptions | None = None
+    ) -> list[T]:
+        """Like filter(), but without the total and using the compact Gateway.filter_rows"""
+        return self._rows_to_entities(self.gateway.filter_rows(filters, params=params))
+
+    def _rows_to_entities(self, rows: Rows) -> list[T]:
+        keys = rows.keys
+        return [self.entity(**dict(zip(keys, x))) for x in rows.values]
+
+    def iterate(self, filters: list[Filter], batch_size: int = 1000) -> Iterator[T]:
+        for record in self.gateway.iter_filter(filters, batch_size=batch_size):
+            yield self.entity(**record)
 
     def get(self, id: Id) -> T:
         res = self.gateway.get(id)
@@ -153,6 +288,13 @@ class SyncRepository(Generic[T]):
         created = self.gateway.add(item.model_dump())
         return self.entity(**created)
 
+    def add_many(self, items: list[T | Json]) -> list[T]:
+        values = [
+            (self.entity.create(**x) if isinstance(x, dict) else x).model_dump()
+            for x in items
+        ]
+        return [self.entity(**x) for x in self.gateway.add_many(values)]
+
     def update(self, id: Id, values: Json) -> T:
         if not values:
             return self.get(id)
@@ -166,6 +308,10 @@ class SyncRepository(Generic[T]):
         upserted = self.gateway.upsert(values)
         return self.entity(**upserted)
 
+    def upsert_many(self, items: list[T]) -> list[T]:
+        values = [x.model_dump() for x in items]
+        return [self.entity(**x) for x in self.gateway.upsert_many(values)]
+
     def remove(self, id: Id) -> bool:
         return self.gateway.remove(id)
 
@@ -174,3 +320,8 @@ class SyncRepository(Generic[T]):
 
     def exists(self, filters: list[Filter]) -> bool:
         return self.gateway.exists(filters)
+
+    def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        return self.gateway.aggregate(filters, group_by, metrics)
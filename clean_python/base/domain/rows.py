@@ -0,0 +1,30 @@
+# (c) Nelen & Schuurmans
+
+from collections.abc import Sequence
+from typing import Any
+from typing import NamedTuple
+
+from .types import Json
+
+__all__ = ["Rows"]
+
+
+class Rows(NamedTuple):
+    """Records in a compact form: the keys once, and a sequence of values per record.
+
+    Database drivers return rows in this form, so that producing it does not allocate
+    a dictionary per record.
+    """
+
+    keys: tuple[str, ...]
+    values: Sequence[Sequence[Any]]
+
+    def to_dicts(self) -> list[Json]:
+        keys = self.keys
+        return [dict(zip(keys, x)) for x in self.values]
+
+    @classmethod
+    def from_dicts(cls, records: list[Json]) -> "Rows":
+        """The keys are the union of the keys of all records (missing values are None)"""
+        keys = tuple(dict.fromkeys(k for x in records for k in x))
+        return cls(keys, [tuple(x.get(k) for k in keys) for x in records])
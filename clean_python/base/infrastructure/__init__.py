@@ -3,5 +3,6 @@ from .internal_gateway import *  # NOQA
 from .lru_cache import *  # NOQA
 from .mapper import *  # NOQA
 from .provider import *  # NOQA
+from .threaded_gateway import *  # NOQA
 from .tmpdir_provider import *  # NOQA
 from .typed_internal_gateway import *  # NOQA
@@ -1,22 +1,121 @@
 # (c) Nelen & Schuurmans
 
+import operator
+import re
 from collections.abc import Callable
 from copy import deepcopy
 from datetime import datetime
+from functools import cmp_to_key
+from functools import partial
 
 from clean_python.base.domain import AlreadyExists
+from clean_python.base.domain import BadRequest
+from clean_python.base.domain import BetweenFilter
+from clean_python.base.domain import ComparisonFilter
+from clean_python.base.domain import ComparisonOperator
 from clean_python.base.domain import Conflict
+from clean_python.base.domain import ContainsFilter
 from clean_python.base.domain import DoesNotExist
 from clean_python.base.domain import Filter
 from clean_python.base.domain import Gateway
 from clean_python.base.domain import Id
+from clean_python.base.domain import ILikeFilter
+from clean_python.base.domain import IsNullFilter
 from clean_python.base.domain import Json
+from clean_python.base.domain import NotFilter
+from clean_python.base.domain import OrFilter
 from clean_python.base.domain import PageOptions
+from clean_python.base.domain import PrefixFilter
+from clean_python.base.domain import SortKey
 from clean_python.base.domain import SyncGateway
+from clean_python.base.domain.gateway import project
 
 __all__ = ["InMemoryGateway", "InMemorySyncGateway"]
 
 
+comparison_operators = {
+    ComparisonOperator.EQ: operator.eq,
+    ComparisonOperator.NE: operator.ne,
+    ComparisonOperator.LT: operator.lt,
+    ComparisonOperator.LE: operator.le,
+    ComparisonOperator.GT: operator.gt,
+    ComparisonOperator.GE: operator.ge,
+}
+
+
+def compare(a: Json, b: Json, keys: list[SortKey]) -> int:
+    """Compare records like the SQL ORDER BY (nulls are last when ascending)"""
+    for key in keys:
+        x, y = a.get(key.field), b.get(key.field)
+        if x == y:
+            continue
+        if x is None or y is None:
+            nulls_last = key.ascending if key.nulls is None else key.nulls == "last"
+            return (1 if x is None else -1) * (1 if nulls_last else -1)
+        return (-1 if x < y else 1) * (1 if key.ascending else -1)
+    return 0
+
+
+def _like_token_to_regex(token: str) -> str:
+    if token == "%":
+        return ".*"
+    elif token == "_":
+        return "."
+    # a backslash escapes the next character (like in PostgreSQL)
+    return re.escape(token[-1])
+
+
+def _like_to_regex(pattern: str) -> re.Pattern[str]:
+    regex = "".join(
+        _like_token_to_regex(x) for x in re.findall(r"\\.|.", pattern, re.DOTALL)
+    )
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def matches(record: Json, filter: Filter) -> bool:
+    """Evaluate a filter like SQLBuilder does (an unknown result doesn't match)"""
+    return _evaluate(record, filter) is True
+
+
+def _evaluate(record: Json, filter: Filter) -> bool | None:
+    """Evaluate a filter with the three-valued logic of SQL
+
+    A comparison with None is unknown (None). OR, AND and NOT propagate unknown,
+    so that NOT (x = 1) doesn't match a record where x is None either.
+    """
+    if isinstance(filter, OrFilter):
+        results = [_evaluate(record, x) for x in filter.filters]
+        return True if True in results else None if None in results else False
+    elif isinstance(filter, NotFilter):
+        results = [_evaluate(record, x) for x in filter.filters]
+        return True if False in results else None if None in results else False
+    value = record.get(filter.field)
+    if isinstance(filter, IsNullFilter):
+        return value is None
+    elif isinstance(filter, ComparisonFilter) and filter.values[0] is None:
+        # 'x = None' and 'x != None' compile to IS NULL and IS NOT NULL
+        if filter.operator is ComparisonOperator.EQ:
+            return value is None
+        elif filter.operator is ComparisonOperator.NE:
+            return value is not None
+        return None
+    elif value is None:
+        # a None value in a regular filter matches NULL (like SQLBuilder)
+        return True if type(filter) is Filter and None in filter.values else None
+    elif isinstance(filter, ComparisonFilter):
+        return bool(comparison_operators[filter.operator](value, filter.values[0]))
+    elif isinstance(filter, BetweenFilter):
+        return filter.values[0] <= value <= filter.values[1]
+    elif isinstance(filter, PrefixFilter):
+        return value.startswith(filter.values[0])
+    elif isinstance(filter, ILikeFilter):
+        return bool(_like_to_regex(filter.values[0]).fullmatch(value))
+    elif isinstance(filter, ContainsFilter):
+        return all(x in value for x in filter.values)
+    else:
+        return value in filter.values
+
+
 class InMemoryGateway(Gateway):
     """For testing purposes"""
 
@@ -30,26 +129,35 @@ class InMemoryGateway(Gateway):
             return max(self.data) + 1
 
     def _paginate(self, objs: list[Json], params: PageOptions) -> list[Json]:
-        objs = sorted(
-            objs,
-            key=lambda x: (x.get(params.order_by) is None, x.get(params.order_by)),
-            reverse=not params.ascending,
-        )
+        # "id" is the tiebreaker, like in SQLBuilder
+        keys = params.sort_keys()
+        objs = sorted(objs, key=cmp_to_key(partial(compare, keys=keys)))
+        if params.cursor is not None:
+            if params.cursor in self.data:
+                cursor_obj = self.data[params.cursor]
+            elif len(keys) == 1:
+                cursor_obj = {"id": params.cursor}
+            else:
+                raise BadRequest(
+                    f"record with id={params.cursor} does not exist", loc=("cursor",)
+                )
+            objs = [x for x in objs if compare(x, cursor_obj, keys) > 0]
         return objs[params.offset : params.offset + params.limit]
 
     async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
-        result = []
-        for x in self.data.values():
-            for filter in filters:
-                if x.get(filter.field) not in filter.values:
-                    break
-            else:
-                result.append(deepcopy(x))
+        result = [
+            deepcopy(x)
+            for x in self.data.values()
+            if all(matches(x, filter) for filter in filters)
+        ]
         if params is not None:
             result = self._paginate(result, params)
-        return result
+        return project(result, fields)
 
     async def add(self, item: Json) -> Json:
         item = item.copy()
@@ -106,26 +214,35 @@ class InMemorySyncGateway(SyncGateway):
             return max(self.data) + 1
 
     def _paginate(self, objs: list[Json], params: PageOptions) -> list[Json]:
-        objs = sorted(
-            objs,
-            key=lambda x: (x.get(params.order_by) is None, x.get(params.order_by)),
-            reverse=not params.ascending,
-        )
+        # "id" is the tiebreaker, like in SQLBuilder
+        keys = params.sort_keys()
+        objs = sorted(objs, key=cmp_to_key(partial(compare, keys=keys)))
+        if params.cursor is not None:
+            if params.cursor in self.data:
+                cursor_obj = self.data[params.cursor]
+            elif len(keys) == 1:
+                cursor_obj = {"id": params.cursor}
+            else:
+                raise BadRequest(
+                    f"record with id={params.cursor} does not exist", loc=("cursor",)
+                )
+            objs = [x for x in objs if compare(x, cursor_obj, keys) > 0]
         return objs[params.offset : params.offset + params.limit]
 
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
-        result = []
-        for x in self.data.values():
-            for filter in filters:
-                if x.get(filter.field) not in filter.values:
-                    break
-            else:
-                result.append(deepcopy(x))
+        result = [
+            deepcopy(x)
+            for x in self.data.values()
+            if all(matches(x, filter) for filter in filters)
+        ]
         if params is not None:
             result = self._paginate(result, params)
-        return result
+        return project(result, fields)
 
     def add(self, item: Json) -> Json:
         item = item.copy()
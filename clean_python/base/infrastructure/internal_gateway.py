@@ -15,6 +15,7 @@ from clean_python.base.domain import Json
 from clean_python.base.domain import PageOptions
 from clean_python.base.domain import RootEntity
 from clean_python.base.domain import SyncGateway
+from clean_python.base.domain.gateway import project
 
 from .mapper import Mapper
 
@@ -33,10 +34,14 @@ class InternalGateway(Gateway, Generic[T]):
         raise NotImplementedError()
 
     async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
         page = await self.manage.filter(filters, params)
-        return [self.mapper.to_internal(x) for x in page.items]
+        # the mapper needs complete entities, so the fields are selected afterwards
+        return project([self.mapper.to_internal(x) for x in page.items], fields)
 
     async def add(self, item: Json) -> Json:
         try:
@@ -78,10 +83,14 @@ class SyncInternalGateway(SyncGateway, Generic[T]):
         raise NotImplementedError()
 
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
         page = self.manage.filter(filters, params)
-        return [self.mapper.to_internal(x) for x in page.items]
+        # the mapper needs complete entities, so the fields are selected afterwards
+        return project([self.mapper.to_internal(x) for x in page.items], fields)
 
     def add(self, item: Json) -> Json:
         try:
@@ -60,11 +60,16 @@ class LRUCache(Gateway):
         return await self.gateway.add(item)
 
     async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
         # filter bypasses the cache
         # TODO: in the special case of a filter for id, we could cache it
-        return await self.gateway.filter(filters, params)
+        if fields is None:
+            return await self.gateway.filter(filters, params)
+        return await self.gateway.filter(filters, params, fields=fields)
 
 
 # This is a copy-paste of LRUCache, but with all the async / await removed:
@@ -116,8 +121,13 @@ class SyncLRUCache(SyncGateway):
         return self.gateway.add(item)
 
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
         # filter bypasses the cache
         # TODO: in the special case of a filter for id, we could cache it
-        return self.gateway.filter(filters, params)
+        if fields is None:
+            return self.gateway.filter(filters, params)
+        return self.gateway.filter(filters, params, fields=fields)
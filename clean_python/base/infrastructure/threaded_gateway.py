@@ -0,0 +1,173 @@
+# (c) Nelen & Schuurmans
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+from typing import Any
+from typing import TypeVar
+
+from ..domain import ctx
+from ..domain import DeadlineExceeded
+from ..domain import Filter
+from ..domain import Gateway
+from ..domain import Id
+from ..domain import Json
+from ..domain import Metric
+from ..domain import PageOptions
+from ..domain import Rows
+from ..domain import SyncGateway
+
+__all__ = ["ThreadedGateway"]
+
+
+T = TypeVar("T")
+
+
+class ThreadedGateway(Gateway):
+    """Exposes a SyncGateway as a Gateway, running it on a dedicated thread pool.
+
+    This allows migrating a service from the sync stack to the async stack one
+    gateway at a time. Size `max_workers` to the connection pool of the underlying
+    database: a thread holds a connection while it runs a call.
+
+    Calls never queue up in the thread pool. If all threads are busy, callers wait
+    (without blocking the event loop) until one is free, or until the deadline
+    (`ctx.deadline`) passes. The context (tenant, correlation id, deadline) is copied
+    to the thread.
+    """
+
+    def __init__(
+        self,
+        gateway: SyncGateway,
+        max_workers: int,
+        thread_name_prefix: str | None = None,
+    ):
+        self.gateway = gateway
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers,
+            thread_name_prefix=thread_name_prefix or type(gateway).__name__,
+        )
+        self._semaphore = asyncio.Semaphore(max_workers)
+        # the number of calls that are waiting for a thread
+        self.waiters = 0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a function on the thread pool, for instance a provider call"""
+        self.waiters += 1
+        try:
+            await self._acquire()
+        finally:
+            self.waiters -= 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(copy_context().run, func, *args, **kwargs)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # release when the thread is done (also if the caller was cancelled)
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._semaphore.release)
+        )
+        return await asyncio.wrap_future(future)
+
+    async def _acquire(self) -> None:
+        # asyncio.wait_for may acquire the permit just as the timeout fires, which
+        # leaks it; with a separate task the permit can be given back in that case
+        task = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait([task], timeout=ctx.time_remaining())
+        except BaseException:
+            self._abandon(task)
+            raise
+        if not done:
+            self._abandon(task)
+            raise DeadlineExceeded()
+
+    def _abandon(self, task: "asyncio.Future[Any]") -> None:
+        def release_if_acquired(task: "asyncio.Future[Any]") -> None:
+            if not task.cancelled() and task.exception() is None:
+                self._semaphore.release()
+
+        task.add_done_callback(release_if_acquired)
+        task.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
+
+    async def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> list[Json]:
+        # only pass fields if given, for gateways that don't support it
+        if fields is None:
+            return await self.run(self.gateway.filter, filters, params)
+        return await self.run(self.gateway.filter, filters, params, fields=fields)
+
+    async def filter_rows(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Rows:
+        if fields is None:
+            return await self.run(self.gateway.filter_rows, filters, params)
+        return await self.run(self.gateway.filter_rows, filters, params, fields=fields)
+
+    async def filter_with_total(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> tuple[list[Json], int]:
+        if fields is None:
+            return await self.run(self.gateway.filter_with_total, filters, params)
+        return await self.run(
+            self.gateway.filter_with_total, filters, params, fields=fields
+        )
+
+    async def count(self, filters: list[Filter]) -> int:
+        return await self.run(self.gateway.count, filters)
+
+    async def exists(self, filters: list[Filter]) -> bool:
+        return await self.run(self.gateway.exists, filters)
+
+    async def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        return await self.run(self.gateway.aggregate, filters, group_by, metrics)
+
+    async def get(self, id: Id) -> Json | None:
+        return await self.run(self.gateway.get, id)
+
+    async def add(self, item: Json) -> Json:
+        return await self.run(self.gateway.add, item)
+
+    async def add_many(self, items: list[Json]) -> list[Json]:
+        return await self.run(self.gateway.add_many, items)
+
+    async def update(
+        self, item: Json, if_unmodified_since: datetime | None = None
+    ) -> Json:
+        return await self.run(self.gateway.update, item, if_unmodified_since)
+
+    async def update_transactional(self, id: Id, func: Callable[[Json], Json]) -> Json:
+        return await self.run(self.gateway.update_transactional, id, func)
+
+    async def upsert(self, item: Json) -> Json:
+        return await self.run(self.gateway.upsert, item)
+
+    async def upsert_many(self, items: list[Json]) -> list[Json]:
+        return await self.run(self.gateway.upsert_many, items)
+
+    async def remove(self, id: Id) -> bool:
+        return await self.run(self.gateway.remove, id)
+
+    async def remove_filtered(self, filters: list[Filter]) -> int:
+        return await self.run(self.gateway.remove_filtered, filters)
+
+    async def update_filtered(self, filters: list[Filter], values: Json) -> int:
+        return await self.run(self.gateway.update_filtered, filters, values)
@@ -9,6 +9,7 @@ from starlette import status
 
 from clean_python import BadRequest
 from clean_python import Conflict
+from clean_python import DeadlineExceeded
 from clean_python import DoesNotExist
 from clean_python import PermissionDenied
 from clean_python import Unauthorized
@@ -24,6 +25,7 @@ __all__ = [
     "validation_error_handler",
     "permission_denied_handler",
     "unauthorized_handler",
+    "deadline_exceeded_handler",
 ]
 
 
@@ -91,3 +93,12 @@ async def permission_denied_handler(
             "detail": jsonable_encoder(exc.args[0] if exc.args else None),
         },
     )
+
+
+async def deadline_exceeded_handler(
+    request: Request, exc: DeadlineExceeded
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"message": "Deadline exceeded", "detail": str(exc)},
+    )
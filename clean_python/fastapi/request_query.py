@@ -7,12 +7,20 @@ from warnings import warn
 
 from fastapi import Depends
 from fastapi import Query
+from pydantic import field_validator
 from pydantic import ValidationError
 
 from clean_python import BadRequest
+from clean_python import BetweenFilter
 from clean_python import ComparisonFilter
+from clean_python import ContainsFilter
 from clean_python import Filter
+from clean_python import ILikeFilter
+from clean_python import IsNullFilter
+from clean_python import NotFilter
 from clean_python import PageOptions
+from clean_python import PrefixFilter
+from clean_python import SortKey
 from clean_python import ValueObject
 
 __all__ = ["RequestQuery"]
@@ -21,21 +29,50 @@ __all__ = ["RequestQuery"]
 class RequestQuery(ValueObject):
     """This class standardizes filtering and pagination for list endpoints.
 
+    Filters are derived from the other fields. A field name may end with an operator
+    after a double underscore, for instance:
+
+    - `x__gt`, `x__ge`, `x__lt`, `x__le`, `x__eq`, `x__ne`: comparisons
+    - `x__not`: x is not one of the values
+    - `x__isnull`: x is null (true) or not null (false)
+    - `x__between`: x is between the two values (inclusive)
+    - `x__prefix`: x starts with the value
+    - `x__ilike`: x matches the pattern case-insensitively ("%" is a wildcard)
+    - `x__contains`: x (an array) contains all values
+
+    The allowed values of `order_by` are set in subclasses with a Literal type. To
+    sort by multiple comma-separated fields, like "-created_at,name", set
+    `ORDER_BY_FIELDS` to the fields that may be used instead and annotate `order_by`
+    as `str`. Each field may be prefixed with "-" for a descending order.
+
     Example usage in a Resource:
 
         @get("/books")
         def list_books(self, q: Annotated[RequestQuery, Query()]):
-            return self.manage.filter(q.filters(), q.as_page_options())
+            return self.manage.filter(
+                q.filters(), q.as_page_options(), fields=q.fields
+            )
     """
 
     SEPARATOR: ClassVar[str] = "__"
-    NON_FILTERS: ClassVar[frozenset[str]] = frozenset({"limit", "offset", "order_by"})
+    NON_FILTERS: ClassVar[frozenset[str]] = frozenset(
+        {"limit", "offset", "order_by", "cursor", "fields"}
+    )
+    ORDER_BY_FIELDS: ClassVar[frozenset[str] | None] = None
 
     limit: int = Query(50, ge=1, le=100, description="Page size limit")
     offset: int = Query(0, ge=0, description="Page offset")
     order_by: Literal["id", "-id"] = Query(
         default="id", description="Field to order by"
     )
+    cursor: int | None = Query(
+        default=None,
+        description="Id of the last item of the previous page (use instead of offset)",
+    )
+    fields: list[str] | None = Query(
+        default=None,
+        description="Fields to include in the items (default: all)",
+    )
 
     def __init_subclass__(cls: type["RequestQuery"]) -> None:
         if hasattr(cls, "order_by") and "enum" in cls.order_by.json_schema_extra:  # type: ignore
@@ -45,15 +82,32 @@ class RequestQuery(ValueObject):
             )
         super().__init_subclass__()
 
+    @field_validator("order_by")
+    @classmethod
+    def validate_order_by(cls, value: str) -> str:
+        if cls.ORDER_BY_FIELDS is None:
+            return value
+        for key in value.split(","):
+            field = key.strip().removeprefix("-")
+            if field not in cls.ORDER_BY_FIELDS:
+                raise ValueError(f"Can't order by '{field}'")
+        return value
+
+    @staticmethod
+    def _sort_key(value: str) -> SortKey:
+        if value.startswith("-"):
+            return SortKey(field=value[1:], ascending=False)
+        return SortKey(field=value, ascending=True)
+
     def as_page_options(self) -> PageOptions:
-        if self.order_by.startswith("-"):
-            order_by = self.order_by[1:]
-            ascending = False
-        else:
-            order_by = self.order_by
-            ascending = True
+        sort = [self._sort_key(x.strip()) for x in self.order_by.split(",")]
         return PageOptions(
-            limit=self.limit, offset=self.offset, order_by=order_by, ascending=ascending
+            limit=self.limit,
+            offset=self.offset,
+            order_by=sort[0].field,
+            ascending=sort[0].ascending,
+            cursor=self.cursor,
+            sort=sort if len(sort) > 1 else [],
         )
 
     def _regular_filter(self, name, value) -> Filter:
@@ -62,8 +116,29 @@ class RequestQuery(ValueObject):
             value = [value]
         return Filter(field=name, values=value)
 
-    def _comparison_filter(self, name, value) -> ComparisonFilter:
+    def _comparison_filter(self, name, value) -> Filter:
         field, operator = name.rsplit(self.SEPARATOR, 1)
+        try:
+            return self._operator_filter(field, operator, value)
+        except ValidationError as e:
+            raise BadRequest(e, loc=(field,))
+
+    def _operator_filter(self, field, operator, value) -> Filter:
+        if operator == "not":
+            return NotFilter(filters=[self._regular_filter(field, value)])
+        elif operator == "isnull":
+            is_null = IsNullFilter(field=field)
+            return is_null if value else NotFilter(filters=[is_null])
+        elif operator == "between":
+            return BetweenFilter(field=field, values=value)
+        elif operator == "prefix":
+            return PrefixFilter(field=field, values=[value])
+        elif operator == "ilike":
+            return ILikeFilter(field=field, values=[value])
+        elif operator == "contains":
+            return ContainsFilter(
+                field=field, values=value if isinstance(value, list) else [value]
+            )
         return ComparisonFilter(
             field=field,
             values=[value],
@@ -1,14 +1,20 @@
 # (c) Nelen & Schuurmans
 
+import math
+import time
+from collections.abc import Awaitable
 from collections.abc import Callable
 from collections.abc import Sequence
 from enum import Enum
 from functools import partial
 from typing import Any
 
+from fastapi import Depends
+from fastapi import Request
 from fastapi import Security
 from fastapi.routing import APIRouter
 
+from clean_python import ctx
 from clean_python import ValueObject
 
 from .security import OAuth2Schema
@@ -24,6 +30,7 @@ __all__ = [
     "Stability",
     "v",
     "clean_resources",
+    "set_deadline",
 ]
 
 
@@ -70,6 +77,27 @@ class APIVersion(ValueObject):
         return APIVersion(version=self.version, stability=self.stability.decrease())
 
 
+def get_request_timeout(request: Request) -> float | None:
+    value = request.headers.get("x-request-timeout")
+    if value is None:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    return timeout if timeout > 0 and math.isfinite(timeout) else None
+
+
+def set_deadline(timeout: float | None) -> Callable[[Request], Awaitable[None]]:
+    """Dependency that sets ctx.deadline, a shorter timeout header takes precedence"""
+
+    async def dependency(request: Request) -> None:
+        timeouts = [x for x in (timeout, get_request_timeout(request)) if x]
+        ctx.deadline = time.monotonic() + min(timeouts) if timeouts else None
+
+    return dependency
+
+
 def http_method(
     path: str,
     scope: str | list[str] | None = None,
@@ -188,6 +216,10 @@ class Resource:
             # Copy both 'route_options' and 'dependencies' to allow inplace changes
             route_options = route_options.copy()
             dependencies = route_options.pop("dependencies", []).copy()
+            timeout = route_options.pop("timeout", None)
+            if timeout is not None:
+                # overrides the default of the Service
+                dependencies.append(Depends(set_deadline(timeout)))
             if not public and auth_scheme is not None:
                 dependencies.append(Security(auth_scheme, scopes=scope))
 
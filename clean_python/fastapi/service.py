@@ -17,12 +17,14 @@ from starlette.types import StatelessLifespan
 from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import ctx
+from clean_python import DeadlineExceeded
 from clean_python import DoesNotExist
 from clean_python import Gateway
 from clean_python import PermissionDenied
 from clean_python import Unauthorized
 
 from .error_responses import conflict_handler
+from .error_responses import deadline_exceeded_handler
 from .error_responses import DefaultErrorResponse
 from .error_responses import not_found_handler
 from .error_responses import permission_denied_handler
@@ -34,6 +36,7 @@ from .fastapi_access_logger import get_correlation_id
 from .resource import APIVersion
 from .resource import clean_resources
 from .resource import Resource
+from .resource import set_deadline
 from .schema import add_cached_openapi_yaml
 from .security import AuthSettings
 from .security import OAuth2Schema
@@ -155,6 +158,7 @@ class Service:
         app.add_exception_handler(BadRequest, validation_error_handler)
         app.add_exception_handler(PermissionDenied, permission_denied_handler)
         app.add_exception_handler(Unauthorized, unauthorized_handler)
+        app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
         add_cached_openapi_yaml(app)
         return app
 
@@ -167,7 +171,14 @@ class Service:
         on_startup: list[Callable[[], Any]] | None = None,
         on_shutdown: list[Callable[[], Any]] | None = None,
         access_logger_gateway: Gateway | None = None,
+        request_timeout: float | None = None,
     ) -> ASGIApp:
+        """Create the FastAPI app.
+
+        With `request_timeout` (in seconds) set, database queries are cancelled when
+        the request takes longer. Clients can shorten it with the 'X-Request-Timeout'
+        header and routes can override it with `timeout=...`.
+        """
         auth_scheme = set_auth_scheme(auth)
         app = self._create_root_app(
             title=title,
@@ -180,7 +191,10 @@ class Service:
         fastapi_kwargs = {
             "title": title,
             "description": description,
-            "dependencies": [Depends(set_request_context)],
+            "dependencies": [
+                Depends(set_request_context),
+                Depends(set_deadline(request_timeout)),
+            ],
             "swagger_ui_init_oauth": get_swagger_ui_init_oauth(auth),
         }
         versioned_apps = {
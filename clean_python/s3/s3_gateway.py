@@ -14,6 +14,7 @@ from clean_python import Gateway
 from clean_python import Id
 from clean_python import Json
 from clean_python import PageOptions
+from clean_python.base.domain.gateway import project
 
 from .s3_provider import S3BucketProvider
 from .types import CompletedPart
@@ -21,9 +22,10 @@ from .types import CompletedPart
 DEFAULT_EXPIRY = 3600  # in seconds
 DEFAULT_TIMEOUT = 1.0
 AWS_LIMIT = 1000  # max s3 keys per request
+DEFAULT_PART_SIZE = 8 * 1024 * 1024  # S3 requires at least 5 MiB (except the last)
 
 
-__all__ = ["S3Gateway"]
+__all__ = ["S3Gateway", "S3MultipartWriter"]
 
 logger = logging.getLogger(__name__)
 
@@ -85,6 +87,7 @@ class S3Gateway(Gateway):
         self,
         filters: list[Filter],
         params: PageOptions | None = PageOptions(limit=AWS_LIMIT),
+        fields: list[str] | None = None,
     ) -> list[Json]:
         assert params is not None, "pagination is required for S3Gateway"
         assert params.limit <= AWS_LIMIT, f"max {AWS_LIMIT} keys for S3Gateway"
@@ -107,7 +110,7 @@ class S3Gateway(Gateway):
         #         'STANDARD',
         #         'Owner': {...}
         #     }
-        return [
+        records = [
             {
                 "id": self._key_to_id(x["Key"]),
                 "last_modified": x["LastModified"],
@@ -116,6 +119,7 @@ class S3Gateway(Gateway):
             }
             for x in result.get("Contents", [])
         ]
+        return project(records, fields)
 
     async def remove(self, id: Id) -> bool:
         await self.provider.client.delete_object(
@@ -194,6 +198,30 @@ class S3Gateway(Gateway):
             },
         )
 
+    async def upload_part(
+        self, id: Id, upload_id: str, part_number: int, data: bytes
+    ) -> CompletedPart:
+        """Upload a part of a multipart upload."""
+        result = await self.provider.client.upload_part(
+            Bucket=self.provider.bucket,
+            Key=self._id_to_key(id),
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"etag": result["ETag"], "part_number": part_number}
+
+    def multipart_writer(
+        self, id: Id, part_size: int = DEFAULT_PART_SIZE
+    ) -> "S3MultipartWriter":
+        """Write an object in parts, without having it completely in memory.
+
+        Example:
+            >>> async with gateway.multipart_writer("export.csv") as writer:
+                    await writer.write(b"...")
+        """
+        return S3MultipartWriter(self, id, part_size)
+
     async def rollback_multipart_upload(self, id: Id, upload_id: str) -> None:
         """Cancel a multipart upload and delete any parts."""
         await self.provider.client.abort_multipart_upload(
@@ -237,23 +265,69 @@ class S3Gateway(Gateway):
         else:
             raise NotImplementedError(f"Unsupported filter '{filter.field}'")
 
-    async def remove_filtered(self, filters: list[Filter]) -> None:
+    async def remove_filtered(self, filters: list[Filter]) -> int:
         kwargs = {
             "Bucket": self.provider.bucket,
             "MaxKeys": AWS_LIMIT,
             "Prefix": self.filters_to_prefix(filters),
         }
+        count = 0
         while True:
             result = await self.provider.client.list_objects_v2(**kwargs)
             contents = result.get("Contents", [])
             if contents:
-                await self.provider.client.delete_objects(
+                response = await self.provider.client.delete_objects(
                     Bucket=self.provider.bucket,
                     Delete={
                         "Objects": [{"Key": x["Key"]} for x in contents],
                         "Quiet": True,
                     },
                 )
+                # in quiet mode, only the objects that were not deleted are listed
+                count += len(contents) - len(response.get("Errors", []))
             if len(contents) < AWS_LIMIT:
                 break
             kwargs["StartAfter"] = contents[-1]["Key"]
+        return count
+
+
+class S3MultipartWriter:
+    """Writes an object with a multipart upload, see S3Gateway.multipart_writer.
+
+    The written data is buffered and uploaded in parts of at least `part_size` bytes.
+    The upload is committed when leaving the context, and rolled back on an error.
+    """
+
+    def __init__(self, gateway: S3Gateway, id: Id, part_size: int = DEFAULT_PART_SIZE):
+        self.gateway = gateway
+        self.id = id
+        self.part_size = part_size
+        self.upload_id: str | None = None
+        self.parts: list[CompletedPart] = []
+        self._buffer = bytearray()
+
+    async def __aenter__(self) -> "S3MultipartWriter":
+        self.upload_id = await self.gateway.begin_multipart_upload(self.id)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        assert self.upload_id is not None
+        if exc_type is not None:
+            await self.gateway.rollback_multipart_upload(self.id, self.upload_id)
+            return
+        if self._buffer or not self.parts:
+            await self._upload_part()
+        await self.gateway.commit_multipart_upload(self.id, self.upload_id, self.parts)
+
+    async def write(self, data: bytes) -> None:
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.part_size:
+            await self._upload_part()
+
+    async def _upload_part(self) -> None:
+        assert self.upload_id is not None
+        part = await self.gateway.upload_part(
+            self.id, self.upload_id, len(self.parts) + 1, bytes(self._buffer)
+        )
+        self.parts.append(part)
+        self._buffer.clear()
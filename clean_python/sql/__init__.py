@@ -1,4 +1,6 @@
 from .asyncpg_sql_database import *  # NOQA
+from .query_instrumentation import *  # NOQA
+from .routing_sql_database import *  # NOQA
 from .sql_builder import *  # NOQA
 from .sql_gateway import *  # NOQA
 from .sql_provider import *  # NOQA
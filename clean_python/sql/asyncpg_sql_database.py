@@ -1,8 +1,17 @@
+import asyncio
 import json
 import re
+import time
+from collections import OrderedDict
 from collections.abc import AsyncIterator
+from collections.abc import Callable
+from collections.abc import Hashable
+from collections.abc import Sequence
+from contextlib import AbstractAsyncContextManager
 from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any
+from typing import NamedTuple
 
 try:
     import asyncpg
@@ -13,18 +22,42 @@ except ImportError:
     asyncpg = None
     UniqueViolationError = SerializationError = Exception
     Connection = object
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 from async_lru import alru_cache
+from pydantic import model_validator
 from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+from sqlalchemy.sql import ClauseElement
 from sqlalchemy.sql import Executable
+from sqlalchemy.sql.compiler import SQLCompiler
 
 from clean_python import AlreadyExists
 from clean_python import Conflict
+from clean_python import ctx
+from clean_python import DeadlineExceeded
 from clean_python import Json
+from clean_python import Rows
+from clean_python import ValueObject
 
+from .query_instrumentation import Histogram
+from .query_instrumentation import QueryInstrumentation
+from .sql_builder import Explain
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
+from .sql_provider import CopyOutput
 from .sql_provider import SQLDatabase
 from .sql_provider import SQLProvider
 
-__all__ = ["AsyncpgSQLDatabase"]
+__all__ = [
+    "AsyncpgSQLDatabase",
+    "StatementCache",
+    "PoolConfig",
+    "PoolStats",
+    "JsonCodec",
+    "OrjsonCodec",
+]
 
 
 UNIQUE_VIOLATION_DETAIL_REGEX = re.compile(
@@ -48,108 +81,573 @@ def compile(
 ) -> tuple[Any, ...]:
     # Rendering SQLAlchemy expressions to SQL, see:
     # - https://docs.sqlalchemy.org/en/20/faq/sqlexpressions.html
-    # Note that this circumvents the SQLAlchemy caching system and almost certainly
-    # will deteriorate performance when using complex query (compared to the
-    # standard sqlalchemy .execute)
+    # Note that this circumvents the SQLAlchemy caching system; use StatementCache
+    # to avoid rendering the same query shape over and over.
+    assert isinstance(query, ClauseElement)
     compiled = query.compile(
         dialect=DIALECT, compile_kwargs={"render_postcompile": True}
     )
+    assert isinstance(compiled, SQLCompiler)
     params = (
         compiled.params if bind_params is None else {**compiled.params, **bind_params}
     )
     # add params in positional order
-    return (str(compiled),) + tuple(params[k] for k in compiled.positiontup)
+    return (str(compiled),) + tuple(params[k] for k in compiled.positiontup or ())
 
 
-async def init_db_types(conn: Connection):
-    await conn.set_type_codec(
-        "json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+def records_to_rows(records: list[Any]) -> Rows:
+    # asyncpg Records are sequences; all records of a result have the same keys
+    return Rows(tuple(records[0].keys()) if records else (), records)
+
+
+async def fetch(connection: Connection, args: tuple[Any, ...]) -> Rows:
+    # On a timeout (ctx.deadline) or when the awaiting task is cancelled, asyncpg
+    # cancels the query in the database backend.
+    try:
+        result = await connection.fetch(*args, timeout=ctx.time_remaining())
+    except UniqueViolationError as e:
+        raise convert_unique_violation_error(e)
+    except SerializationError:
+        raise Conflict("could not execute query due to concurrent update")
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+    return records_to_rows(result)
+
+
+async def copy_from_query(
+    connection: Connection,
+    args: tuple[Any, ...],
+    output: CopyOutput,
+    format: CopyFormat,
+) -> None:
+    try:
+        await connection.copy_from_query(
+            *args,
+            output=output,
+            format=format,
+            header=True if format == "csv" else None,
+            timeout=ctx.time_remaining(),
+        )
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+
+async def copy_to_table(
+    connection: Connection,
+    table: str,
+    columns: Sequence[str],
+    source: CopyInput,
+    format: CopyFormat,
+) -> None:
+    schema_name, _, table_name = table.rpartition(".")
+    kwargs = {
+        "columns": list(columns),
+        "schema_name": schema_name or None,
+        "timeout": ctx.time_remaining(),
+    }
+    try:
+        if hasattr(source, "read"):
+            await connection.copy_to_table(
+                table_name,
+                source=source,
+                format=format,
+                header=True if format == "csv" else None,
+                **kwargs,
+            )
+        else:
+            # records are sent in the binary format, using the column types
+            await connection.copy_records_to_table(table_name, records=source, **kwargs)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+
+async def instrumented_fetch(
+    connection: Connection,
+    args: tuple[Any, ...],
+    query: Executable,
+    bind_params: dict[str, Any] | None,
+    instrumentation: QueryInstrumentation | None,
+    acquire: Callable[[], AbstractAsyncContextManager[Connection]] | None = None,
+) -> Rows:
+    """Fetch and record the query in `instrumentation`
+
+    A sampled slow query is explained on a separate connection from `acquire`.
+    """
+    if instrumentation is None:
+        return await fetch(connection, args)
+    start = time.monotonic()
+    rows = await fetch(connection, args)
+    duration = time.monotonic() - start
+
+    async def explain() -> list[Json]:
+        assert acquire is not None
+        analyzed = compile(Explain(query, analyze=True), bind_params)
+        async with acquire() as other:
+            return (await fetch(other, analyzed)).to_dicts()
+
+    await instrumentation.observe(
+        query, args[0], duration, len(rows.values), None if acquire is None else explain
     )
+    return rows
+
+
+class _Param(NamedTuple):
+    position: int  # position in CacheKey.bindparams
+    # position in the list of an expanding (IN) parameter, and in the tuple
+    # for a tuple IN-list
+    element: tuple[int, ...]
+
+
+def _get_element(value: Any, element: tuple[int, ...]) -> Any:
+    for i in element:
+        value = value[i]
+    return value
+
+
+class _CachedStatement(NamedTuple):
+    sql: str
+    params: tuple[_Param, ...]
+
+
+class StatementCache:
+    """An LRU cache that maps the structure of a query to its rendered SQL.
+
+    Queries generated by the SQLBuilder repeat the same few shapes (select by id,
+    filter by foreign key, count, exists) with different bound values. The cache key
+    is derived from SQLAlchemy's own structural cache key, extended with the number of
+    values in each IN-list (these are rendered inline by `render_postcompile`). On a
+    hit, only the bound values are extracted from the query.
+
+    Queries that SQLAlchemy cannot cache and queries with explicit `bind_params`
+    are compiled without using the cache.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[Hashable, _CachedStatement] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def cache_clear(self) -> None:
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def compile(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> tuple[Any, ...]:
+        if self.max_size <= 0 or bind_params is not None:
+            return compile(query, bind_params)
+        cache_key = query._generate_cache_key()  # type: ignore
+        if cache_key is None:
+            return compile(query, bind_params)
+        values = [x.effective_value for x in cache_key.bindparams]
+        key = (
+            cache_key.key,
+            tuple(
+                len(v) for (x, v) in zip(cache_key.bindparams, values) if x.expanding
+            ),
+        )
+        statement = self._cache.get(key)
+        if statement is None:
+            self.misses += 1
+            statement = self._cache[key] = self._compile(query, cache_key.bindparams)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        return (statement.sql,) + tuple(
+            _get_element(values[p.position], p.element) for p in statement.params
+        )
+
+    @staticmethod
+    def _compile(query: Executable, bindparams: list[Any]) -> _CachedStatement:
+        assert isinstance(query, ClauseElement)
+        compiled = query.compile(
+            dialect=DIALECT, compile_kwargs={"render_postcompile": True}
+        )
+        assert isinstance(compiled, SQLCompiler)
+        index_lut = {x.key: i for (i, x) in enumerate(bindparams)}
+        # render_postcompile expands IN-list parameter 'x' into 'x_1', 'x_2', ...
+        # and a tuple IN-list into 'x_1_1', 'x_1_2', 'x_2_1', ...
+        names: dict[str, tuple[str, tuple[int, ...]]] = {}
+        for name, bind in compiled.binds.items():
+            names[name] = (name, ())
+            if bind.expanding:
+                for i, value in enumerate(bind.effective_value or ()):
+                    names[f"{name}_{i + 1}"] = (name, (i,))
+                    if isinstance(value, tuple):
+                        for j in range(len(value)):
+                            names[f"{name}_{i + 1}_{j + 1}"] = (name, (i, j))
+        params = []
+        for name in compiled.positiontup or ():
+            bind_name, element = names[name]
+            params.append(_Param(index_lut[compiled.binds[bind_name].key], element))
+        return _CachedStatement(str(compiled), tuple(params))
+
+
+class JsonCodec:
+    """Encodes and decodes json and jsonb values, using the standard library"""
+
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value)
+
+    def dumps_bytes(self, value: Any) -> bytes:
+        return self.dumps(value).encode()
+
+    def loads(self, value: str | bytes) -> Any:
+        return json.loads(value)
+
+
+class OrjsonCodec(JsonCodec):
+    """Encodes and decodes json and jsonb values using orjson (much faster)"""
+
+    def __init__(self):
+        assert orjson is not None
+        self.option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, value: Any) -> str:
+        return orjson.dumps(value, option=self.option).decode()
+
+    def dumps_bytes(self, value: Any) -> bytes:
+        return orjson.dumps(value, option=self.option)
+
+    def loads(self, value: str | bytes) -> Any:
+        return orjson.loads(value)
+
+
+def get_default_json_codec() -> JsonCodec:
+    return JsonCodec() if orjson is None else OrjsonCodec()
+
+
+# the binary format of jsonb is its text representation, prefixed by a version byte
+JSONB_VERSION = b"\x01"
+
+
+async def init_db_types(
+    conn: Connection, codec: JsonCodec | None = None, raw_jsonb: bool = False
+):
+    codec = codec or JsonCodec()
     await conn.set_type_codec(
-        "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        "json", encoder=codec.dumps, decoder=codec.loads, schema="pg_catalog"
     )
+    if raw_jsonb:
+        # return jsonb as (undecoded) bytes, to pass them through as they are
+        def encode(value: Any) -> bytes:
+            if not isinstance(value, bytes):
+                value = codec.dumps_bytes(value)
+            return JSONB_VERSION + value
+
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=encode,
+            decoder=lambda x: x[1:],
+            schema="pg_catalog",
+            format="binary",
+        )
+    else:
+        await conn.set_type_codec(
+            "jsonb", encoder=codec.dumps, decoder=codec.loads, schema="pg_catalog"
+        )
+
+
+class PoolConfig(ValueObject):
+    """Configuration of the connection pool of an AsyncpgSQLDatabase.
+
+    Timeouts are in seconds. With `warmup=True`, `min_size` connections are opened
+    at connect() instead of at the first query. The application must call connect()
+    at startup for that, for instance with `create_app(on_startup=[db.connect])`.
+    """
+
+    min_size: int = 1
+    max_size: int = 1
+    max_inactive_connection_lifetime: float = 300.0
+    acquire_timeout: float | None = None
+    statement_timeout: float | None = None
+    warmup: bool = True
+
+    @model_validator(mode="after")
+    def verify_sizes_and_timeouts(self):
+        if self.min_size < 0 or self.max_size < 1:
+            raise ValueError("PoolConfig needs min_size >= 0 and max_size >= 1")
+        if self.min_size > self.max_size:
+            raise ValueError("PoolConfig min_size can't be larger than max_size")
+        if self.max_inactive_connection_lifetime < 0:
+            raise ValueError("PoolConfig max_inactive_connection_lifetime is negative")
+        for name in ("acquire_timeout", "statement_timeout"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"PoolConfig {name} needs to be positive")
+        return self
+
+
+class PoolStats(ValueObject):
+    size: int
+    in_use: int
+    idle: int
+    min_size: int
+    max_size: int
+    waiters: int
+    # cumulative counts of acquire wait times, keyed by upper bound (seconds)
+    acquire_wait_buckets: dict[str, int]
+    acquire_wait_sum: float
+    acquire_wait_count: int
 
 
 class AsyncpgSQLDatabase(SQLDatabase):
     def __init__(
-        self, url: str, *, isolation_level: str = "repeatable_read", pool_size: int = 1
+        self,
+        url: str,
+        *,
+        isolation_level: str = "repeatable_read",
+        pool_size: int | None = None,
+        pool_config: PoolConfig | None = None,
+        statement_cache_size: int = 512,
+        prepared_statement_cache_size: int = 100,
+        json_codec: JsonCodec | None = None,
+        raw_jsonb: bool = False,
+        instrumentation: QueryInstrumentation | None = None,
     ):
         assert asyncpg is not None
         self.url = url
-        self.pool_size = pool_size
+        if pool_config is not None and pool_size is not None:
+            raise ValueError("Pass either pool_size or pool_config, not both")
+        self.pool_config = pool_config or PoolConfig(
+            max_size=1 if pool_size is None else pool_size
+        )
+        # orjson is used if it is installed
+        self.json_codec = json_codec or get_default_json_codec()
+        self.raw_jsonb = raw_jsonb
         self.isolation_level = isolation_level
+        self.statement_cache = StatementCache(statement_cache_size)
+        self.prepared_statement_cache_size = prepared_statement_cache_size
+        self.acquire_wait = Histogram()
+        self.waiters = 0
+        self.instrumentation = instrumentation
+
+    @property
+    def pool_size(self) -> int:
+        return self.pool_config.max_size
 
     @alru_cache
     async def get_pool(self):
         # Note: disable JIT because it amakes the initial queries very slow
         # see https://github.com/MagicStack/asyncpg/issues/530
+        # Note: each pooled connection keeps its own cache of prepared statements,
+        # keyed on the SQL text. Use SQLGateway(array_params=True) to keep that text
+        # stable for IN-filters. Set the size to 0 when using pgbouncer.
+        config = self.pool_config
+        server_settings = {"jit": "off"}
+        if config.statement_timeout is not None:
+            server_settings["statement_timeout"] = str(
+                int(config.statement_timeout * 1000)
+            )
         return await asyncpg.create_pool(
             f"postgresql://{self.url}",
-            server_settings={"jit": "off"},
-            min_size=1,
-            max_size=self.pool_size,
-            init=init_db_types,
+            server_settings=server_settings,
+            min_size=config.min_size,
+            max_size=config.max_size,
+            max_inactive_connection_lifetime=config.max_inactive_connection_lifetime,
+            init=partial(
+                init_db_types, codec=self.json_codec, raw_jsonb=self.raw_jsonb
+            ),
+            statement_cache_size=self.prepared_statement_cache_size,
         )
 
+    async def connect(self) -> None:
+        """Open the pool (call this at application startup, see PoolConfig)"""
+        # creating the pool opens min_size connections
+        if self.pool_config.warmup:
+            await self.get_pool()
+
     async def dispose(self) -> None:
         pool = await self.get_pool()
         await pool.close()
 
+    async def pool_stats(self) -> PoolStats:
+        pool = await self.get_pool()
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        return PoolStats(
+            size=size,
+            in_use=size - idle,
+            idle=idle,
+            min_size=pool.get_min_size(),
+            max_size=pool.get_max_size(),
+            waiters=self.waiters,
+            acquire_wait_buckets=self.acquire_wait.to_dict(),
+            acquire_wait_sum=self.acquire_wait.sum,
+            acquire_wait_count=self.acquire_wait.count,
+        )
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Connection]:
+        pool = await self.get_pool()
+        self.waiters += 1
+        start = time.monotonic()
+        try:
+            connection = await pool.acquire(timeout=self.pool_config.acquire_timeout)
+        finally:
+            self.waiters -= 1
+        # only successful acquires are recorded; failures would skew the waits
+        wait = time.monotonic() - start
+        self.acquire_wait.observe(wait)
+        if self.instrumentation is not None:
+            self.instrumentation.observe_pool_wait(wait)
+        try:
+            yield connection
+        finally:
+            await pool.release(connection)
+
     async def execute(
         self, query: Executable, bind_params: dict[str, Any] | None = None
     ) -> list[Json]:
+        return (await self.execute_rows(query, bind_params)).to_dicts()
+
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
         # compile before acquiring the connection
-        args = compile(query, bind_params)
-        pool = await self.get_pool()
-        try:
-            result = await pool.fetch(*args)
-        except UniqueViolationError as e:
-            raise convert_unique_violation_error(e)
-        except SerializationError:
-            raise Conflict("could not execute query due to concurrent update")
-        return list(map(dict, result))
+        args = self.statement_cache.compile(query, bind_params)
+        connection: Connection
+        async with self.acquire() as connection:
+            return await instrumented_fetch(
+                connection, args, query, bind_params, self.instrumentation, self.acquire
+            )
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        # cursors can only be used within a transaction
+        async with self.transaction() as transaction:
+            async for rows in transaction.iter_execute(query, bind_params, batch_size):
+                yield rows
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        args = self.statement_cache.compile(query)
+        connection: Connection
+        async with self.acquire() as connection:
+            await copy_from_query(connection, args, output, format)
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        connection: Connection
+        async with self.acquire() as connection:
+            await copy_to_table(connection, table, columns, source, format)
 
     @asynccontextmanager
     async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
-        pool = await self.get_pool()
         connection: Connection
-        async with pool.acquire() as connection:
+        async with self.acquire() as connection:
             async with connection.transaction(isolation=self.isolation_level):
-                yield AsyncpgSQLTransaction(connection)
+                yield AsyncpgSQLTransaction(
+                    connection, self.statement_cache, self.instrumentation, self.acquire
+                )
 
     @asynccontextmanager
     async def testing_transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
-        pool = await self.get_pool()
         connection: Connection
-        async with pool.acquire() as connection:
+        async with self.acquire() as connection:
             transaction = connection.transaction()
             await transaction.start()
             try:
-                yield AsyncpgSQLTransaction(connection)
+                yield AsyncpgSQLTransaction(
+                    connection, self.statement_cache, self.instrumentation, self.acquire
+                )
             finally:
                 await transaction.rollback()
 
     async def execute_autocommit(self, query: Executable) -> None:
-        pool = await self.get_pool()
         connection: Connection
-        async with pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(*compile(query))
 
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        connection: Connection
+        async with self.acquire() as connection:
+            yield AsyncpgSQLTransaction(
+                connection, self.statement_cache, self.instrumentation, self.acquire
+            )
+
 
 class AsyncpgSQLTransaction(SQLProvider):
-    def __init__(self, connection: Connection):
+    def __init__(
+        self,
+        connection: Connection,
+        statement_cache: StatementCache | None = None,
+        instrumentation: QueryInstrumentation | None = None,
+        acquire: Callable[[], AbstractAsyncContextManager[Connection]] | None = None,
+    ):
         self.connection = connection
+        self.statement_cache = statement_cache or StatementCache(max_size=0)
+        self.instrumentation = instrumentation
+        # to explain slow queries on a separate connection
+        self.acquire = acquire
 
     async def execute(
         self, query: Executable, bind_params: dict[str, Any] | None = None
     ) -> list[Json]:
-        try:
-            result = await self.connection.fetch(*compile(query, bind_params))
-        except UniqueViolationError as e:
-            raise convert_unique_violation_error(e)
-        except SerializationError:
-            raise Conflict("could not execute query due to concurrent update")
-        return list(map(dict, result))
+        return (await self.execute_rows(query, bind_params)).to_dicts()
+
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        return await instrumented_fetch(
+            self.connection,
+            self.statement_cache.compile(query, bind_params),
+            query,
+            bind_params,
+            self.instrumentation,
+            self.acquire,
+        )
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        cursor = await self.connection.cursor(
+            *self.statement_cache.compile(query, bind_params)
+        )
+        while True:
+            try:
+                result = await cursor.fetch(batch_size, timeout=ctx.time_remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded()
+            if result:
+                yield records_to_rows(result).to_dicts()
+            if len(result) < batch_size:
+                break
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        args = self.statement_cache.compile(query)
+        await copy_from_query(self.connection, args, output, format)
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        await copy_to_table(self.connection, table, columns, source, format)
 
     @asynccontextmanager
     async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
@@ -0,0 +1,253 @@
+# (c) Nelen & Schuurmans
+import asyncio
+import json
+import logging
+import random
+from collections import OrderedDict
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+from sqlalchemy.sql import Executable
+
+from clean_python import ctx
+from clean_python import Gateway
+from clean_python import Json
+from clean_python import SyncGateway
+from clean_python import ValueObject
+
+from .routing_sql_database import is_read_only
+
+__all__ = [
+    "Histogram",
+    "QueryInstrumentation",
+    "QueryStats",
+    "SyncQueryInstrumentation",
+]
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+
+class Histogram:
+    """Cumulative counts of observed values, keyed by upper bound"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    @property
+    def count(self) -> int:
+        return self.counts[-1]
+
+    def to_dict(self) -> dict[str, int]:
+        return {str(bound): count for (bound, count) in zip(self.buckets, self.counts)}
+
+
+class QueryStats(ValueObject):
+    query: str
+    count: int
+    rows: int
+    duration_sum: float
+    # cumulative counts of durations, keyed by upper bound (seconds)
+    duration_buckets: dict[str, int]
+
+
+class _QueryShape:
+    def __init__(self):
+        self.duration = Histogram()
+        self.rows = 0
+
+
+class _QueryRecorder:
+    def __init__(
+        self,
+        slow_query_threshold: float | None = None,
+        explain_sample_rate: float = 0.0,
+        max_shapes: int = 512,
+    ):
+        self.slow_query_threshold = slow_query_threshold
+        self.explain_sample_rate = explain_sample_rate
+        self.max_shapes = max_shapes
+        self.pool_wait = Histogram()
+        self._shapes: OrderedDict[str, _QueryShape] = OrderedDict()
+
+    def observe_pool_wait(self, duration: float) -> None:
+        self.pool_wait.observe(duration)
+
+    def _record(self, sql: str, duration: float, rows: int) -> bool:
+        """Record a query, returning whether it is slow"""
+        shape = self._shapes.get(sql)
+        if shape is None:
+            shape = self._shapes[sql] = _QueryShape()
+            if len(self._shapes) > self.max_shapes:
+                self._shapes.popitem(last=False)
+        else:
+            self._shapes.move_to_end(sql)
+        shape.duration.observe(duration)
+        shape.rows += rows
+        return (
+            self.slow_query_threshold is not None
+            and duration >= self.slow_query_threshold
+        )
+
+    def _should_explain(self, query: Executable, explain: Callable | None) -> bool:
+        # EXPLAIN ANALYZE executes the query, so only do that for plain SELECTs
+        return (
+            explain is not None
+            and random.random() < self.explain_sample_rate
+            and is_read_only(query)
+        )
+
+    def stats(self) -> list[QueryStats]:
+        return [
+            QueryStats(
+                query=sql,
+                count=shape.duration.count,
+                rows=shape.rows,
+                duration_sum=shape.duration.sum,
+                duration_buckets=shape.duration.to_dict(),
+            )
+            for (sql, shape) in self._shapes.items()
+        ]
+
+    def clear(self) -> None:
+        self._shapes.clear()
+        self.pool_wait = Histogram()
+
+
+def parse_plan(rows: list[Json]) -> Json:
+    """Parse the result of EXPLAIN (FORMAT JSON)"""
+    (plan,) = rows[0].values()
+    if isinstance(plan, str):  # in case the driver doesn't decode json
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def slow_query_item(sql: str, duration: float, rows: int, plan: Json | None) -> Json:
+    correlation_id = ctx.correlation_id
+    return {
+        "tag_suffix": "slow_query",
+        "query": sql,
+        "duration": duration,
+        "rows": rows,
+        "plan": plan,
+        "correlation_id": None if correlation_id is None else str(correlation_id),
+    }
+
+
+class QueryInstrumentation(_QueryRecorder):
+    """Records latency and rows returned per query shape, and the pool wait time.
+
+    The shape of a query is its SQL with placeholders for the bound values. Queries
+    that take `slow_query_threshold` seconds or longer are emitted to `gateway` (for
+    instance a FluentbitGateway). For a fraction `explain_sample_rate` of them, the
+    plan from EXPLAIN (ANALYZE, BUFFERS) is included. As this executes the query
+    again, only read-only queries are explained, in the background on a separate
+    connection, so that the slow query isn't delayed further.
+    """
+
+    def __init__(
+        self,
+        slow_query_threshold: float | None = None,
+        explain_sample_rate: float = 0.0,
+        gateway: Gateway | None = None,
+        max_shapes: int = 512,
+    ):
+        super().__init__(slow_query_threshold, explain_sample_rate, max_shapes)
+        self.gateway = gateway
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def observe(
+        self,
+        query: Executable,
+        sql: str,
+        duration: float,
+        rows: int,
+        explain: Callable[[], Awaitable[list[Json]]] | None,
+    ) -> None:
+        if not self._record(sql, duration, rows):
+            return
+        item = slow_query_item(sql, duration, rows, None)
+        if not self._should_explain(query, explain):
+            await self._emit(item)
+            return
+        task = asyncio.create_task(self._explain_and_emit(item, explain))  # type: ignore
+        # keep a reference, so that the task isn't garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain_and_emit(
+        self, item: Json, explain: Callable[[], Awaitable[list[Json]]]
+    ) -> None:
+        try:
+            item["plan"] = parse_plan(await explain())
+        except Exception:
+            # for instance a timeout: the query was already slow
+            logger.debug("Could not explain slow query", exc_info=True)
+        await self._emit(item)
+
+    async def _emit(self, item: Json) -> None:
+        if self.gateway is None:
+            return
+        try:
+            await self.gateway.add(item)
+        except Exception:
+            # the query itself succeeded: don't fail it because of the logging
+            logger.exception("Could not log slow query")
+
+    async def wait_for_explains(self) -> None:
+        """Wait until the EXPLAINs that run in the background are done"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+class SyncQueryInstrumentation(_QueryRecorder):
+    """Records latency and rows returned per query shape, and the pool wait time.
+
+    See QueryInstrumentation. The EXPLAIN runs inline (in a savepoint on the same
+    connection), before the result of the slow query is returned.
+    """
+
+    def __init__(
+        self,
+        slow_query_threshold: float | None = None,
+        explain_sample_rate: float = 0.0,
+        gateway: SyncGateway | None = None,
+        max_shapes: int = 512,
+    ):
+        super().__init__(slow_query_threshold, explain_sample_rate, max_shapes)
+        self.gateway = gateway
+
+    def observe(
+        self,
+        query: Executable,
+        sql: str,
+        duration: float,
+        rows: int,
+        explain: Callable[[], list[Json]],
+    ) -> None:
+        if not self._record(sql, duration, rows):
+            return
+        plan = None
+        if self._should_explain(query, explain):
+            try:
+                plan = parse_plan(explain())
+            except Exception:
+                # for instance a timeout: the query was already slow
+                logger.debug("Could not explain slow query", exc_info=True)
+        if self.gateway is None:
+            return
+        try:
+            self.gateway.add(slow_query_item(sql, duration, rows, plan))
+        except Exception:
+            # the query itself succeeded: don't fail it because of the logging
+            logger.exception("Could not log slow query")
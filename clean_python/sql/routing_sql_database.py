@@ -0,0 +1,295 @@
+# (c) Nelen & Schuurmans
+import itertools
+import math
+import time
+from collections.abc import AsyncIterator
+from collections.abc import Sequence
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import Literal
+
+from sqlalchemy import text
+from sqlalchemy.sql import Executable
+from sqlalchemy.sql import Select
+from sqlalchemy.sql import TextClause
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.visitors import iterate
+
+from clean_python import ctx
+from clean_python import Json
+from clean_python import Rows
+
+from .sql_provider import advisory_lock_query
+from .sql_provider import advisory_unlock_query
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
+from .sql_provider import CopyOutput
+from .sql_provider import SQLDatabase
+from .sql_provider import SQLProvider
+
+__all__ = ["RoutingSQLDatabase"]
+
+
+# Returns NULL on a primary, which is interpreted as no lag. Note that the lag also
+# increases if there are no writes on the primary.
+LAG_QUERY = text(
+    "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS lag"
+)
+
+
+def is_read_only(query: Executable) -> bool:
+    """Whether a query is a SELECT that does not lock or modify rows"""
+    if not isinstance(query, Select) or query._for_update_arg is not None:
+        return False
+    # for instance: a DELETE ... RETURNING in a CTE
+    return not any(isinstance(x, UpdateBase) for x in iterate(query))
+
+
+# advisory locks must be taken on the primary, but they are not a write
+ADVISORY_LOCK_TEXTS = frozenset(
+    query.text  # type: ignore
+    for query in [
+        *(
+            advisory_lock_query(0, wait, scope)
+            for wait in (True, False)
+            for scope in ("", "xact_")
+        ),
+        advisory_unlock_query(0),
+    ]
+)
+
+
+def is_advisory_lock(query: Executable) -> bool:
+    """Whether a query is one of the advisory (un)lock queries of SQLProvider"""
+    return isinstance(query, TextClause) and query.text in ADVISORY_LOCK_TEXTS
+
+
+class _Replica:
+    def __init__(self, provider: SQLDatabase):
+        self.provider = provider
+        self.busy = 0
+        self.lag = 0.0
+        self.checked_at: float | None = None
+
+
+class _WriteTrackingProvider(SQLProvider):
+    """Marks a write on the router once a write statement runs on `provider`"""
+
+    def __init__(self, provider: SQLProvider, router: "RoutingSQLDatabase"):
+        self.provider = provider
+        self.router = router
+
+    def _track(self, query: Executable) -> None:
+        if not is_read_only(query) and not is_advisory_lock(query):
+            self.router._mark_write()
+
+    async def execute(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> list[Json]:
+        self._track(query)
+        return await self.provider.execute(query, bind_params)
+
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        self._track(query)
+        return await self.provider.execute_rows(query, bind_params)
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        self._track(query)
+        async for rows in self.provider.iter_execute(query, bind_params, batch_size):
+            yield rows
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        self._track(query)
+        await self.provider.copy_to(query, output, format)
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        self.router._mark_write()
+        await self.provider.copy_from(table, columns, source, format)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        async with self.provider.transaction() as transaction:  # type: ignore
+            yield _WriteTrackingProvider(transaction, self.router)
+
+    @asynccontextmanager
+    async def testing_transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        async with self.provider.testing_transaction() as transaction:  # type: ignore
+            yield _WriteTrackingProvider(transaction, self.router)
+
+    async def advisory_xact_lock(self, key: int, wait: bool = True) -> bool:
+        # a lock is not a write
+        return await self.provider.advisory_xact_lock(key, wait)
+
+
+class RoutingSQLDatabase(SQLDatabase):
+    """Sends read-only queries to replicas and everything else to the primary.
+
+    Only `execute` and `iter_execute` of a SELECT (without FOR UPDATE) are sent to a
+    replica, chosen "round_robin" or "least_busy" (fewest running queries).
+    Transactions always use the primary.
+
+    Replicas that lag more than `max_replication_lag` seconds behind the primary are
+    skipped. The lag is queried at most once per `lag_check_interval` seconds.
+
+    After a write, `ctx.read_your_writes` is set so that the remainder of the request
+    (the current context) reads from the primary. It can also be set manually. Within
+    a transaction or session, only a statement that is not read-only counts as a
+    write. Advisory locks are taken on the primary, but they don't count as a write.
+    """
+
+    def __init__(
+        self,
+        primary: SQLDatabase,
+        replicas: Sequence[SQLDatabase],
+        *,
+        strategy: Literal["round_robin", "least_busy"] = "round_robin",
+        max_replication_lag: float | None = None,
+        lag_check_interval: float = 1.0,
+        sticky_after_write: bool = True,
+    ):
+        self.primary = primary
+        self.replicas = [_Replica(x) for x in replicas]
+        self.strategy = strategy
+        self.max_replication_lag = max_replication_lag
+        self.lag_check_interval = lag_check_interval
+        self.sticky_after_write = sticky_after_write
+        self._counter = itertools.count()
+
+    @property
+    def _providers(self) -> list[SQLDatabase]:
+        return [self.primary] + [x.provider for x in self.replicas]
+
+    async def connect(self) -> None:
+        for provider in self._providers:
+            await provider.connect()
+
+    async def disconnect(self) -> None:
+        for provider in self._providers:
+            await provider.disconnect()
+
+    async def dispose(self) -> None:
+        for provider in self._providers:
+            await provider.dispose()  # type: ignore
+
+    def _mark_write(self) -> None:
+        if self.sticky_after_write:
+            ctx.read_your_writes = True
+
+    async def _check_lag(self, replica: _Replica) -> bool:
+        if self.max_replication_lag is None:
+            return True
+        now = time.monotonic()
+        if replica.checked_at is None or now - replica.checked_at >= (
+            self.lag_check_interval
+        ):
+            replica.checked_at = now
+            try:
+                (row,) = await replica.provider.execute(LAG_QUERY)
+            except Exception:
+                replica.lag = math.inf  # unreachable replicas are skipped as well
+            else:
+                replica.lag = float(row["lag"] or 0.0)
+        return replica.lag <= self.max_replication_lag
+
+    async def _choose_replica(self) -> _Replica | None:
+        if not self.replicas or ctx.read_your_writes:
+            return None
+        if self.strategy == "least_busy":
+            candidates = sorted(self.replicas, key=lambda x: x.busy)
+        else:
+            start = next(self._counter) % len(self.replicas)
+            candidates = self.replicas[start:] + self.replicas[:start]
+        for replica in candidates:
+            if await self._check_lag(replica):
+                return replica
+        return None
+
+    @asynccontextmanager
+    async def _route(self, query: Executable) -> AsyncIterator[SQLProvider]:
+        if is_advisory_lock(query):
+            yield self.primary
+            return
+        elif not is_read_only(query):
+            self._mark_write()
+            yield self.primary
+            return
+        replica = await self._choose_replica()
+        if replica is None:
+            yield self.primary
+            return
+        replica.busy += 1
+        try:
+            yield replica.provider
+        finally:
+            replica.busy -= 1
+
+    async def execute(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> list[Json]:
+        async with self._route(query) as provider:
+            return await provider.execute(query, bind_params)
+
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        async with self._route(query) as provider:
+            return await provider.execute_rows(query, bind_params)
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        async with self._route(query) as provider:
+            async for rows in provider.iter_execute(query, bind_params, batch_size):
+                yield rows
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        async with self._route(query) as provider:
+            await provider.copy_to(query, output, format)
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        self._mark_write()
+        await self.primary.copy_from(table, columns, source, format)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        async with self.primary.transaction() as transaction:  # type: ignore
+            yield _WriteTrackingProvider(transaction, self)
+
+    @asynccontextmanager
+    async def testing_transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        async with self.primary.testing_transaction() as transaction:  # type: ignore
+            yield _WriteTrackingProvider(transaction, self)
+
+    async def execute_autocommit(self, query: Executable) -> None:
+        await self.primary.execute_autocommit(query)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        async with self.primary.session() as session:  # type: ignore
+            yield _WriteTrackingProvider(session, self)
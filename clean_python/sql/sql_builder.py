@@ -1,38 +1,113 @@
+import json
+from collections.abc import Iterator
+from collections.abc import Sequence
 from datetime import datetime
+from typing import Any
+from typing import Literal
 
+from sqlalchemy import all_
 from sqlalchemy import and_
-from sqlalchemy import asc
+from sqlalchemy import any_
+from sqlalchemy import bindparam
+from sqlalchemy import Boolean
+from sqlalchemy import column
 from sqlalchemy import delete
-from sqlalchemy import desc
 from sqlalchemy import Executable
 from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import literal_column
+from sqlalchemy import not_
+from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy import Table
+from sqlalchemy import table
+from sqlalchemy import text
 from sqlalchemy import true
+from sqlalchemy import tuple_
 from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import Insert
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement
 from sqlalchemy.sql.expression import ColumnElement
 from sqlalchemy.sql.expression import ColumnOperators
 from sqlalchemy.sql.expression import false
 
+from clean_python import BetweenFilter
 from clean_python import ComparisonFilter
 from clean_python import ComparisonOperator
+from clean_python import ContainsFilter
 from clean_python import ctx
 from clean_python import Filter
 from clean_python import Id
+from clean_python import ILikeFilter
+from clean_python import IsNullFilter
 from clean_python import Json
+from clean_python import Metric
+from clean_python import NotFilter
+from clean_python import OrFilter
 from clean_python import PageOptions
+from clean_python import PrefixFilter
 
-__all__ = ["SQLBuilder"]
+from .sql_provider import quote_table_name
 
+__all__ = ["SQLBuilder", "OnConflict"]
 
-def _regular_filter_to_sql(column: ColumnElement, filter: Filter) -> ColumnElement:
-    if len(filter.values) == 0:
-        return false()
-    elif len(filter.values) == 1:
-        return column == filter.values[0]
+
+# what to do with imported rows that have the id of an existing row
+OnConflict = Literal["error", "ignore", "update"]
+
+
+# Label of the window function column that contains the total number of records
+TOTAL_LABEL = "_total"
+# Label of the column that tells whether the record to update exists
+EXISTS_LABEL = "_exists"
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN a statement, returning the plan as JSON
+
+    With `analyze`, the statement is executed to include actual timings and buffer
+    usage in the plan.
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement: Executable, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain)
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if element.analyze else "FORMAT JSON"
+    return f"EXPLAIN ({options}) " + compiler.process(element.statement, **kw)
+
+
+def _regular_filter_to_sql(
+    column: ColumnElement, filter: Filter, array_params: bool = False
+) -> ColumnElement:
+    values = [x for x in filter.values if x is not None]
+    result: ColumnElement
+    if len(values) == 0:
+        result = false()
+    elif len(values) == 1:
+        result = column == values[0]
+    elif array_params:
+        # '= ANY($1)' keeps the SQL text independent of the number of values
+        result = column == any_(bindparam(None, values, type_=ARRAY(column.type)))
     else:
-        return column.in_(filter.values)
+        result = column.in_(values)
+    if len(values) == len(filter.values):
+        return result
+    # a None value matches NULL (like 'column == None' does)
+    return column.is_(None) if len(values) == 0 else or_(result, column.is_(None))
+
+
+# PostgreSQL accepts at most 32767 bind parameters per statement
+MAX_BIND_PARAMS = 32767
 
 
 # Maps our operators to SQLAlchemy operators
@@ -52,12 +127,66 @@ def _comparison_filter_to_sql(
     return column.operate(comparitor_map[filter.operator], filter.values[0])
 
 
+def _escape_like(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def _contains_filter_to_sql(
+    column: ColumnElement, filter: ContainsFilter
+) -> ColumnElement:
+    # 'column @> ...' can use a GIN index
+    if not isinstance(column.type, (ARRAY, JSONB)):
+        raise ValueError(f"Can't use a ContainsFilter on column '{column.key}'")
+    return column.contains(filter.values)
+
+
+def _seek(
+    left: ColumnElement, right: Any, ascending: bool, nullable: bool = False
+) -> ColumnElement:
+    if not nullable:
+        return left > right if ascending else left < right
+    # NULLs are last when ascending and first when descending
+    elif ascending:
+        return or_(left > right, and_(left.is_(None), right.is_not(None)))
+    else:
+        return or_(left < right, and_(left.is_not(None), right.is_(None)))
+
+
+def _is_equal(left: ColumnElement, right: Any, nullable: bool) -> ColumnElement:
+    return left.is_not_distinct_from(right) if nullable else left == right
+
+
+def in_batch_order(batch: list[Json], rows: list[Json]) -> list[Json]:
+    """Order the RETURNING rows of insert_many / upsert_many like the batch
+
+    PostgreSQL does not guarantee the order of RETURNING rows, so the rows are
+    matched to the items by id. If the items have no id, the ids are generated in
+    the order of the VALUES list and the rows are sorted by id. Items that were not
+    written (see the `match` of upsert) have no row and are left out.
+    """
+    if any(x.get("id") is None for x in batch):
+        return sorted(rows, key=lambda x: x["id"])
+    lut = {x["id"]: x for x in rows}
+    return [lut[x["id"]] for x in batch if x["id"] in lut]
+
+
 class SQLBuilder:
-    def __init__(self, table: Table, multitenant: bool = False):
+    """Builds SQLAlchemy expressions for a single table.
+
+    With `array_params=True`, filters on multiple values are compiled to
+    `column = ANY($1)` with a single array parameter instead of an expanded
+    `column IN ($1, $2, ...)`. The resulting SQL text does not depend on the number
+    of values, so that prepared statements can be reused by the database driver.
+    """
+
+    def __init__(
+        self, table: Table, multitenant: bool = False, array_params: bool = False
+    ):
         if multitenant and not hasattr(table.c, "tenant"):
             raise ValueError("Can't use a multitenant SQLBuilder without tenant column")
         self.table = table
         self.multitenant = multitenant
+        self.array_params = array_params
 
     @property
     def current_tenant(self) -> Id | None:
@@ -68,14 +197,30 @@ class SQLBuilder:
         return ctx.tenant.id
 
     def _filter_to_sql(self, filter: Filter) -> ColumnElement:
+        if isinstance(filter, OrFilter):
+            return or_(false(), *[self._filter_to_sql(x) for x in filter.filters])
+        elif isinstance(filter, NotFilter):
+            return not_(and_(true(), *[self._filter_to_sql(x) for x in filter.filters]))
         try:
             column = getattr(self.table.c, filter.field)
         except AttributeError:
             return false()
         if isinstance(filter, ComparisonFilter):
             return _comparison_filter_to_sql(column, filter)
+        elif isinstance(filter, IsNullFilter):
+            return column.is_(None)
+        elif isinstance(filter, BetweenFilter):
+            return column.between(*filter.values)
+        elif isinstance(filter, PrefixFilter):
+            # 'LIKE prefix%' can use a btree index (text_pattern_ops), but only if the
+            # planner sees the bound prefix value: a generic plan can't use the index
+            return column.like(_escape_like(filter.values[0]) + "%", escape="/")
+        elif isinstance(filter, ILikeFilter):
+            return column.ilike(filter.values[0])
+        elif isinstance(filter, ContainsFilter):
+            return _contains_filter_to_sql(column, filter)
         else:
-            return _regular_filter_to_sql(column, filter)
+            return _regular_filter_to_sql(column, filter, self.array_params)
 
     def _filters_to_sql(self, filters: list[Filter]) -> ColumnElement:
         qs = [self._filter_to_sql(x) for x in filters]
@@ -86,6 +231,10 @@ class SQLBuilder:
     def _id_filter_to_sql(self, id: Id) -> ColumnElement:
         return self._filters_to_sql([Filter(field="id", values=[id])])
 
+    def _columns(self, fields: list[str]) -> list[ColumnElement]:
+        # unknown fields are ignored; the id is always included
+        return [c for c in self.table.c if c.key == "id" or c.key in fields]
+
     def _santize_item(self, item: Json) -> Json:
         known = {c.key for c in self.table.c}
         result = {k: item[k] for k in item.keys() if k in known}
@@ -95,19 +244,104 @@ class SQLBuilder:
             result["tenant"] = self.current_tenant
         return result
 
+    def _cursor_to_sql(self, params: PageOptions) -> ColumnElement:
+        """Seek predicate for keyset pagination: rows after the row with id=cursor
+
+        If ordering by other columns than "id", the "id" is used as tiebreaker and
+        the values of the order columns are looked up in subqueries. If all columns
+        are sorted in the same direction and are not nullable, this is a single row
+        comparison, which can use a composite index. NULL values are sorted like
+        PostgreSQL does by default: last when ascending and first when descending.
+
+        If the cursor record doesn't exist, the page is empty. For nullable columns
+        this needs an explicit EXISTS, because the missing values would equal NULL.
+        """
+        keys = params.sort_keys()
+        if any(x.nulls is not None for x in keys):
+            raise ValueError("Can't use a cursor with an explicit nulls ordering")
+        columns = [getattr(self.table.c, x.field) for x in keys]
+        values: list[Any] = [
+            params.cursor
+            if x.field == "id"
+            else (
+                select(column)
+                .where(self._id_filter_to_sql(params.cursor))  # type: ignore
+                .scalar_subquery()
+            )
+            for (x, column) in zip(keys, columns)
+        ]
+        if len(keys) == 1:
+            return _seek(columns[0], values[0], keys[0].ascending)
+        elif len({x.ascending for x in keys}) == 1 and not any(
+            x.nullable for x in columns
+        ):
+            return _seek(tuple_(*columns), tuple_(*values), keys[0].ascending)
+        # (a > x) OR (a = x AND b < y) OR (a = x AND b = y AND c > z) ...
+        result = or_(
+            *[
+                and_(
+                    *[
+                        _is_equal(c, v, c.nullable)
+                        for (c, v) in zip(columns[:i], values[:i])
+                    ],
+                    _seek(
+                        columns[i], values[i], keys[i].ascending, columns[i].nullable
+                    ),
+                )
+                for i in range(len(keys))
+            ]
+        )
+        if not any(x.nullable for x in columns):
+            return result
+        cursor_exists = (
+            select(self.table.c.id)
+            .where(self._id_filter_to_sql(params.cursor))  # type: ignore
+            .exists()
+        )
+        return and_(cursor_exists, result)
+
+    def _order_by_to_sql(self, params: PageOptions) -> list[ColumnElement]:
+        result = []
+        for key in params.sort_keys():
+            column = getattr(self.table.c, key.field)
+            clause = column.asc() if key.ascending else column.desc()
+            if key.nulls == "first":
+                clause = clause.nulls_first()
+            elif key.nulls == "last":
+                clause = clause.nulls_last()
+            result.append(clause)
+        return result
+
     def select(
         self,
         filters: list[Filter],
         params: PageOptions | None = None,
         for_update: bool = False,
+        with_total: bool = False,
+        fields: list[str] | None = None,
+        skip_locked: bool = False,
     ) -> Executable:
-        query = select(self.table)
+        """SELECT the matching rows, with `fields` only those columns (and the id)
+
+        With `skip_locked`, rows that are locked by other transactions are left out
+        (instead of waiting for them), this requires `for_update`.
+        """
+        if fields is None:
+            query = select(self.table)
+        else:
+            query = select(*self._columns(fields))
+        if with_total:
+            # the window function is evaluated before LIMIT / OFFSET
+            query = query.add_columns(func.count().over().label(TOTAL_LABEL))
         if for_update:
-            query = query.with_for_update()
+            query = query.with_for_update(skip_locked=skip_locked)
         query = query.where(self._filters_to_sql(filters))
         if params is not None:
-            sort = asc(params.order_by) if params.ascending else desc(params.order_by)
-            query = query.order_by(sort).limit(params.limit).offset(params.offset)
+            if params.cursor is not None:
+                query = query.where(self._cursor_to_sql(params))
+            # ends with "id" as tiebreaker to get a stable ordering for pagination
+            query = query.order_by(*self._order_by_to_sql(params))
+            query = query.limit(params.limit).offset(params.offset)
         return query
 
     def insert(self, item: Json) -> Executable:
@@ -115,18 +349,77 @@ class SQLBuilder:
             insert(self.table).values(**self._santize_item(item)).returning(self.table)
         )
 
-    def upsert(self, item: Json) -> Executable:
+    def upsert(self, item: Json, match: str | None = None) -> Executable:
+        """Insert an item, or update the record with the same id.
+
+        If `match` is given, an existing record is only updated if its `match` column
+        equals the value in `item`. Otherwise, no row is returned.
+        """
         item = self._santize_item(item)
+        query = insert(self.table).values(**item)
+        return query.on_conflict_do_update(
+            index_elements=["id", "tenant"] if self.multitenant else ["id"],
+            set_=item,
+            where=self._match_to_sql(query, match),
+        ).returning(self.table)
+
+    def _match_to_sql(self, query: Insert, match: str | None) -> ColumnElement | None:
+        if match is None:
+            return None
+        return self.table.c[match] == query.excluded[match]
+
+    def batches(self, items: list[Json], batch_size: int) -> Iterator[list[Json]]:
+        """Split items into batches for insert_many / upsert_many.
+
+        A batch contains consecutive items that have the same columns, so that the
+        order of the items is preserved.
+        """
+        batch: list[Json] = []
+        columns: set[str] = set()
+        for item in items:
+            item_columns = set(self._santize_item(item))
+            max_size = min(batch_size, MAX_BIND_PARAMS // max(len(item_columns), 1))
+            if batch and (
+                item_columns != columns or not columns or len(batch) >= max_size
+            ):
+                yield batch
+                batch = []
+            batch.append(item)
+            columns = item_columns
+        if batch:
+            yield batch
+
+    def insert_many(self, items: list[Json]) -> Executable:
+        """Insert items in a single multi-row statement.
+
+        All items must have the same columns, see batches(). The RETURNING rows are
+        not necessarily in the order of the VALUES list, see in_batch_order().
+        """
+        if len(items) == 1:
+            return self.insert(items[0])
         return (
             insert(self.table)
-            .values(**item)
-            .on_conflict_do_update(
-                index_elements=["id", "tenant"] if self.multitenant else ["id"],
-                set_=item,
-            )
+            .values([self._santize_item(x) for x in items])
             .returning(self.table)
         )
 
+    def upsert_many(self, items: list[Json], match: str | None = None) -> Executable:
+        """Upsert items in a single multi-row statement.
+
+        All items must have the same columns, see batches(). Note that PostgreSQL
+        does not allow a batch that contains the same id twice. See upsert() for
+        `match`: records that are not updated because of it are not returned.
+        """
+        if len(items) == 1:
+            return self.upsert(items[0], match)
+        sanitized = [self._santize_item(x) for x in items]
+        query = insert(self.table).values(sanitized)
+        return query.on_conflict_do_update(
+            index_elements=["id", "tenant"] if self.multitenant else ["id"],
+            set_={k: query.excluded[k] for k in sanitized[0]},
+            where=self._match_to_sql(query, match),
+        ).returning(self.table)
+
     def update(self, id: Id, item: Json, if_unmodified_since: datetime | None):
         q = self._id_filter_to_sql(id)
         if if_unmodified_since is not None:
@@ -138,6 +431,27 @@ class SQLBuilder:
             .returning(self.table)
         )
 
+    def update_if_unmodified_since(
+        self, id: Id, item: Json, if_unmodified_since: datetime
+    ) -> Executable:
+        """Optimistic update in a single statement, see update().
+
+        This always returns one row: the updated record (or NULLs if it was not
+        updated), with a column EXISTS_LABEL that tells whether the record exists.
+        So a conflict can be told apart from a missing record without another query.
+        """
+        updated = self.update(id, item, if_unmodified_since).cte("updated")
+        found = select(
+            select(true())
+            .select_from(self.table)
+            .where(self._id_filter_to_sql(id))
+            .exists()
+            .label(EXISTS_LABEL)
+        ).subquery("found")
+        return select(*updated.c, found.c[EXISTS_LABEL]).select_from(
+            found.outerjoin(updated, true())
+        )
+
     def delete(self, id: Id) -> Executable:
         return (
             delete(self.table)
@@ -145,6 +459,134 @@ class SQLBuilder:
             .returning(self.table.c.id)
         )
 
+    def delete_filtered(
+        self, filters: list[Filter], exclude_ids: list[Id] | None = None
+    ) -> Executable:
+        q = self._filters_to_sql(filters)
+        if exclude_ids and self.array_params:
+            q &= self.table.c.id != all_(
+                bindparam(None, exclude_ids, type_=ARRAY(self.table.c.id.type))
+            )
+        elif exclude_ids:
+            q &= self.table.c.id.not_in(exclude_ids)
+        deleted = delete(self.table).where(q).returning(self.table.c.id).cte("deleted")
+        return select(func.count().label("count")).select_from(deleted)
+
+    def update_filtered(self, filters: list[Filter], values: Json) -> Executable:
+        values = self._santize_item(values)
+        values.pop("id", None)
+        updated = (
+            update(self.table)
+            .where(self._filters_to_sql(filters))
+            .values(**values)
+            .returning(self.table.c.id)
+            .cte("updated")
+        )
+        return select(func.count().label("count")).select_from(updated)
+
+    def claim(self, filters: list[Filter], limit: int, values: Json) -> Executable:
+        """UPDATE up to `limit` matching rows that are not locked by others.
+
+        The rows are selected (ordered by id) with FOR UPDATE SKIP LOCKED, so that
+        concurrent workers claim different rows without waiting for each other.
+        """
+        values = self._santize_item(values)
+        values.pop("id", None)
+        claimed = (
+            select(self.table.c.id)
+            .where(self._filters_to_sql(filters))
+            .order_by(self.table.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("claimed")
+        )
+        return (
+            update(self.table)
+            .where(self.table.c.id == claimed.c.id)
+            .values(**values)
+            .returning(self.table)
+        )
+
+    def _import_columns(self, columns: Sequence[str]) -> list[str]:
+        known = {c.key for c in self.table.c}
+        for name in columns:
+            if name not in known:
+                raise ValueError(f"Can't import unknown column '{name}'")
+            if self.multitenant and name == "tenant":
+                raise ValueError("Can't import the tenant column, it is set from ctx")
+        return list(columns)
+
+    def create_staging_table(self, name: str, columns: Sequence[str]) -> Executable:
+        """A temporary table with the `columns` of this table, without constraints.
+
+        The table is dropped at the end of the transaction.
+        """
+        quoted = ", ".join(f'"{x}"' for x in self._import_columns(columns))
+        return text(
+            f'CREATE TEMP TABLE "{name}" ON COMMIT DROP AS SELECT {quoted} '
+            f"FROM {quote_table_name(self.table.fullname)} WITH NO DATA"
+        )
+
+    def merge_staging_table(
+        self, name: str, columns: Sequence[str], on_conflict: OnConflict = "error"
+    ) -> Executable:
+        """INSERT the rows of a staging table, returning the inserted/updated counts.
+
+        With on_conflict="update", rows with an existing id are updated. Note that
+        PostgreSQL does not allow the same id twice in that case.
+        """
+        columns = self._import_columns(columns)
+        staging = table(name, *[column(x) for x in columns])
+        values: list[ColumnElement] = [staging.c[x] for x in columns]
+        if self.multitenant:
+            values.append(literal(self.current_tenant, self.table.c.tenant.type))
+            columns = columns + ["tenant"]
+        query = insert(self.table).from_select(columns, select(*values))
+        if on_conflict == "ignore":
+            query = query.on_conflict_do_nothing()
+        elif on_conflict == "update":
+            if "id" not in columns:
+                raise ValueError("Can't update on conflict without the id column")
+            query = query.on_conflict_do_update(
+                index_elements=["id", "tenant"] if self.multitenant else ["id"],
+                set_={
+                    x: query.excluded[x] for x in columns if x not in ("id", "tenant")
+                },
+            )
+        # xmax is 0 for a newly inserted row version
+        merged = query.returning(
+            literal_column("xmax = 0", Boolean).label("inserted")
+        ).cte("merged")
+        return select(
+            func.count().filter(merged.c.inserted).label("inserted"),
+            func.count().filter(not_(merged.c.inserted)).label("updated"),
+        ).select_from(merged)
+
+    def _aggregate_column(self, name: str) -> ColumnElement:
+        try:
+            return getattr(self.table.c, name)
+        except AttributeError:
+            raise ValueError(f"Can't aggregate unknown column '{name}'")
+
+    def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> Executable:
+        """GROUP BY the `group_by` columns, ordered by the groups"""
+        groups = [self._aggregate_column(x) for x in group_by]
+        columns = [
+            getattr(func, x.function.value)(
+                *([] if x.field is None else [self._aggregate_column(x.field)])
+            ).label(x.label)
+            for x in metrics
+        ]
+        return (
+            select(*groups, *columns)
+            .select_from(self.table)
+            .where(self._filters_to_sql(filters))
+            .group_by(*groups)
+            .order_by(*groups)
+        )
+
     def count(self, filters: list[Filter]) -> Executable:
         return (
             select(func.count().label("count"))
@@ -152,6 +594,19 @@ class SQLBuilder:
             .where(self._filters_to_sql(filters))
         )
 
+    def estimate_count(self, filters: list[Filter]) -> Executable:
+        """The query planner's estimate of the number of records (fast, but inexact)"""
+        return Explain(
+            select(true()).select_from(self.table).where(self._filters_to_sql(filters))
+        )
+
+    @staticmethod
+    def parse_estimate_count(rows: list[Json]) -> int:
+        (plan,) = rows[0].values()
+        if isinstance(plan, str):  # in case the driver doesn't decode json
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
     def exists(self, filters: list[Filter]) -> Executable:
         return (
             select(true().label("exists"))
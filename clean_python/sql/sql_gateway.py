@@ -1,14 +1,20 @@
 # (c) Nelen & Schuurmans
 from collections.abc import AsyncIterator
 from collections.abc import Callable
+from collections.abc import Sequence
 from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import partial
+from typing import Literal
 from typing import TypeVar
+from uuid import uuid4
 
 import inject
 from sqlalchemy import Table
 from sqlalchemy.sql import Executable
 
+from clean_python import AlreadyExists
+from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
@@ -16,23 +22,64 @@ from clean_python import Gateway
 from clean_python import Id
 from clean_python import Json
 from clean_python import Mapper
+from clean_python import Metric
+from clean_python import now
 from clean_python import PageOptions
+from clean_python import Rows
+from clean_python import ValueObject
+from clean_python.base.domain.gateway import project
 
+from .sql_builder import EXISTS_LABEL
+from .sql_builder import in_batch_order
+from .sql_builder import OnConflict
 from .sql_builder import SQLBuilder
+from .sql_builder import TOTAL_LABEL
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
+from .sql_provider import CopyOutput
 from .sql_provider import SQLDatabase
 from .sql_provider import SQLProvider
 
-__all__ = ["SQLGateway"]
+__all__ = ["SQLGateway", "OneToMany", "ManyToOne", "ImportResult"]
 
 
 T = TypeVar("T", bound="SQLGateway")
 
 
+class OneToMany(ValueObject):
+    """Relation to records of `gateway` that refer to this record by `fk_name`"""
+
+    field_name: str
+    gateway: type
+    fk_name: str
+
+
+class ManyToOne(ValueObject):
+    """Relation to a record of `gateway` that this record refers to by `fk_name`"""
+
+    field_name: str
+    gateway: type
+    fk_name: str
+
+
+class ImportResult(ValueObject):
+    inserted: int
+    updated: int
+
+
 class SQLGateway(Gateway):
     table: Table
     multitenant: bool
     has_related: bool
+    array_params: bool
+    relations: tuple[OneToMany | ManyToOne, ...]
     mapper: Mapper = Mapper()
+    batch_size: int = 1000
+    # How filter_with_total obtains the total number of records:
+    # - "count": a separate COUNT query, if necessary
+    # - "window": count(*) OVER () in the same query (not with a cursor)
+    # - "estimate": the estimate of the query planner, if a count is necessary
+    total_mode: Literal["count", "window", "estimate"] = "count"
 
     def __init__(
         self,
@@ -41,20 +88,27 @@ class SQLGateway(Gateway):
     ):
         self.provider_override = provider_override
         self.nested = nested
-        self.builder = SQLBuilder(self.table, self.multitenant)
+        self.builder = SQLBuilder(self.table, self.multitenant, self.array_params)
 
     @property
     def provider(self):
         return self.provider_override or inject.instance(SQLDatabase)
 
     def __init_subclass__(
-        cls, table: Table, multitenant: bool = False, has_related: bool = False
+        cls,
+        table: Table,
+        multitenant: bool = False,
+        has_related: bool = False,
+        array_params: bool = False,
+        relations: Sequence[OneToMany | ManyToOne] = (),
     ) -> None:
         cls.table = table
         if multitenant and not hasattr(table.c, "tenant"):
             raise ValueError("Can't use a multitenant SQLGateway without tenant column")
         cls.multitenant = multitenant
-        cls.has_related = has_related
+        cls.relations = tuple(relations)
+        cls.has_related = has_related or bool(relations)
+        cls.array_params = array_params
         super().__init_subclass__()
 
     @asynccontextmanager
@@ -65,15 +119,95 @@ class SQLGateway(Gateway):
             async with self.provider.transaction() as provider:
                 yield self.__class__(provider, nested=True)
 
+    def _related_gateway(self, relation: OneToMany | ManyToOne) -> "SQLGateway":
+        return relation.gateway(self.provider, nested=self.nested)
+
+    def _relations(self, fields: list[str] | None) -> tuple[OneToMany | ManyToOne, ...]:
+        if fields is None:
+            return self.relations
+        return tuple(x for x in self.relations if x.field_name in fields)
+
+    def _fields(self, fields: list[str] | None) -> list[str] | None:
+        # the foreign keys are required to fetch many-to-one relations
+        if fields is None:
+            return None
+        return fields + [
+            x.fk_name for x in self._relations(fields) if isinstance(x, ManyToOne)
+        ]
+
+    def _has_related(self, fields: list[str] | None) -> bool:
+        if type(self).get_related is not SQLGateway.get_related:
+            return self.has_related
+        return bool(self._relations(fields))
+
+    async def _get_related_fields(
+        self, items: list[Json], fields: list[str] | None
+    ) -> list[Json]:
+        """Get the related records that are in `fields` and project the items"""
+        if type(self).get_related is not SQLGateway.get_related:
+            # a custom get_related gets all related records
+            await self.get_related(items)
+        else:
+            await self._get_relations(items, self._relations(fields))
+        return project(items, fields)
+
     async def get_related(self, items: list[Json]) -> None:
-        """Implement this to use transactions for consistently getting nested records"""
+        """Implement this to use transactions for consistently getting nested records
+
+        By default, this fetches the `relations` with 1 query per relation.
+        """
+        await self._get_relations(items, self.relations)
+
+    async def _get_relations(
+        self, items: list[Json], relations: Sequence[OneToMany | ManyToOne]
+    ) -> None:
+        if not items:
+            return
+        for relation in relations:
+            gateway = self._related_gateway(relation)
+            if isinstance(relation, OneToMany):
+                await gateway._get_related_one_to_many(
+                    items, relation.field_name, relation.fk_name
+                )
+            else:
+                await gateway._get_related_many_to_one(
+                    items, relation.field_name, relation.fk_name
+                )
 
     async def set_related(self, item: Json, result: Json) -> None:
-        """Implement this to use transactions for consistently setting nested records"""
+        """Implement this to use transactions for consistently setting nested records
+
+        By default, this writes the one-to-many `relations` using set-based queries.
+        Many-to-one relations are not written, they are fetched into `result`.
+        """
+        for relation in self.relations:
+            gateway = self._related_gateway(relation)
+            if isinstance(relation, OneToMany):
+                await gateway._set_related_one_to_many(
+                    item, result, relation.field_name, relation.fk_name
+                )
+            else:
+                await gateway._get_related_many_to_one(
+                    [result], relation.field_name, relation.fk_name
+                )
 
     async def execute(self, query: Executable) -> list[Json]:
         return [self.mapper.to_internal(x) for x in await self.provider.execute(query)]
 
+    async def gather(self, *queries: Executable) -> list[list[Json]]:
+        """Execute independent queries concurrently, returning their results in order.
+
+        Example:
+            >>> records, (count,) = await gateway.gather(
+                gateway.builder.select(filters, params),
+                gateway.builder.count(filters),
+            )
+        """
+        return [
+            [self.mapper.to_internal(x) for x in rows]
+            for rows in await self.provider.execute_many(queries)
+        ]
+
     async def add(self, item: Json) -> Json:
         query = self.builder.insert(self.mapper.to_external(item))
         if self.has_related:
@@ -84,29 +218,67 @@ class SQLGateway(Gateway):
             (result,) = await self.execute(query)
         return result
 
+    async def add_many(self, items: list[Json]) -> list[Json]:
+        if self.has_related:
+            async with self.transaction() as transaction:
+                return [await transaction.add(x) for x in items]
+        return await self._execute_batches(self.builder.insert_many, items)
+
+    async def _execute_batches(
+        self, func: Callable[[list[Json]], Executable], items: list[Json]
+    ) -> list[Json]:
+        external = [self.mapper.to_external(x) for x in items]
+        batches = list(self.builder.batches(external, self.batch_size))
+        if not batches:
+            return []
+        elif len(batches) == 1:
+            rows = await self.provider.execute(func(batches[0]))
+            rows = in_batch_order(batches[0], rows)
+        else:
+            rows = []
+            async with self.transaction() as transaction:
+                for batch in batches:
+                    batch_rows = await transaction.provider.execute(func(batch))
+                    rows.extend(in_batch_order(batch, batch_rows))
+        return [self.mapper.to_internal(x) for x in rows]
+
     async def update(
         self, item: Json, if_unmodified_since: datetime | None = None
     ) -> Json:
         id_ = item.get("id")
         if id_ is None:
             raise DoesNotExist("record", id_)
-        query = self.builder.update(
-            id_, self.mapper.to_external(item), if_unmodified_since
-        )
         if self.has_related:
             async with self.transaction() as transaction:
-                result = await transaction.execute(query)
+                result = await transaction._execute_update(
+                    id_, item, if_unmodified_since
+                )
                 if result:
                     await transaction.set_related(item, result[0])
         else:
-            result = await self.execute(query)
+            result = await self._execute_update(id_, item, if_unmodified_since)
         if not result:
-            if if_unmodified_since is not None:
-                if await self.exists([Filter.for_id(id_)]):
-                    raise Conflict()
             raise DoesNotExist("record", id_)
         return result[0]
 
+    async def _execute_update(
+        self, id: Id, item: Json, if_unmodified_since: datetime | None
+    ) -> list[Json]:
+        external = self.mapper.to_external(item)
+        if if_unmodified_since is None:
+            return await self.execute(self.builder.update(id, external, None))
+        # a single statement that also tells a conflict apart from a missing record
+        query = self.builder.update_if_unmodified_since(
+            id, external, if_unmodified_since
+        )
+        (row,) = await self.provider.execute(query)
+        exists = row.pop(EXISTS_LABEL)
+        if row["id"] is not None:
+            return [self.mapper.to_internal(row)]
+        elif exists:
+            raise Conflict()
+        return []
+
     async def _select_for_update(self, id: Id) -> Json:
         query = self.builder.select([Filter.for_id(id)], for_update=True)
         async with self.transaction() as transaction:
@@ -134,13 +306,45 @@ class SQLGateway(Gateway):
             result = await self.execute(query)
         return result[0]
 
+    async def upsert_many(self, items: list[Json]) -> list[Json]:
+        if self.has_related:
+            async with self.transaction() as transaction:
+                return [await transaction.upsert(x) for x in items]
+        return await self._execute_batches(self.builder.upsert_many, items)
+
     async def remove(self, id: Id) -> bool:
         return bool(await self.execute(self.builder.delete(id)))
 
-    async def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+    async def remove_filtered(self, filters: list[Filter]) -> int:
+        return (await self.execute(self.builder.delete_filtered(filters)))[0]["count"]
+
+    async def update_filtered(self, filters: list[Filter], values: Json) -> int:
+        if "updated_at" in self.table.c:
+            # like RootEntity.update
+            values = {"updated_at": now(), **values}
+        if type(self.mapper) is not Mapper:
+            # a custom mapper works on complete records: update them one by one
+            return await super().update_filtered(filters, values)
+        query = self.builder.update_filtered(filters, values)
+        return (await self.execute(query))[0]["count"]
+
+    async def claim(
+        self, filters: list[Filter], limit: int, values: Json | None = None
     ) -> list[Json]:
-        query = self.builder.select(filters, params)
+        """Claim up to `limit` matching records that are not locked by others.
+
+        Rows that are locked by concurrent workers are skipped (FOR UPDATE SKIP
+        LOCKED) instead of waited for. With `values`, the claimed records are updated
+        in the same statement, for instance to mark them as being processed. Without,
+        the records stay locked until the end of the transaction, so then use this
+        within `transaction()`.
+        """
+        if values:
+            query = self.builder.claim(filters, limit, self.mapper.to_external(values))
+        else:
+            query = self.builder.select(
+                filters, PageOptions(limit=limit), for_update=True, skip_locked=True
+            )
         if self.has_related:
             async with self.transaction() as transaction:
                 result = await transaction.execute(query)
@@ -149,9 +353,180 @@ class SQLGateway(Gateway):
             result = await self.execute(query)
         return result
 
+    async def filter(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> list[Json]:
+        if fields is not None and type(self.mapper) is not Mapper:
+            # a custom mapper works on complete records: project after mapping
+            return project(await self.filter(filters, params), fields)
+        query = self.builder.select(filters, params, fields=self._fields(fields))
+        if self._has_related(fields):
+            async with self.transaction() as transaction:
+                result = await transaction.execute(query)
+                result = await transaction._get_related_fields(result, fields)
+        else:
+            result = await self.execute(query)
+        if not result:
+            await self._check_cursor(params)
+        return result
+
+    async def _check_cursor(self, params: PageOptions | None) -> None:
+        """Raise BadRequest if the cursor record doesn't exist (anymore)
+
+        The order values of the cursor are looked up in the cursor record. Without
+        it, the page would be empty, as if the pagination was at its end.
+        """
+        if params is None or params.cursor is None:
+            return
+        if all(x.field == "id" for x in params.sort_keys()):
+            return
+        if not await self.exists([Filter.for_id(params.cursor)]):
+            raise BadRequest(
+                f"record with id={params.cursor} does not exist", loc=("cursor",)
+            )
+
+    async def filter_rows(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Rows:
+        if self.has_related or type(self.mapper) is not Mapper:
+            # related records and custom mappers work on dictionaries
+            return await super().filter_rows(filters, params, fields=fields)
+        query = self.builder.select(filters, params, fields=fields)
+        result = await self.provider.execute_rows(query)
+        if not result.values:
+            await self._check_cursor(params)
+        return result
+
+    async def iter_filter(
+        self, filters: list[Filter], batch_size: int = 1000
+    ) -> AsyncIterator[Json]:
+        """Iterate over all matching records using a server side cursor"""
+        query = self.builder.select(filters)
+        async with self.transaction() as transaction:
+            provider = transaction.provider
+            async for rows in provider.iter_execute(query, batch_size=batch_size):
+                result = [self.mapper.to_internal(x) for x in rows]
+                if self.has_related:
+                    await transaction.get_related(result)
+                for record in result:
+                    yield record
+
+    async def filter_with_total(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> tuple[list[Json], int]:
+        if params is None or self.total_mode == "count":
+            return await super().filter_with_total(filters, params, fields=fields)
+        elif self.total_mode == "estimate":
+            result = await self.filter(filters, params, fields=fields)
+            if (
+                params.offset == 0
+                and params.cursor is None
+                and len(result) < params.limit
+            ):
+                return result, len(result)
+            return result, await self.estimate_count(filters)
+        elif params.cursor is not None or (
+            fields is not None and type(self.mapper) is not Mapper
+        ):
+            # the window would only count the records after the cursor, and a custom
+            # mapper requires complete records (see filter)
+            return await super().filter_with_total(filters, params, fields=fields)
+        query = self.builder.select(
+            filters, params, with_total=True, fields=self._fields(fields)
+        )
+        if self._has_related(fields):
+            async with self.transaction() as transaction:
+                result, total = await transaction._execute_with_total(query)
+                result = await transaction._get_related_fields(result, fields)
+        else:
+            result, total = await self._execute_with_total(query)
+        if total is None:
+            # no records on this page, so the window function wasn't evaluated
+            total = 0 if params.offset == 0 else await self.count(filters)
+        return result, total
+
+    async def _execute_with_total(
+        self, query: Executable
+    ) -> tuple[list[Json], int | None]:
+        rows = await self.provider.execute(query)
+        total = rows[0][TOTAL_LABEL] if rows else None
+        result = [
+            self.mapper.to_internal({k: v for (k, v) in x.items() if k != TOTAL_LABEL})
+            for x in rows
+        ]
+        return result, total
+
     async def count(self, filters: list[Filter]) -> int:
         return (await self.execute(self.builder.count(filters)))[0]["count"]
 
+    async def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        if type(self.mapper) is not Mapper:
+            # the fields are mapped on complete records: aggregate after mapping
+            return await super().aggregate(filters, group_by, metrics)
+        # the result consists of groups and metrics, the fields are the column names
+        query = self.builder.aggregate(filters, group_by, metrics)
+        return await self.provider.execute(query)
+
+    async def export(
+        self,
+        filters: list[Filter],
+        output: CopyOutput,
+        format: CopyFormat = "csv",
+        fields: list[str] | None = None,
+    ) -> None:
+        """Write the matching rows to `output` using COPY, for bulk exports.
+
+        `output` is a binary file or a coroutine function that is called with chunks
+        of bytes, for instance the `write` of an S3Gateway.multipart_writer. The rows
+        are written as they are in the database: the mapper is not applied.
+        """
+        query = self.builder.select(filters, fields=fields)
+        await self.provider.copy_to(query, output, format)
+
+    async def import_rows(
+        self,
+        source: CopyInput,
+        columns: list[str],
+        on_conflict: OnConflict = "error",
+        format: CopyFormat = "csv",
+    ) -> ImportResult:
+        """Load rows using COPY, for bulk imports.
+
+        `source` is a binary file in `format` (a "csv" file must have a header) or an
+        iterable of records with values in the order of `columns`. The rows are
+        copied into a temporary staging table and then inserted with a single
+        INSERT ... ON CONFLICT, see `on_conflict`. With a multitenant gateway, the
+        tenant is set from the context. As with export(), the mapper is not applied.
+        """
+        staging = f"import_{uuid4().hex}"
+        async with self.provider.transaction() as provider:
+            await provider.execute(self.builder.create_staging_table(staging, columns))
+            await provider.copy_from(staging, columns, source, format)
+            (row,) = await provider.execute(
+                self.builder.merge_staging_table(staging, columns, on_conflict)
+            )
+        return ImportResult(**row)
+
+    async def estimate_count(self, filters: list[Filter]) -> int:
+        """Estimate the number of records using the query planner.
+
+        This is much faster than count() on large tables, but it is only accurate if
+        the table statistics are up to date.
+        """
+        rows = await self.provider.execute(self.builder.estimate_count(filters))
+        return self.builder.parse_estimate_count(rows)
+
     async def exists(self, filters: list[Filter]) -> bool:
         return len(await self.execute(self.builder.exists(filters))) > 0
 
@@ -204,6 +579,49 @@ class SQLGateway(Gateway):
         for related_obj in related_objs:
             item_lut[related_obj[fk_name]][field_name].append(related_obj)
 
+    async def _get_related_many_to_one(
+        self,
+        items: list[Json],
+        field_name: str,
+        fk_name: str,
+    ) -> None:
+        """Fetch the related object for `items` and add them inplace.
+
+        The result is `items` having an additional field containing the related object
+        (or None) which was retrieved from self in 1 SELECT query.
+
+        Args:
+            items: The items for which to fetch related objects. Changed inplace.
+            field_name: The key in item to put the fetched related object into.
+            fk_name: The column name on the item that refers to the related object
+
+        Example:
+            Book has a many-to-one relation to writers.
+
+            >>> books = [{"id": 1, "title": "How to write an ORM", "writer_id": 2}]
+            >>> _get_related_many_to_one(
+                items=books,
+                related_gateway=WriterSQLGateway,
+                field_name="writer",
+                fk_name="writer_id",
+            )
+            >>> books[0]
+            {
+                "id": 1,
+                "title": "How to write an ORM",
+                "writer_id": 2,
+                "writer": {"id": 2, "name": "John Doe"}
+            }
+        """
+        ids = list({x[fk_name] for x in items if x.get(fk_name) is not None})
+        related_lut = (
+            {x["id"]: x for x in await self.filter([Filter(field="id", values=ids)])}
+            if ids
+            else {}
+        )
+        for x in items:
+            x[field_name] = related_lut.get(x.get(fk_name))
+
     async def _set_related_one_to_many(
         self,
         item: Json,
@@ -213,8 +631,10 @@ class SQLGateway(Gateway):
     ) -> None:
         """Set related objects for `item`
 
-        This method first fetches the current situation and then adds / updates / removes
-        where appropriate.
+        The existing related objects are fetched in 1 SELECT statement. The new and
+        changed ones are upserted in 1 multi-row statement (see upsert_many) and the
+        ones that are no longer present are removed in 1 DELETE statement. An id that
+        belongs to a related object of another parent raises AlreadyExists.
 
         Args:
             item: The item for which to set related objects.
@@ -247,26 +667,26 @@ class SQLGateway(Gateway):
             }
         """
         assert not self.multitenant
-        # list existing related objects
-        existing_lut = {
-            x["id"]: x
-            for x in await self.filter([Filter(field=fk_name, values=[result["id"]])])
-        }
-
-        # add / update them where necessary
-        returned = []
-        for new_value in item.get(field_name, []):
-            new_value = {fk_name: result["id"], **new_value}
-            existing = existing_lut.pop(new_value.get("id"), None)
-            if existing is None:
-                returned.append(await self.add(new_value))
-            elif new_value == existing:
-                returned.append(existing)
-            else:
-                returned.append(await self.update(new_value))
-
+        parent_filter = Filter(field=fk_name, values=[result["id"]])
+        existing_lut = {x["id"]: x for x in await self.filter([parent_filter])}
+        new_values = [{**x, fk_name: result["id"]} for x in item.get(field_name, [])]
+        # unchanged related objects are not written
+        changed = [x for x in new_values if existing_lut.get(x.get("id")) != x]
+        # an id that belongs to another parent is not updated and not returned
+        written = await self._execute_batches(
+            partial(self.builder.upsert_many, match=fk_name), changed
+        )
+        if len(written) != len(changed):
+            raise AlreadyExists()
+        written_iter = iter(written)
+        returned = [
+            existing_lut[x["id"]] if x not in changed else next(written_iter)
+            for x in new_values
+        ]
         result[field_name] = returned
 
-        # remove remaining
-        for to_remove in existing_lut:
-            assert await self.remove(to_remove)
+        # remove the related objects that were not written or unchanged
+        query = self.builder.delete_filtered(
+            [parent_filter], exclude_ids=[x["id"] for x in returned]
+        )
+        await self.execute(query)
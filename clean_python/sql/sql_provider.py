@@ -1,16 +1,61 @@
+import asyncio
 from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterable
 from collections.abc import Iterator
 from collections.abc import Sequence
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
 from typing import Any
+from typing import BinaryIO
+from typing import Literal
 
 from sqlalchemy import text
 from sqlalchemy.sql import Executable
 
 from clean_python import Json
 from clean_python import Provider
+from clean_python import Rows
 from clean_python import SyncProvider
 
-__all__ = ["SQLProvider", "SQLDatabase", "SyncSQLProvider", "SyncSQLDatabase"]
+__all__ = [
+    "SQLProvider",
+    "SQLDatabase",
+    "SyncSQLProvider",
+    "SyncSQLDatabase",
+    "CopyFormat",
+    "CopyInput",
+    "CopyOutput",
+]
+
+
+CopyFormat = Literal["csv", "text", "binary"]
+# a binary file or a coroutine function that is called with chunks of bytes
+CopyOutput = BinaryIO | Callable[[bytes], Awaitable[Any]]
+# a binary file or an iterable of records (tuples of column values)
+CopyInput = BinaryIO | Iterable[Sequence[Any]]
+
+
+def quote_table_name(name: str) -> str:
+    """Quote a table name, which may be prefixed with a schema name"""
+    return ".".join(f'"{x}"' for x in name.split("."))
+
+
+def advisory_lock_query(key: int, wait: bool, scope: str = "") -> Executable:
+    """Query for pg_(try_)advisory_(xact_)lock, the result is in column "acquired"
+
+    The blocking variants return void, so then "acquired" is always true.
+    """
+    if wait:
+        query = f"SELECT true AS acquired FROM pg_advisory_{scope}lock(:key)"
+    else:
+        query = f"SELECT pg_try_advisory_{scope}lock(:key) AS acquired"
+    return text(query).bindparams(key=key)
+
+
+def advisory_unlock_query(key: int) -> Executable:
+    return text("SELECT pg_advisory_unlock(:key) AS released").bindparams(key=key)
 
 
 class SQLProvider(Provider):
@@ -19,6 +64,58 @@ class SQLProvider(Provider):
     ) -> list[Json]:
         raise NotImplementedError()
 
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        """Execute a query, returning the rows in a compact form (keys once)"""
+        return Rows.from_dicts(await self.execute(query, bind_params))
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        """Execute a query and yield the resulting rows in batches.
+
+        Implementations use server-side cursors to keep memory usage bounded. This
+        default implementation fetches all rows at once.
+        """
+        rows = await self.execute(query, bind_params)
+        for i in range(0, len(rows), batch_size):
+            yield rows[i : i + batch_size]
+
+    async def execute_many(self, queries: Sequence[Executable]) -> list[list[Json]]:
+        """Execute independent queries, returning their results in order.
+
+        Within a transaction, the queries are executed one after the other.
+        """
+        return [await self.execute(query) for query in queries]
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        """Write the result of a query to `output` with COPY ... TO STDOUT.
+
+        The data is streamed from the database without creating Python objects per
+        row. The "csv" format includes a header.
+        """
+        raise NotImplementedError()
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        """Load data into a table with COPY ... FROM STDIN.
+
+        `source` is a binary file in `format` (a "csv" file must have a header) or
+        an iterable of records with values in the order of `columns`.
+        """
+        raise NotImplementedError()
+
     async def transaction(self) -> AsyncIterator["SQLProvider"]:
         raise NotImplementedError()
         yield
@@ -27,8 +124,21 @@ class SQLProvider(Provider):
         raise NotImplementedError()
         yield
 
+    async def advisory_xact_lock(self, key: int, wait: bool = True) -> bool:
+        """Acquire an advisory lock that is released at the end of the transaction.
+
+        Use this within a transaction. Without `wait`, this returns False directly if
+        the lock is held by someone else.
+        """
+        (row,) = await self.execute(advisory_lock_query(key, wait, scope="xact_"))
+        return row["acquired"]
+
 
 class SQLDatabase(SQLProvider):
+    async def execute_many(self, queries: Sequence[Executable]) -> list[list[Json]]:
+        """Execute independent queries concurrently on separate connections"""
+        return list(await asyncio.gather(*[self.execute(query) for query in queries]))
+
     async def execute_autocommit(self, query: Executable) -> None:
         pass
 
@@ -42,8 +152,35 @@ class SQLDatabase(SQLProvider):
         await self.execute_autocommit(text(f"DROP DATABASE IF EXISTS {name}"))
 
     async def truncate_tables(self, names: Sequence[str]) -> None:
-        quoted = [f'"{x}"' for x in names]
-        await self.execute_autocommit(text(f"TRUNCATE TABLE {', '.join(quoted)}"))
+        """Truncate all tables in a single statement (on an autocommit connection)"""
+        quoted = list(dict.fromkeys(quote_table_name(x) for x in names))
+        if quoted:
+            await self.execute_autocommit(text(f"TRUNCATE TABLE {', '.join(quoted)}"))
+
+    async def session(self) -> AsyncIterator[SQLProvider]:
+        """A single connection in autocommit mode (to execute multiple statements)"""
+        raise NotImplementedError()
+        yield
+
+    @asynccontextmanager
+    async def advisory_lock(self, key: int, wait: bool = True) -> AsyncIterator[bool]:
+        """Hold a session advisory lock, without keeping a transaction open.
+
+        Without `wait`, this yields False directly if the lock is held by someone
+        else. The lock is released when leaving the context.
+
+        Example:
+            >>> async with provider.advisory_lock(42, wait=False) as acquired:
+                    if acquired:
+                        ...
+        """
+        async with self.session() as session:  # type: ignore
+            (row,) = await session.execute(advisory_lock_query(key, wait))
+            try:
+                yield row["acquired"]
+            finally:
+                if row["acquired"]:
+                    await session.execute(advisory_unlock_query(key))
 
 
 class SyncSQLProvider(SyncProvider):
@@ -52,6 +189,51 @@ class SyncSQLProvider(SyncProvider):
     ) -> list[Json]:
         raise NotImplementedError()
 
+    def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        """Execute a query, returning the rows in a compact form (keys once)"""
+        return Rows.from_dicts(self.execute(query, bind_params))
+
+    def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[list[Json]]:
+        """Execute a query and yield the resulting rows in batches.
+
+        Implementations use server-side cursors to keep memory usage bounded. This
+        default implementation fetches all rows at once.
+        """
+        rows = self.execute(query, bind_params)
+        for i in range(0, len(rows), batch_size):
+            yield rows[i : i + batch_size]
+
+    def copy_to(
+        self, query: Executable, output: BinaryIO, format: CopyFormat = "csv"
+    ) -> None:
+        """Write the result of a query to a file with COPY ... TO STDOUT.
+
+        The data is streamed from the database without creating Python objects per
+        row. The "csv" format includes a header.
+        """
+        raise NotImplementedError()
+
+    def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        """Load data into a table with COPY ... FROM STDIN.
+
+        `source` is a binary file in `format` (a "csv" file must have a header) or
+        an iterable of records with values in the order of `columns`.
+        """
+        raise NotImplementedError()
+
     def transaction(self) -> Iterator["SyncSQLProvider"]:
         raise NotImplementedError()
         yield
@@ -60,6 +242,15 @@ class SyncSQLProvider(SyncProvider):
         raise NotImplementedError()
         yield
 
+    def advisory_xact_lock(self, key: int, wait: bool = True) -> bool:
+        """Acquire an advisory lock that is released at the end of the transaction.
+
+        Use this within a transaction. Without `wait`, this returns False directly if
+        the lock is held by someone else.
+        """
+        (row,) = self.execute(advisory_lock_query(key, wait, scope="xact_"))
+        return row["acquired"]
+
 
 class SyncSQLDatabase(SyncSQLProvider):
     def execute_autocommit(self, query: Executable) -> None:
@@ -75,5 +266,27 @@ class SyncSQLDatabase(SyncSQLProvider):
         self.execute_autocommit(text(f"DROP DATABASE IF EXISTS {name}"))
 
     def truncate_tables(self, names: Sequence[str]) -> None:
-        quoted = [f'"{x}"' for x in names]
-        self.execute_autocommit(text(f"TRUNCATE TABLE {', '.join(quoted)}"))
+        """Truncate all tables in a single statement (on an autocommit connection)"""
+        quoted = list(dict.fromkeys(quote_table_name(x) for x in names))
+        if quoted:
+            self.execute_autocommit(text(f"TRUNCATE TABLE {', '.join(quoted)}"))
+
+    def session(self) -> Iterator[SyncSQLProvider]:
+        """A single connection in autocommit mode (to execute multiple statements)"""
+        raise NotImplementedError()
+        yield
+
+    @contextmanager
+    def advisory_lock(self, key: int, wait: bool = True) -> Iterator[bool]:
+        """Hold a session advisory lock, without keeping a transaction open.
+
+        Without `wait`, this yields False directly if the lock is held by someone
+        else. The lock is released when leaving the context.
+        """
+        with self.session() as session:  # type: ignore
+            (row,) = session.execute(advisory_lock_query(key, wait))
+            try:
+                yield row["acquired"]
+            finally:
+                if row["acquired"]:
+                    session.execute(advisory_unlock_query(key))
@@ -1,8 +1,13 @@
+import math
 import re
+import time
 from collections.abc import AsyncIterator
+from collections.abc import Sequence
 from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any
 
+from sqlalchemy import text
 from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.ext.asyncio import AsyncEngine
@@ -11,8 +16,19 @@ from sqlalchemy.sql import Executable
 
 from clean_python import AlreadyExists
 from clean_python import Conflict
+from clean_python import ctx
+from clean_python import DeadlineExceeded
 from clean_python import Json
+from clean_python import Rows
 
+from .asyncpg_sql_database import compile
+from .asyncpg_sql_database import copy_from_query
+from .asyncpg_sql_database import copy_to_table
+from .query_instrumentation import QueryInstrumentation
+from .sql_builder import Explain
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
+from .sql_provider import CopyOutput
 from .sql_provider import SQLDatabase
 from .sql_provider import SQLProvider
 
@@ -30,6 +46,20 @@ def maybe_raise_conflict(e: DBAPIError) -> None:
         raise Conflict("could not execute query due to concurrent update")
 
 
+def maybe_raise_deadline_exceeded(e: DBAPIError) -> None:
+    # https://www.postgresql.org/docs/current/errcodes-appendix.html
+    if e.orig.pgcode == "57014" and ctx.deadline is not None:  # query_canceled
+        raise DeadlineExceeded()
+
+
+def statement_timeout_query() -> Executable | None:
+    """SET LOCAL statement_timeout to the time remaining until ctx.deadline"""
+    timeout = ctx.time_remaining()
+    if timeout is None:
+        return None
+    return text(f"SET LOCAL statement_timeout = {math.ceil(timeout * 1000)}")
+
+
 def maybe_raise_already_exists(e: DBAPIError) -> None:
     # https://www.postgresql.org/docs/current/errcodes-appendix.html
     if e.orig.pgcode == "23505":  # unique_violation
@@ -46,9 +76,19 @@ def maybe_raise_already_exists(e: DBAPIError) -> None:
 class SQLAlchemyAsyncSQLDatabase(SQLDatabase):
     engine: AsyncEngine
 
-    def __init__(self, url: str, **kwargs):
+    def __init__(
+        self,
+        url: str,
+        instrumentation: QueryInstrumentation | None = None,
+        **kwargs,
+    ):
         kwargs.setdefault("isolation_level", "REPEATABLE READ")
         self.engine = create_async_engine(f"postgresql+asyncpg://{url}", **kwargs)
+        self.instrumentation = instrumentation
+
+    def _observe_pool_wait(self, start: float) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.observe_pool_wait(time.monotonic() - start)
 
     async def dispose(self) -> None:
         await self.engine.dispose()
@@ -62,41 +102,160 @@ class SQLAlchemyAsyncSQLDatabase(SQLDatabase):
         async with self.transaction() as transaction:
             return await transaction.execute(query, bind_params)
 
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        async with self.transaction() as transaction:
+            return await transaction.execute_rows(query, bind_params)
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        async with self.transaction() as transaction:
+            async for rows in transaction.iter_execute(query, bind_params, batch_size):
+                yield rows
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        async with self.transaction() as transaction:
+            await transaction.copy_to(query, output, format)
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        async with self.transaction() as transaction:
+            await transaction.copy_from(table, columns, source, format)
+
     @asynccontextmanager
     async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        start = time.monotonic()
         async with self.engine.connect() as connection:
+            self._observe_pool_wait(start)
             async with connection.begin():
-                yield SQLAlchemyAsyncSQLTransaction(connection)
+                # the timeout applies to each statement in the transaction
+                query = statement_timeout_query()
+                if query is not None:
+                    await connection.execute(query)
+                yield SQLAlchemyAsyncSQLTransaction(connection, self.instrumentation)
 
     @asynccontextmanager
     async def testing_transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
         async with self.engine.connect() as connection:
             async with connection.begin() as transaction:
-                yield SQLAlchemyAsyncSQLTransaction(connection)
+                yield SQLAlchemyAsyncSQLTransaction(connection, self.instrumentation)
                 await transaction.rollback()
 
     async def execute_autocommit(self, query: Executable) -> None:
-        engine = create_async_engine(self.engine.url, isolation_level="AUTOCOMMIT")
-        async with engine.connect() as connection:
+        # the isolation level is reset when the connection is returned to the pool
+        async with self.engine.connect() as connection:
+            connection = await connection.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
             await connection.execute(query)
 
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[SQLProvider]:  # type: ignore
+        start = time.monotonic()
+        async with self.engine.connect() as connection:
+            self._observe_pool_wait(start)
+            connection = await connection.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            yield SQLAlchemyAsyncSQLTransaction(connection, self.instrumentation)
+
 
 class SQLAlchemyAsyncSQLTransaction(SQLProvider):
-    def __init__(self, connection: AsyncConnection):
+    def __init__(
+        self,
+        connection: AsyncConnection,
+        instrumentation: QueryInstrumentation | None = None,
+    ):
         self.connection = connection
+        self.instrumentation = instrumentation
 
     async def execute(
         self, query: Executable, bind_params: dict[str, Any] | None = None
     ) -> list[Json]:
+        return (await self.execute_rows(query, bind_params)).to_dicts()
+
+    async def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        start = time.monotonic()
         try:
             result = await self.connection.execute(query, bind_params)
         except DBAPIError as e:
             maybe_raise_conflict(e)
             maybe_raise_already_exists(e)
+            maybe_raise_deadline_exceeded(e)
             raise e
-        # _asdict() is a documented method of a NamedTuple
-        # https://docs.python.org/3/library/collections.html#collections.somenamedtuple._asdict
-        return [x._asdict() for x in result.fetchall()]
+        if result.returns_rows:
+            # Row objects are tuples, the keys are stored once in the result
+            keys, values = tuple(result.keys()), result.fetchall()
+        else:
+            # for instance DDL
+            keys, values = (), []
+        if self.instrumentation is not None:
+            await self.instrumentation.observe(
+                query,
+                result.context.statement,
+                time.monotonic() - start,
+                len(values),
+                partial(self._explain, query, bind_params),
+            )
+        return Rows(keys, values)
+
+    async def _explain(
+        self, query: Executable, bind_params: dict[str, Any] | None
+    ) -> list[Json]:
+        # a separate connection, as this runs in the background
+        async with self.connection.engine.connect() as connection:
+            analyzed = Explain(query, analyze=True)
+            result = await connection.execute(analyzed, bind_params)
+            return Rows(tuple(result.keys()), result.fetchall()).to_dicts()
+
+    async def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Json]]:
+        # stream() uses a server side cursor, yield_per sets the size of the batches
+        result = await self.connection.stream(
+            query, bind_params, execution_options={"yield_per": batch_size}
+        )
+        keys = tuple(result.keys())
+        async for partition in result.partitions():
+            yield Rows(keys, partition).to_dicts()
+
+    async def copy_to(
+        self, query: Executable, output: CopyOutput, format: CopyFormat = "csv"
+    ) -> None:
+        # COPY is not supported by SQLAlchemy, use the asyncpg connection directly
+        raw_connection = await self.connection.get_raw_connection()
+        await copy_from_query(
+            raw_connection.driver_connection, compile(query), output, format
+        )
+
+    async def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        raw_connection = await self.connection.get_raw_connection()
+        await copy_to_table(
+            raw_connection.driver_connection, table, columns, source, format
+        )
 
     @asynccontextmanager
     async def transaction(self) -> AsyncIterator[SQLProvider]:  # type: ignore
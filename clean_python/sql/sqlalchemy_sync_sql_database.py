@@ -1,7 +1,14 @@
+import io
+import json
 import re
+import time
+from collections.abc import Iterable
 from collections.abc import Iterator
+from collections.abc import Sequence
 from contextlib import contextmanager
+from functools import partial
 from typing import Any
+from typing import BinaryIO
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Connection
@@ -10,11 +17,19 @@ from sqlalchemy.exc import DBAPIError
 from sqlalchemy.sql import Executable
 
 from clean_python import Json
+from clean_python import Rows
 
+from .query_instrumentation import SyncQueryInstrumentation
+from .sql_builder import Explain
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
+from .sql_provider import quote_table_name
 from .sql_provider import SyncSQLDatabase
 from .sql_provider import SyncSQLProvider
 from .sqlalchemy_async_sql_database import maybe_raise_already_exists
 from .sqlalchemy_async_sql_database import maybe_raise_conflict
+from .sqlalchemy_async_sql_database import maybe_raise_deadline_exceeded
+from .sqlalchemy_async_sql_database import statement_timeout_query
 
 __all__ = ["SQLAlchemySyncSQLDatabase"]
 
@@ -24,13 +39,87 @@ UNIQUE_VIOLATION_DETAIL_REGEX = re.compile(
 )
 
 
+COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def to_array_literal(values: list[Any]) -> str:
+    """Render a list as a PostgreSQL ARRAY literal, like '{"a","b c",NULL}'"""
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append("NULL")
+        elif isinstance(value, list):
+            elements.append(to_array_literal(value))
+        else:
+            if isinstance(value, bool):
+                value = "t" if value else "f"
+            elif isinstance(value, dict):
+                value = json.dumps(value)
+            quoted = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{quoted}"')
+    return "{" + ",".join(elements) + "}"
+
+
+def to_copy_text(value: Any) -> str:
+    """Render a value in the text format of COPY"""
+    if value is None:
+        return "\\N"
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    elif isinstance(value, list):
+        value = to_array_literal(value)
+    return str(value).translate(COPY_TEXT_ESCAPES)
+
+
+class IterableReader(io.RawIOBase):
+    """A binary file that lazily reads from an iterable of chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def records_to_copy_text(records: Iterable[Sequence[Any]]) -> io.BufferedReader:
+    lines = (
+        ("\t".join(to_copy_text(x) for x in record) + "\n").encode()
+        for record in records
+    )
+    return io.BufferedReader(IterableReader(lines))
+
+
 class SQLAlchemySyncSQLDatabase(SyncSQLDatabase):
     engine: Engine
 
-    def __init__(self, url: str, **kwargs):
+    def __init__(
+        self,
+        url: str,
+        instrumentation: SyncQueryInstrumentation | None = None,
+        **kwargs,
+    ):
         kwargs.setdefault("isolation_level", "REPEATABLE READ")
         self.url = url
         self.engine = create_engine(f"postgresql://{url}", **kwargs)
+        self.instrumentation = instrumentation
+
+    def _observe_pool_wait(self, start: float) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.observe_pool_wait(time.monotonic() - start)
 
     def dispose(self) -> None:
         self.engine.dispose()
@@ -41,42 +130,171 @@ class SQLAlchemySyncSQLDatabase(SyncSQLDatabase):
         with self.transaction() as transaction:
             return transaction.execute(query, bind_params)
 
+    def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        with self.transaction() as transaction:
+            return transaction.execute_rows(query, bind_params)
+
+    def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[list[Json]]:
+        with self.transaction() as transaction:
+            yield from transaction.iter_execute(query, bind_params, batch_size)
+
+    def copy_to(
+        self, query: Executable, output: BinaryIO, format: CopyFormat = "csv"
+    ) -> None:
+        with self.transaction() as transaction:
+            transaction.copy_to(query, output, format)
+
+    def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        with self.transaction() as transaction:
+            transaction.copy_from(table, columns, source, format)
+
     @contextmanager
     def transaction(self) -> Iterator[SyncSQLProvider]:  # type: ignore
+        start = time.monotonic()
         with self.engine.connect() as connection:
+            self._observe_pool_wait(start)
             with connection.begin():
-                yield SQLAlchemySyncSQLTransaction(connection)
+                # the timeout applies to each statement in the transaction
+                query = statement_timeout_query()
+                if query is not None:
+                    connection.execute(query)
+                yield SQLAlchemySyncSQLTransaction(connection, self.instrumentation)
 
     @contextmanager
     def testing_transaction(self) -> Iterator[SyncSQLProvider]:  # type: ignore
         with self.engine.connect() as connection:
             with connection.begin() as transaction:
-                yield SQLAlchemySyncSQLTransaction(connection)
+                yield SQLAlchemySyncSQLTransaction(connection, self.instrumentation)
                 transaction.rollback()
 
     def execute_autocommit(self, query: Executable) -> None:
-        engine = create_engine(f"postgresql://{self.url}", isolation_level="AUTOCOMMIT")
-        with engine.connect() as connection:
+        # the isolation level is reset when the connection is returned to the pool
+        with self.engine.connect() as connection:
+            connection.execution_options(isolation_level="AUTOCOMMIT")
             connection.execute(query)
-        engine.dispose()
+
+    @contextmanager
+    def session(self) -> Iterator[SyncSQLProvider]:  # type: ignore
+        start = time.monotonic()
+        with self.engine.connect() as connection:
+            self._observe_pool_wait(start)
+            connection.execution_options(isolation_level="AUTOCOMMIT")
+            yield SQLAlchemySyncSQLTransaction(connection, self.instrumentation)
 
 
 class SQLAlchemySyncSQLTransaction(SyncSQLProvider):
-    def __init__(self, connection: Connection):
+    def __init__(
+        self,
+        connection: Connection,
+        instrumentation: SyncQueryInstrumentation | None = None,
+    ):
         self.connection = connection
+        self.instrumentation = instrumentation
 
     def execute(
         self, query: Executable, bind_params: dict[str, Any] | None = None
     ) -> list[Json]:
+        return (self.execute_rows(query, bind_params)).to_dicts()
+
+    def execute_rows(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> Rows:
+        start = time.monotonic()
         try:
             result = self.connection.execute(query, bind_params)
         except DBAPIError as e:
             maybe_raise_conflict(e)
             maybe_raise_already_exists(e)
+            maybe_raise_deadline_exceeded(e)
             raise e
-        # _asdict() is a documented method of a NamedTuple
-        # https://docs.python.org/3/library/collections.html#collections.somenamedtuple._asdict
-        return [x._asdict() for x in result.fetchall()]
+        if result.returns_rows:
+            # Row objects are tuples, the keys are stored once in the result
+            keys, values = tuple(result.keys()), result.fetchall()
+        else:
+            # for instance DDL
+            keys, values = (), []
+        if self.instrumentation is not None:
+            self.instrumentation.observe(
+                query,
+                result.context.statement,
+                time.monotonic() - start,
+                len(values),
+                partial(self._explain, query, bind_params),
+            )
+        return Rows(keys, values)
+
+    def _explain(
+        self, query: Executable, bind_params: dict[str, Any] | None
+    ) -> list[Json]:
+        # a savepoint, so that errors do not abort the transaction
+        with self.connection.begin_nested():
+            analyzed = Explain(query, analyze=True)
+            result = self.connection.execute(analyzed, bind_params)
+            return Rows(tuple(result.keys()), result.fetchall()).to_dicts()
+
+    def iter_execute(
+        self,
+        query: Executable,
+        bind_params: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[list[Json]]:
+        # yield_per implies a server side cursor and sets the size of the batches
+        result = self.connection.execute(
+            query, bind_params, execution_options={"yield_per": batch_size}
+        )
+        keys = tuple(result.keys())
+        for partition in result.partitions():
+            yield Rows(keys, partition).to_dicts()
+
+    def copy_to(
+        self, query: Executable, output: BinaryIO, format: CopyFormat = "csv"
+    ) -> None:
+        # COPY does not accept parameters, so let psycopg2 render them
+        compiled = query.compile(  # type: ignore
+            dialect=self.connection.dialect,
+            compile_kwargs={"render_postcompile": True},
+        )
+        options = "FORMAT csv, HEADER" if format == "csv" else f"FORMAT {format}"
+        cursor = self.connection.connection.cursor()
+        try:
+            sql = cursor.mogrify(str(compiled), compiled.params).decode()
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH ({options})", output)
+        finally:
+            cursor.close()
+
+    def copy_from(
+        self,
+        table: str,
+        columns: Sequence[str],
+        source: CopyInput,
+        format: CopyFormat = "csv",
+    ) -> None:
+        if not hasattr(source, "read"):
+            # psycopg2 only streams files, so render the records in the text format
+            source, format = records_to_copy_text(source), "text"
+        options = "FORMAT csv, HEADER" if format == "csv" else f"FORMAT {format}"
+        quoted = ", ".join(f'"{x}"' for x in columns)
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {quote_table_name(table)} ({quoted}) FROM STDIN WITH ({options})",
+                source,
+            )
+        finally:
+            cursor.close()
 
     @contextmanager
     def transaction(self) -> Iterator[SyncSQLProvider]:  # type: ignore
@@ -1,20 +1,38 @@
 # (c) Nelen & Schuurmans
+from collections.abc import Callable
+from collections.abc import Iterator
 from datetime import datetime
+from typing import BinaryIO
+from typing import Literal
 from typing import TypeVar
+from uuid import uuid4
 
 import inject
 from sqlalchemy import Table
+from sqlalchemy.sql import Executable
 
+from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
 from clean_python import Id
 from clean_python import Json
 from clean_python import Mapper
+from clean_python import Metric
+from clean_python import now
 from clean_python import PageOptions
+from clean_python import Rows
 from clean_python import SyncGateway
+from clean_python.base.domain.gateway import project
 
+from .sql_builder import EXISTS_LABEL
+from .sql_builder import in_batch_order
+from .sql_builder import OnConflict
 from .sql_builder import SQLBuilder
+from .sql_builder import TOTAL_LABEL
+from .sql_gateway import ImportResult
+from .sql_provider import CopyFormat
+from .sql_provider import CopyInput
 from .sql_provider import SyncSQLDatabase
 from .sql_provider import SyncSQLProvider
 
@@ -25,14 +43,21 @@ T = TypeVar("T", bound="SyncSQLGateway")
 
 
 class SyncSQLGateway(SyncGateway):
+    table: Table
     builder: SQLBuilder
     mapper: Mapper = Mapper()
+    batch_size: int = 1000
+    # see SQLGateway.total_mode
+    total_mode: Literal["count", "window", "estimate"] = "count"
 
     def __init__(self, provider_override: SyncSQLProvider | None = None):
         self.provider_override = provider_override
 
-    def __init_subclass__(cls, table: Table, multitenant: bool = False) -> None:
-        cls.builder = SQLBuilder(table, multitenant)
+    def __init_subclass__(
+        cls, table: Table, multitenant: bool = False, array_params: bool = False
+    ) -> None:
+        cls.table = table
+        cls.builder = SQLBuilder(table, multitenant, array_params)
         super().__init_subclass__()
 
     @property
@@ -44,18 +69,45 @@ class SyncSQLGateway(SyncGateway):
         (row,) = self.provider.execute(query)
         return self.mapper.to_internal(row)
 
+    def add_many(self, items: list[Json]) -> list[Json]:
+        return self._execute_batches(self.builder.insert_many, items)
+
+    def _execute_batches(
+        self, func: Callable[[list[Json]], Executable], items: list[Json]
+    ) -> list[Json]:
+        external = [self.mapper.to_external(x) for x in items]
+        batches = list(self.builder.batches(external, self.batch_size))
+        if not batches:
+            return []
+        elif len(batches) == 1:
+            rows = self.provider.execute(func(batches[0]))
+            rows = in_batch_order(batches[0], rows)
+        else:
+            rows = []
+            with self.provider.transaction() as transaction:
+                for batch in batches:
+                    batch_rows = transaction.execute(func(batch))
+                    rows.extend(in_batch_order(batch, batch_rows))
+        return [self.mapper.to_internal(x) for x in rows]
+
     def update(self, item: Json, if_unmodified_since: datetime | None = None) -> Json:
         id_ = item.get("id")
         if id_ is None:
             raise DoesNotExist("record", id_)
-        query = self.builder.update(
-            id_, self.mapper.to_external(item), if_unmodified_since
-        )
-        rows = self.provider.execute(query)
+        external = self.mapper.to_external(item)
+        if if_unmodified_since is None:
+            rows = self.provider.execute(self.builder.update(id_, external, None))
+        else:
+            # a single statement that also tells a conflict apart from a missing record
+            query = self.builder.update_if_unmodified_since(
+                id_, external, if_unmodified_since
+            )
+            (row,) = self.provider.execute(query)
+            exists = row.pop(EXISTS_LABEL)
+            if row["id"] is None and exists:
+                raise Conflict()
+            rows = [] if row["id"] is None else [row]
         if not rows:
-            if if_unmodified_since is not None:
-                if self.exists([Filter.for_id(id_)]):
-                    raise Conflict()
             raise DoesNotExist("record", id_)
         assert len(rows) == 1
         return self.mapper.to_internal(rows[0])
@@ -67,19 +119,190 @@ class SyncSQLGateway(SyncGateway):
         (row,) = self.provider.execute(query)
         return self.mapper.to_internal(row)
 
+    def upsert_many(self, items: list[Json]) -> list[Json]:
+        return self._execute_batches(self.builder.upsert_many, items)
+
     def remove(self, id: Id) -> bool:
         return bool(self.provider.execute(self.builder.delete(id)))
 
+    def remove_filtered(self, filters: list[Filter]) -> int:
+        (row,) = self.provider.execute(self.builder.delete_filtered(filters))
+        return row["count"]
+
+    def update_filtered(self, filters: list[Filter], values: Json) -> int:
+        if "updated_at" in self.table.c:
+            # like RootEntity.update
+            values = {"updated_at": now(), **values}
+        if type(self.mapper) is not Mapper:
+            # a custom mapper works on complete records: update them one by one
+            return super().update_filtered(filters, values)
+        query = self.builder.update_filtered(filters, values)
+        (row,) = self.provider.execute(query)
+        return row["count"]
+
+    def claim(
+        self, filters: list[Filter], limit: int, values: Json | None = None
+    ) -> list[Json]:
+        """Claim up to `limit` matching records that are not locked by others.
+
+        Rows that are locked by concurrent workers are skipped (FOR UPDATE SKIP
+        LOCKED) instead of waited for. With `values`, the claimed records are updated
+        in the same statement, for instance to mark them as being processed. Without,
+        the records stay locked until the end of the transaction, so then use this
+        with a transaction as provider.
+        """
+        if values:
+            query = self.builder.claim(filters, limit, self.mapper.to_external(values))
+        else:
+            query = self.builder.select(
+                filters, PageOptions(limit=limit), for_update=True, skip_locked=True
+            )
+        rows = self.provider.execute(query)
+        return [self.mapper.to_internal(x) for x in rows]
+
     def filter(
-        self, filters: list[Filter], params: PageOptions | None = None
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
     ) -> list[Json]:
-        query = self.builder.select(filters, params)
+        if fields is not None and type(self.mapper) is not Mapper:
+            # a custom mapper works on complete records: project after mapping
+            return project(self.filter(filters, params), fields)
+        query = self.builder.select(filters, params, fields=fields)
         rows = self.provider.execute(query)
+        if not rows:
+            self._check_cursor(params)
         return [self.mapper.to_internal(x) for x in rows]
 
+    def _check_cursor(self, params: PageOptions | None) -> None:
+        # see SQLGateway._check_cursor
+        if params is None or params.cursor is None:
+            return
+        if all(x.field == "id" for x in params.sort_keys()):
+            return
+        if not self.exists([Filter.for_id(params.cursor)]):
+            raise BadRequest(
+                f"record with id={params.cursor} does not exist", loc=("cursor",)
+            )
+
+    def filter_rows(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> Rows:
+        if type(self.mapper) is not Mapper:
+            # a custom mapper works on dictionaries
+            return super().filter_rows(filters, params, fields=fields)
+        query = self.builder.select(filters, params, fields=fields)
+        result = self.provider.execute_rows(query)
+        if not result.values:
+            self._check_cursor(params)
+        return result
+
+    def iter_filter(
+        self, filters: list[Filter], batch_size: int = 1000
+    ) -> Iterator[Json]:
+        """Iterate over all matching records using a server side cursor"""
+        query = self.builder.select(filters)
+        for rows in self.provider.iter_execute(query, batch_size=batch_size):
+            for row in rows:
+                yield self.mapper.to_internal(row)
+
+    def filter_with_total(
+        self,
+        filters: list[Filter],
+        params: PageOptions | None = None,
+        fields: list[str] | None = None,
+    ) -> tuple[list[Json], int]:
+        if params is None or self.total_mode == "count":
+            return super().filter_with_total(filters, params, fields=fields)
+        elif self.total_mode == "estimate":
+            result = self.filter(filters, params, fields=fields)
+            if (
+                params.offset == 0
+                and params.cursor is None
+                and len(result) < params.limit
+            ):
+                return result, len(result)
+            return result, self.estimate_count(filters)
+        elif params.cursor is not None or (
+            fields is not None and type(self.mapper) is not Mapper
+        ):
+            # the window would only count the records after the cursor, and a custom
+            # mapper requires complete records (see filter)
+            return super().filter_with_total(filters, params, fields=fields)
+        query = self.builder.select(filters, params, with_total=True, fields=fields)
+        rows = self.provider.execute(query)
+        if rows:
+            total = rows[0][TOTAL_LABEL]
+        else:
+            # no records on this page, so the window function wasn't evaluated
+            total = 0 if params.offset == 0 else self.count(filters)
+        result = [
+            self.mapper.to_internal({k: v for (k, v) in x.items() if k != TOTAL_LABEL})
+            for x in rows
+        ]
+        return result, total
+
     def count(self, filters: list[Filter]) -> int:
         (row,) = self.provider.execute(self.builder.count(filters))
         return row["count"]
 
+    def aggregate(
+        self, filters: list[Filter], group_by: list[str], metrics: list[Metric]
+    ) -> list[Json]:
+        if type(self.mapper) is not Mapper:
+            # the fields are mapped on complete records: aggregate after mapping
+            return super().aggregate(filters, group_by, metrics)
+        # the result consists of groups and metrics, the fields are the column names
+        query = self.builder.aggregate(filters, group_by, metrics)
+        return self.provider.execute(query)
+
+    def export(
+        self,
+        filters: list[Filter],
+        output: BinaryIO,
+        format: CopyFormat = "csv",
+        fields: list[str] | None = None,
+    ) -> None:
+        """Write the matching rows to a file using COPY, for bulk exports.
+
+        `output` is a binary file, for instance a SyncS3Gateway.multipart_writer. The
+        rows are written as they are in the database: the mapper is not applied.
+        """
+        query = self.builder.select(filters, fields=fields)
+        self.provider.copy_to(query, output, format)
+
+    def import_rows(
+        self,
+        source: CopyInput,
+        columns: list[str],
+        on_conflict: OnConflict = "error",
+        format: CopyFormat = "csv",
+    ) -> ImportResult:
+        """Load rows using COPY, for bulk imports.
+
+        See SQLGateway.import_rows.
+        """
+        staging = f"import_{uuid4().hex}"
+        with self.provider.transaction() as provider:
+            provider.execute(self.builder.create_staging_table(staging, columns))
+            provider.copy_from(staging, columns, source, format)
+            (row,) = provider.execute(
+                self.builder.merge_staging_table(staging, columns, on_conflict)
+            )
+        return ImportResult(**row)
+
+    def estimate_count(self, filters: list[Filter]) -> int:
+        """Estimate the number of records using the query planner.
+
+        This is much faster than count() on large tables, but it is only accurate if
+        the table statistics are up to date.
+        """
+        rows = self.provider.execute(self.builder.estimate_count(filters))
+        return self.builder.parse_estimate_count(rows)
+
     def exists(self, filters: list[Filter]) -> bool:
         return len(self.provider.execute(self.builder.exists(filters))) > 0
@@ -1,5 +1,6 @@
 from collections.abc import AsyncIterator
 from collections.abc import Iterator
+from collections.abc import Sequence
 from contextlib import asynccontextmanager
 from contextlib import contextmanager
 from typing import Any
@@ -29,6 +30,10 @@ class FakeSQLDatabase(SQLProvider):
         self.queries.append([query])
         return self.result()
 
+    async def execute_many(self, queries: Sequence[Executable]) -> list[list[Json]]:
+        self.queries.append(list(queries))
+        return [self.result() for _ in queries]
+
     @asynccontextmanager
     async def transaction(self) -> AsyncIterator["SQLProvider"]:  # type: ignore
         x = FakeSQLTransaction(result=self.result)
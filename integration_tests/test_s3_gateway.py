@@ -122,14 +122,17 @@ async def test_remove_multiple_empty_list(s3_gateway: S3Gateway, s3_bucket):
 
 
 async def test_remove_filtered_all(s3_gateway: S3Gateway, multiple_objects):
-    await s3_gateway.remove_filtered([])
+    assert await s3_gateway.remove_filtered([]) == 4
 
     for key in multiple_objects:
         assert await s3_gateway.get(key) is None
 
 
 async def test_remove_filtered_prefix(s3_gateway: S3Gateway, multiple_objects):
-    await s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    actual = await s3_gateway.remove_filtered(
+        [Filter(field="prefix", values=["raster-2/"])]
+    )
+    assert actual == 3
 
     assert await s3_gateway.get(multiple_objects[0]) is not None
     for key in multiple_objects[1:]:
@@ -138,7 +141,10 @@ async def test_remove_filtered_prefix(s3_gateway: S3Gateway, multiple_objects):
 
 @mock.patch("clean_python.s3.s3_gateway.AWS_LIMIT", new=1)
 async def test_remove_filtered_pagination(s3_gateway: S3Gateway, multiple_objects):
-    await s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    actual = await s3_gateway.remove_filtered(
+        [Filter(field="prefix", values=["raster-2/"])]
+    )
+    assert actual == 3
 
     assert await s3_gateway.get(multiple_objects[0]) is not None
     for key in multiple_objects[1:]:
@@ -194,3 +200,11 @@ async def test_get(s3_gateway: S3Gateway, object_in_s3):
 async def test_get_does_not_exist(s3_gateway: S3Gateway):
     actual = await s3_gateway.get("non-existing")
     assert actual is None
+
+
+async def test_multipart_writer(s3_gateway: S3Gateway):
+    async with s3_gateway.multipart_writer("export.csv") as writer:
+        await writer.write(b"foo")
+        await writer.write(b"bar")
+
+    assert (await s3_gateway.get("export.csv"))["size"] == 6
@@ -146,3 +146,51 @@ async def test_handle_integrity_error(
         await database_with_cleanup.execute(
             insert_query_with_id, bind_params={"id": record_id}
         )
+
+
+async def test_iter_execute(database_with_cleanup: SQLDatabase):
+    db = database_with_cleanup
+    for _ in range(5):
+        await db.execute(insert_query)
+
+    batches = [
+        x
+        async for x in db.iter_execute(text("SELECT id FROM test_model"), batch_size=2)
+    ]
+    assert [len(x) for x in batches] == [2, 2, 1]
+
+
+async def test_execute_many(database_with_cleanup: SQLDatabase):
+    db = database_with_cleanup
+    await db.execute(insert_query)
+
+    assert await db.execute_many([count_query, count_query]) == [
+        [{"count": 1}],
+        [{"count": 1}],
+    ]
+
+
+async def test_execute_rows(database_with_cleanup: SQLDatabase, record_id: int):
+    rows = await database_with_cleanup.execute_rows(
+        text("SELECT id, t FROM test_model")
+    )
+    assert rows.keys == ("id", "t")
+    assert [tuple(x) for x in rows.values] == [(record_id, "foo")]
+
+
+async def test_advisory_lock(database: SQLDatabase):
+    async with database.advisory_lock(42) as acquired:
+        assert acquired
+        async with database.advisory_lock(42, wait=False) as acquired_again:
+            assert not acquired_again
+    async with database.advisory_lock(42, wait=False) as acquired:
+        assert acquired
+
+
+async def test_advisory_xact_lock(database: SQLDatabase):
+    async with database.transaction() as transaction:
+        assert await transaction.advisory_xact_lock(42)
+        async with database.advisory_lock(42, wait=False) as acquired:
+            assert not acquired
+    async with database.advisory_lock(42, wait=False) as acquired:
+        assert acquired
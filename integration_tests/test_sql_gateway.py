@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 # (c) Nelen & Schuurmans
+import io
 from datetime import datetime
 from datetime import timezone
 
@@ -9,10 +10,14 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import text
 
 from clean_python import AlreadyExists
+from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
+from clean_python import Metric
+from clean_python import PageOptions
 from clean_python.sql import AsyncpgSQLDatabase
+from clean_python.sql import ImportResult
 from clean_python.sql import SQLAlchemyAsyncSQLDatabase
 from clean_python.sql import SQLDatabase
 from clean_python.sql import SQLGateway
@@ -224,6 +229,16 @@ async def test_filter(filters, match, sql_gateway, obj_in_db):
     assert actual == ([obj_in_db] if match else [])
 
 
+@pytest.mark.parametrize("ascending", [True, False])
+async def test_filter_nullable_order_missing_cursor(sql_gateway, obj_in_db, ascending):
+    # the NULL value of the missing cursor record must not match NULL rows
+    params = PageOptions(
+        limit=10, order_by="n", ascending=ascending, cursor=obj_in_db["id"] + 1000
+    )
+    with pytest.raises(BadRequest):
+        await sql_gateway.filter([], params)
+
+
 @pytest.fixture
 async def obj2_in_db(test_transaction, obj):
     res = await test_transaction.execute(
@@ -270,3 +285,58 @@ async def test_truncate(database: SQLDatabase, obj):
     assert await gateway.exists([])
     await database.truncate_tables(["test_model"])
     assert not await gateway.exists([])
+
+
+async def test_aggregate(sql_gateway, obj_in_db, obj2_in_db):
+    actual = await sql_gateway.aggregate(
+        [],
+        ["b"],
+        [Metric(function="count"), Metric(function="max", field="f")],
+    )
+    assert actual == [{"b": True, "count": 2, "max_f": 1.24}]
+
+
+async def test_claim(sql_gateway, obj_in_db, obj2_in_db):
+    actual = await sql_gateway.claim([Filter(field="b", values=[True])], 1, {"n": 2})
+    assert [x["id"] for x in actual] == [obj_in_db["id"]]
+    assert actual[0]["n"] == 2
+    actual = await sql_gateway.claim([Filter(field="t", values=["bar"])], 5)
+    assert [x["id"] for x in actual] == [obj2_in_db["id"]]
+
+
+async def test_export(sql_gateway, obj_in_db, obj2_in_db):
+    output = io.BytesIO()
+    await sql_gateway.export(
+        [Filter(field="t", values=["bar"])], output, fields=["id", "t"]
+    )
+    assert output.getvalue() == f"id,t\n{obj2_in_db['id']},bar\n".encode()
+
+
+async def test_import_rows(sql_gateway, obj_in_db):
+    source = io.BytesIO(
+        f"id,t,f,b,updated_at\n"
+        f"{obj_in_db['id']},bar,2.5,false,2020-01-01T00:00:00Z\n"
+        f"{obj_in_db['id'] + 1000},baz,1.5,true,2020-01-01T00:00:00Z\n".encode()
+    )
+    actual = await sql_gateway.import_rows(
+        source, ["id", "t", "f", "b", "updated_at"], on_conflict="update"
+    )
+    assert actual == ImportResult(inserted=1, updated=1)
+    assert (await sql_gateway.get(obj_in_db["id"]))["t"] == "bar"
+    assert (await sql_gateway.get(obj_in_db["id"] + 1000))["t"] == "baz"
+
+
+async def test_import_rows_records(sql_gateway, obj_in_db):
+    updated_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    new_id = obj_in_db["id"] + 1000
+    actual = await sql_gateway.import_rows(
+        [
+            (obj_in_db["id"], "bar", 2.5, False, updated_at),
+            (new_id, "baz", 1.5, True, updated_at),
+        ],
+        ["id", "t", "f", "b", "updated_at"],
+        on_conflict="ignore",
+    )
+    assert actual == ImportResult(inserted=1, updated=0)
+    assert (await sql_gateway.get(obj_in_db["id"]))["t"] == "foo"
+    assert (await sql_gateway.get(new_id))["t"] == "baz"
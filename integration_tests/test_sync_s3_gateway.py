@@ -159,14 +159,15 @@ def test_create_multipart_upload_url(s3_gateway: SyncS3Gateway, object_in_s3):
 
 
 def test_remove_filtered_all(s3_gateway: SyncS3Gateway, multiple_objects):
-    s3_gateway.remove_filtered([])
+    assert s3_gateway.remove_filtered([]) == 4
 
     for key in multiple_objects:
         assert s3_gateway.get(key) is None
 
 
 def test_remove_filtered_prefix(s3_gateway: SyncS3Gateway, multiple_objects):
-    s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    actual = s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    assert actual == 3
 
     assert s3_gateway.get(multiple_objects[0]) is not None
     for key in multiple_objects[1:]:
@@ -175,7 +176,8 @@ def test_remove_filtered_prefix(s3_gateway: SyncS3Gateway, multiple_objects):
 
 @mock.patch("clean_python.s3.s3_gateway.AWS_LIMIT", new=1)
 def test_remove_filtered_pagination(s3_gateway: SyncS3Gateway, multiple_objects):
-    s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    actual = s3_gateway.remove_filtered([Filter(field="prefix", values=["raster-2/"])])
+    assert actual == 3
 
     assert s3_gateway.get(multiple_objects[0]) is not None
     for key in multiple_objects[1:]:
@@ -229,3 +231,11 @@ def test_get(s3_gateway: SyncS3Gateway, object_in_s3):
 def test_get_does_not_exist(s3_gateway: SyncS3Gateway):
     actual = s3_gateway.get("non-existing")
     assert actual is None
+
+
+def test_multipart_writer(s3_gateway: SyncS3Gateway):
+    with s3_gateway.multipart_writer("export.csv") as writer:
+        writer.write(b"foo")
+        writer.write(b"bar")
+
+    assert s3_gateway.get("export.csv")["size"] == 6
@@ -143,3 +143,18 @@ def test_handle_integrity_error(database_with_cleanup: SQLDatabase, record_id: i
         database_with_cleanup.execute(
             insert_query_with_id, bind_params={"id": record_id}
         )
+
+
+def test_iter_execute(database_with_cleanup):
+    db = database_with_cleanup
+    for _ in range(5):
+        db.execute(insert_query)
+
+    batches = list(db.iter_execute(text("SELECT id FROM test_model"), batch_size=2))
+    assert [len(x) for x in batches] == [2, 2, 1]
+
+
+def test_execute_rows(database_with_cleanup, record_id: int):
+    rows = database_with_cleanup.execute_rows(text("SELECT id, t FROM test_model"))
+    assert rows.keys == ("id", "t")
+    assert [tuple(x) for x in rows.values] == [(record_id, "foo")]
@@ -1,4 +1,5 @@
 # This module is a copy paste of test_sql_gateway.py
+import io
 from datetime import datetime
 from datetime import timezone
 
@@ -10,6 +11,7 @@ from clean_python import AlreadyExists
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
+from clean_python.sql import ImportResult
 from clean_python.sql import SyncSQLGateway
 from clean_python.sql.sqlalchemy_sync_sql_database import SQLAlchemySyncSQLDatabase
 
@@ -258,3 +260,39 @@ def test_truncate(database, obj):
     assert gateway.exists([])
     database.truncate_tables(["test_model"])
     assert not gateway.exists([])
+
+
+def test_export(sql_gateway, obj_in_db, obj2_in_db):
+    output = io.BytesIO()
+    sql_gateway.export([Filter(field="t", values=["bar"])], output, fields=["id", "t"])
+    assert output.getvalue() == f"id,t\n{obj2_in_db['id']},bar\n".encode()
+
+
+def test_import_rows(sql_gateway, obj_in_db):
+    source = io.BytesIO(
+        f"id,t,f,b,updated_at\n"
+        f"{obj_in_db['id']},bar,2.5,false,2020-01-01T00:00:00Z\n"
+        f"{obj_in_db['id'] + 1000},baz,1.5,true,2020-01-01T00:00:00Z\n".encode()
+    )
+    actual = sql_gateway.import_rows(
+        source, ["id", "t", "f", "b", "updated_at"], on_conflict="update"
+    )
+    assert actual == ImportResult(inserted=1, updated=1)
+    assert sql_gateway.get(obj_in_db["id"])["t"] == "bar"
+    assert sql_gateway.get(obj_in_db["id"] + 1000)["t"] == "baz"
+
+
+def test_import_rows_records(sql_gateway, obj_in_db):
+    updated_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    new_id = obj_in_db["id"] + 1000
+    actual = sql_gateway.import_rows(
+        [
+            (obj_in_db["id"], "bar", 2.5, False, updated_at),
+            (new_id, "baz", 1.5, True, updated_at),
+        ],
+        ["id", "t", "f", "b", "updated_at"],
+        on_conflict="ignore",
+    )
+    assert actual == ImportResult(inserted=1, updated=0)
+    assert sql_gateway.get(obj_in_db["id"])["t"] == "foo"
+    assert sql_gateway.get(new_id)["t"] == "baz"
@@ -7,10 +7,12 @@ from pydantic import ValidationError
 
 from clean_python import BadRequest
 from clean_python import Conflict
+from clean_python import DeadlineExceeded
 from clean_python import DoesNotExist
 from clean_python import PermissionDenied
 from clean_python import Unauthorized
 from clean_python.fastapi.error_responses import conflict_handler
+from clean_python.fastapi.error_responses import deadline_exceeded_handler
 from clean_python.fastapi.error_responses import not_found_handler
 from clean_python.fastapi.error_responses import permission_denied_handler
 from clean_python.fastapi.error_responses import unauthorized_handler
@@ -38,6 +40,16 @@ async def test_conflict():
     assert json.loads(actual.body) == {"message": "Conflict", "detail": "foo"}
 
 
+async def test_deadline_exceeded():
+    actual = await deadline_exceeded_handler(None, DeadlineExceeded())
+
+    assert actual.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert json.loads(actual.body) == {
+        "message": "Deadline exceeded",
+        "detail": "the request deadline was exceeded",
+    }
+
+
 async def test_conflict_no_msg():
     actual = await conflict_handler(None, Conflict())
 
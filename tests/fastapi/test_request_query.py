@@ -10,10 +10,18 @@ from fastapi.testclient import TestClient
 from pydantic import field_validator
 from pydantic import ValidationError
 
+from clean_python import BadRequest
+from clean_python import BetweenFilter
 from clean_python import ComparisonFilter
+from clean_python import ContainsFilter
 from clean_python import Filter
+from clean_python import ILikeFilter
 from clean_python import InMemoryGateway
+from clean_python import IsNullFilter
+from clean_python import NotFilter
 from clean_python import PageOptions
+from clean_python import PrefixFilter
+from clean_python import SortKey
 from clean_python.fastapi import get
 from clean_python.fastapi import RequestQuery
 from clean_python.fastapi import Resource
@@ -35,6 +43,12 @@ class SomeListQuery(RequestQuery):
     foo: Optional[List[int]]
 
 
+class MultiSortQuery(RequestQuery):
+    ORDER_BY_FIELDS = frozenset({"id", "created_at", "name"})
+
+    order_by: str = Query(default="id")
+
+
 @pytest.mark.parametrize(
     "query,expected",
     [
@@ -90,11 +104,51 @@ def test_filters_comparison(values, expected):
     assert ComparisonQuery(**values).filters() == [expected]
 
 
+class OperatorQuery(RequestQuery):
+    x__not: list[int] | None = None
+    x__isnull: bool | None = None
+    x__between: list[int] | None = None
+    x__prefix: str | None = None
+    x__ilike: str | None = None
+    x__contains: list[str] | None = None
+
+
+@pytest.mark.parametrize(
+    "values,expected",
+    [
+        ({"x__not": [1, 2]}, NotFilter(filters=[Filter(field="x", values=[1, 2])])),
+        ({"x__isnull": True}, IsNullFilter(field="x")),
+        ({"x__isnull": False}, NotFilter(filters=[IsNullFilter(field="x")])),
+        ({"x__between": [1, 2]}, BetweenFilter(field="x", values=[1, 2])),
+        ({"x__prefix": "ab"}, PrefixFilter(field="x", values=["ab"])),
+        ({"x__ilike": "%ab%"}, ILikeFilter(field="x", values=["%ab%"])),
+        ({"x__contains": ["a", "b"]}, ContainsFilter(field="x", values=["a", "b"])),
+    ],
+)
+def test_filters_operator(values, expected):
+    assert OperatorQuery(**values).filters() == [expected]
+
+
+def test_filters_operator_invalid():
+    with pytest.raises(BadRequest) as e:
+        OperatorQuery(x__between=[1]).filters()
+
+    assert e.value.errors()[0]["loc"] == ("x",)
+
+
 class FooResource(Resource, version=v(1), name="testing"):
     @get("/query")
     def query(self, q: Annotated[SomeQuery, Query()]):
         return q.model_dump()
 
+    @get("/multi_sort")
+    def multi_sort(self, q: Annotated[MultiSortQuery, Query()]):
+        return q.as_page_options().model_dump()
+
+    @get("/filters")
+    def filters(self, q: Annotated[OperatorQuery, Query()]):
+        return len(q.filters())
+
 
 @pytest.fixture
 def app():
@@ -141,6 +195,14 @@ def test_request_query_foo_err(client: TestClient):
     assert detail["loc"] == ["query", "foo"]
 
 
+def test_request_query_filter_err(client: TestClient):
+    response = client.get("v1/filters", params={"x__between": [1]})
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    (detail,) = response.json()["detail"]
+    assert detail["loc"] == ["x"]
+
+
 def test_request_query_order_by_schema(client: TestClient):
     # the Literal value is correctly reflected as an enum in the openapi spec
     openapi = client.get("v1/openapi.json", params={"order_by": "foo"}).json()
@@ -159,3 +221,53 @@ def test_request_query_order_by_deprecated_enum_arg():
 def test_request_query_order_by_correct_enum_arg():
     class EnumQuery(RequestQuery):
         order_by: Literal["id", "-id"] = Query(default="id")
+
+
+def test_as_page_options_cursor():
+    actual = RequestQuery(limit=10, cursor=5).as_page_options()
+    assert actual == PageOptions(limit=10, offset=0, order_by="id", cursor=5)
+
+
+def test_cursor_is_not_a_filter():
+    assert RequestQuery(cursor=5).filters() == []
+
+
+def test_fields_is_not_a_filter():
+    assert RequestQuery(fields=["name"]).filters() == []
+
+
+def test_request_query_fields(client: TestClient):
+    response = client.get("v1/query", params={"fields": ["id", "name"]})
+
+    assert response.status_code == HTTPStatus.OK, response.json()
+
+    assert response.json()["fields"] == ["id", "name"]
+
+
+def test_as_page_options_multiple_sort():
+    actual = MultiSortQuery(order_by="-created_at,name").as_page_options()
+    assert actual.sort == [
+        SortKey(field="created_at", ascending=False),
+        SortKey(field="name"),
+    ]
+    assert actual.order_by == "created_at"
+    assert actual.ascending is False
+
+
+@pytest.mark.parametrize("order_by", ["name,-created_at,id", " -name , id"])
+def test_order_by_fields(order_by):
+    assert MultiSortQuery(order_by=order_by).order_by == order_by
+
+
+@pytest.mark.parametrize("order_by", ["foo", "name,-foo", "--name", "name,"])
+def test_order_by_fields_err(order_by):
+    with pytest.raises(ValidationError):
+        MultiSortQuery(order_by=order_by)
+
+
+def test_request_query_order_by_fields_err(client: TestClient):
+    response = client.get("v1/multi_sort", params={"order_by": "name,-foo"})
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    (detail,) = response.json()["detail"]
+    assert detail["loc"] == ["query", "order_by"]
@@ -3,6 +3,7 @@ from uuid import UUID
 from uuid import uuid4
 
 import pytest
+from fastapi import Request
 from fastapi.testclient import TestClient
 
 from clean_python import ctx
@@ -11,6 +12,7 @@ from clean_python.fastapi import get
 from clean_python.fastapi import Resource
 from clean_python.fastapi import Service
 from clean_python.fastapi import v
+from clean_python.fastapi.resource import get_request_timeout
 
 
 class FooResource(Resource, version=v(1), name="testing"):
@@ -23,6 +25,14 @@ class FooResource(Resource, version=v(1), name="testing"):
             "correlation_id": str(ctx.correlation_id),
         }
 
+    @get("/deadline")
+    async def deadline(self):
+        return {"time_remaining": ctx.time_remaining()}
+
+    @get("/short_deadline", timeout=0.5)
+    async def short_deadline(self):
+        return {"time_remaining": ctx.time_remaining()}
+
 
 @pytest.fixture
 def app():
@@ -31,6 +41,7 @@ def app():
         description="testing",
         hostname="testserver",
         access_logger_gateway=InMemoryGateway([]),
+        request_timeout=10.0,
     )
 
 
@@ -66,3 +77,45 @@ def test_x_correlation_id_header(app, client: TestClient):
     assert body["correlation_id"] == uid
 
     assert ctx.correlation_id is None
+
+
+def test_deadline(app, client: TestClient):
+    response = client.get(app.url_path_for("v1/deadline"))
+
+    assert response.status_code == HTTPStatus.OK
+    assert 9.0 < response.json()["time_remaining"] <= 10.0
+
+
+@pytest.mark.parametrize(
+    "header,expected", [("2", 2.0), ("20", 10.0), ("0", 10.0), ("foo", 10.0)]
+)
+def test_deadline_header(app, client: TestClient, header, expected):
+    response = client.get(
+        app.url_path_for("v1/deadline"), headers={"X-Request-Timeout": header}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert expected - 1.0 < response.json()["time_remaining"] <= expected
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ([], None),
+        ([(b"x-request-timeout", b"3")], 3.0),
+        # Starlette takes the first of duplicate headers (case insensitive)
+        ([(b"x-request-timeout", b"3"), (b"x-request-timeout", b"5")], 3.0),
+        ([(b"x-request-timeout", b"inf")], None),
+        ([(b"x-request-timeout", b"-1")], None),
+    ],
+)
+def test_get_request_timeout(headers, expected):
+    request = Request({"type": "http", "headers": headers})
+    assert get_request_timeout(request) == expected
+
+
+def test_deadline_route_option(app, client: TestClient):
+    response = client.get(app.url_path_for("v1/short_deadline"))
+
+    assert response.status_code == HTTPStatus.OK
+    assert 0.0 < response.json()["time_remaining"] <= 0.5
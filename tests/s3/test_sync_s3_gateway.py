@@ -78,3 +78,54 @@ def test_create_multipart_upload_url(gateway: SyncS3Gateway, provider: Mock):
         },
         ExpiresIn=DEFAULT_EXPIRY,
     )
+
+
+def test_multipart_writer(gateway: SyncS3Gateway, provider: Mock):
+    client = provider.client
+    client.create_multipart_upload.return_value = {"UploadId": "abc"}
+    client.upload_part.side_effect = [{"ETag": "e1"}, {"ETag": "e2"}]
+
+    with gateway.multipart_writer("export.csv", part_size=4) as writer:
+        writer.write(b"ab")
+        writer.write(b"cde")
+        writer.write(b"f")
+
+    assert [x.kwargs["Body"] for x in client.upload_part.call_args_list] == [
+        b"abcde",
+        b"f",
+    ]
+    client.complete_multipart_upload.assert_called_once_with(
+        Bucket="S3Bucket",
+        Key="export.csv",
+        UploadId="abc",
+        MultipartUpload={
+            "Parts": [{"ETag": "e1", "PartNumber": 1}, {"ETag": "e2", "PartNumber": 2}]
+        },
+    )
+
+
+def test_multipart_writer_empty(gateway: SyncS3Gateway, provider: Mock):
+    provider.client.create_multipart_upload.return_value = {"UploadId": "abc"}
+    provider.client.upload_part.return_value = {"ETag": "e1"}
+
+    with gateway.multipart_writer("export.csv"):
+        pass
+
+    # S3 requires at least one part
+    assert provider.client.upload_part.call_args.kwargs["Body"] == b""
+    assert provider.client.complete_multipart_upload.called
+
+
+def test_multipart_writer_rollback(gateway: SyncS3Gateway, provider: Mock):
+    provider.client.create_multipart_upload.return_value = {"UploadId": "abc"}
+
+    with pytest.raises(ValueError):
+        with gateway.multipart_writer("export.csv") as writer:
+            writer.write(b"ab")
+            raise ValueError()
+
+    assert not provider.client.upload_part.called
+    assert not provider.client.complete_multipart_upload.called
+    provider.client.abort_multipart_upload.assert_called_once_with(
+        Bucket="S3Bucket", Key="export.csv", UploadId="abc"
+    )
@@ -0,0 +1,413 @@
+import asyncio
+import io
+import time
+from unittest import mock
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import select
+from sqlalchemy import Table
+from sqlalchemy import text
+from sqlalchemy import Text
+from sqlalchemy import tuple_
+
+from clean_python import ctx
+from clean_python import DeadlineExceeded
+from clean_python import Filter
+from clean_python import PageOptions
+from clean_python import Tenant
+from clean_python.sql import AsyncpgSQLDatabase
+from clean_python.sql import JsonCodec
+from clean_python.sql import OrjsonCodec
+from clean_python.sql import PoolConfig
+from clean_python.sql import SQLBuilder
+from clean_python.sql import StatementCache
+from clean_python.sql.asyncpg_sql_database import compile
+from clean_python.sql.asyncpg_sql_database import copy_from_query
+from clean_python.sql.asyncpg_sql_database import copy_to_table
+from clean_python.sql.asyncpg_sql_database import fetch
+from clean_python.sql.asyncpg_sql_database import init_db_types
+
+writer = Table(
+    "writer",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("value", Text, nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+    Column("tenant", Integer, nullable=False),
+)
+
+
+@pytest.fixture
+def sql_builder() -> SQLBuilder:
+    return SQLBuilder(writer, multitenant=False)
+
+
+@pytest.fixture
+def cache() -> StatementCache:
+    return StatementCache(max_size=2)
+
+
+@pytest.mark.parametrize(
+    "filters,params",
+    [
+        ([], None),
+        ([Filter(field="value", values=[])], None),
+        ([Filter(field="value", values=["foo"])], None),
+        ([Filter(field="value", values=["foo", "bar"])], None),
+        ([Filter(field="id", values=[1, 2, 3])], PageOptions(limit=5, offset=10)),
+    ],
+)
+def test_compile_equals_uncached(sql_builder, cache, filters, params):
+    query = sql_builder.select(filters, params)
+    assert cache.compile(query) == compile(query)
+    assert cache.compile(query) == compile(query)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_hit_extracts_new_values(sql_builder, cache):
+    cache.compile(sql_builder.select([Filter(field="value", values=["a", "b"])]))
+    query = sql_builder.select([Filter(field="value", values=["c", "d"])])
+    actual = cache.compile(query)
+    assert actual == compile(query)
+    assert actual[1:] == ("c", "d")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_tuple_in_list(cache):
+    query = select(writer).where(
+        tuple_(writer.c.id, writer.c.value).in_([(1, "a"), (2, "b")])
+    )
+    cache.compile(query)
+    query = select(writer).where(
+        tuple_(writer.c.id, writer.c.value).in_([(3, "c"), (4, "d")])
+    )
+    actual = cache.compile(query)
+    assert actual == compile(query)
+    assert actual[1:] == (3, "c", 4, "d")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_in_list_arity_is_part_of_key(sql_builder, cache):
+    cache.compile(sql_builder.select([Filter(field="value", values=["a", "b"])]))
+    query = sql_builder.select([Filter(field="value", values=["a", "b", "c"])])
+    assert cache.compile(query) == compile(query)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_pagination_shape_is_part_of_key(sql_builder, cache):
+    cache.compile(sql_builder.select([], PageOptions(limit=5)))
+    query = sql_builder.select([], PageOptions(limit=5, ascending=False))
+    assert cache.compile(query) == compile(query)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_multitenant(cache):
+    sql_builder = SQLBuilder(writer, multitenant=True)
+    ctx.tenant = Tenant(id=2, name="foo")
+    cache.compile(sql_builder.count([]))
+    ctx.tenant = Tenant(id=3, name="bar")
+    query = sql_builder.count([])
+    assert cache.compile(query)[1:] == (3,)
+    assert (cache.hits, cache.misses) == (1, 1)
+    ctx.tenant = None
+
+
+def test_lru_eviction(sql_builder, cache):
+    cache.compile(sql_builder.count([]))
+    cache.compile(sql_builder.exists([]))
+    cache.compile(sql_builder.count([]))  # moves count to the end
+    cache.compile(sql_builder.delete(2))  # evicts exists
+    assert len(cache) == 2
+    cache.compile(sql_builder.count([]))
+    cache.compile(sql_builder.exists([]))
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_bind_params_bypass_cache(cache):
+    query = text("SELECT :x")
+    assert cache.compile(query, {"x": 3}) == compile(query, {"x": 3})
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_disabled(sql_builder):
+    cache = StatementCache(max_size=0)
+    query = sql_builder.count([])
+    assert cache.compile(query) == compile(query)
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_cache_clear(sql_builder, cache):
+    cache.compile(sql_builder.count([]))
+    cache.cache_clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_array_params_single_statement(cache):
+    sql_builder = SQLBuilder(writer, array_params=True)
+    sql_1, *args_1 = cache.compile(
+        sql_builder.select([Filter(field="id", values=[1, 2])])
+    )
+    sql_2, *args_2 = cache.compile(
+        sql_builder.select([Filter(field="id", values=[1, 2, 3])])
+    )
+    assert sql_1 == sql_2
+    assert "= ANY ($1::INTEGER[])" in sql_1
+    assert args_1 == [[1, 2]]
+    assert args_2 == [[1, 2, 3]]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.fixture
+def pool():
+    pool = mock.Mock()
+    pool.acquire = mock.AsyncMock()
+    pool.release = mock.AsyncMock()
+    pool.get_size.return_value = 3
+    pool.get_idle_size.return_value = 1
+    pool.get_min_size.return_value = 2
+    pool.get_max_size.return_value = 4
+    return pool
+
+
+@pytest.fixture
+def create_pool(pool):
+    with mock.patch("asyncpg.create_pool", new_callable=mock.AsyncMock) as create_pool:
+        create_pool.return_value = pool
+        yield create_pool
+
+
+async def test_pool_config_default(create_pool):
+    db = AsyncpgSQLDatabase("foo", pool_size=3)
+    await db.connect()
+    create_pool.assert_awaited_once()
+    kwargs = create_pool.call_args[1]
+    assert kwargs["min_size"] == 1
+    assert kwargs["max_size"] == 3
+    assert kwargs["server_settings"] == {"jit": "off"}
+
+
+async def test_pool_config(create_pool):
+    config = PoolConfig(
+        min_size=2,
+        max_size=4,
+        max_inactive_connection_lifetime=60.0,
+        statement_timeout=1.5,
+    )
+    db = AsyncpgSQLDatabase("foo", pool_config=config)
+    assert db.pool_size == 4
+    await db.connect()
+    kwargs = create_pool.call_args[1]
+    assert kwargs["min_size"] == 2
+    assert kwargs["max_size"] == 4
+    assert kwargs["max_inactive_connection_lifetime"] == 60.0
+    assert kwargs["server_settings"] == {"jit": "off", "statement_timeout": "1500"}
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"min_size": 2, "max_size": 1},
+        {"min_size": -1},
+        {"max_size": 0},
+        {"max_inactive_connection_lifetime": -1.0},
+        {"acquire_timeout": 0.0},
+        {"statement_timeout": -1.0},
+    ],
+)
+def test_pool_config_invalid(kwargs):
+    with pytest.raises(ValidationError):
+        PoolConfig(**kwargs)
+
+
+async def test_no_warmup(create_pool):
+    db = AsyncpgSQLDatabase("foo", pool_config=PoolConfig(warmup=False))
+    await db.connect()
+    assert not create_pool.called
+
+
+async def test_acquire(create_pool, pool):
+    db = AsyncpgSQLDatabase("foo", pool_config=PoolConfig(acquire_timeout=2.0))
+    async with db.acquire() as connection:
+        assert db.waiters == 0
+        assert connection is pool.acquire.return_value
+
+    pool.acquire.assert_awaited_once_with(timeout=2.0)
+    pool.release.assert_awaited_once_with(connection)
+    assert db.acquire_wait.count == 1
+
+
+def test_pool_size_and_pool_config():
+    with pytest.raises(ValueError):
+        AsyncpgSQLDatabase("foo", pool_size=3, pool_config=PoolConfig())
+
+
+async def test_acquire_timeout_not_observed(create_pool, pool):
+    pool.acquire.side_effect = asyncio.TimeoutError
+    db = AsyncpgSQLDatabase("foo")
+    with pytest.raises(asyncio.TimeoutError):
+        async with db.acquire():
+            pass
+
+    assert db.waiters == 0
+    assert db.acquire_wait.count == 0
+    assert not pool.release.called
+
+
+async def test_pool_stats(create_pool, pool):
+    db = AsyncpgSQLDatabase("foo")
+    db.acquire_wait.observe(0.002)
+    stats = await db.pool_stats()
+    assert stats.size == 3
+    assert stats.in_use == 2
+    assert stats.idle == 1
+    assert stats.min_size == 2
+    assert stats.max_size == 4
+    assert stats.waiters == 0
+    assert stats.acquire_wait_count == 1
+    assert stats.acquire_wait_buckets["0.001"] == 0
+    assert stats.acquire_wait_buckets["0.005"] == 1
+    assert stats.acquire_wait_buckets["inf"] == 1
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+needs_orjson = pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+
+
+@pytest.mark.parametrize(
+    "codec_cls", [JsonCodec, pytest.param(OrjsonCodec, marks=needs_orjson)]
+)
+def test_json_codec(codec_cls):
+    codec = codec_cls()
+    value = {"a": [1, 2.5, None, True], "b": {"c": "d"}}
+    assert codec.loads(codec.dumps(value)) == value
+    assert codec.loads(codec.dumps_bytes(value)) == value
+
+
+@needs_orjson
+def test_default_json_codec(create_pool):
+    assert isinstance(AsyncpgSQLDatabase("foo").json_codec, OrjsonCodec)
+
+
+async def test_init_db_types():
+    conn = mock.AsyncMock()
+    codec = JsonCodec()
+    await init_db_types(conn, codec)
+    assert conn.set_type_codec.await_args_list == [
+        mock.call(
+            "json", encoder=codec.dumps, decoder=codec.loads, schema="pg_catalog"
+        ),
+        mock.call(
+            "jsonb", encoder=codec.dumps, decoder=codec.loads, schema="pg_catalog"
+        ),
+    ]
+
+
+async def test_init_db_types_raw_jsonb():
+    conn = mock.AsyncMock()
+    await init_db_types(conn, JsonCodec(), raw_jsonb=True)
+    kwargs = conn.set_type_codec.await_args_list[1][1]
+    assert kwargs["format"] == "binary"
+    assert kwargs["decoder"](b'\x01{"a": 1}') == b'{"a": 1}'
+    assert kwargs["encoder"](b'{"a": 1}') == b'\x01{"a": 1}'
+    assert kwargs["encoder"]({"a": 1}) == b'\x01{"a": 1}'
+
+
+@pytest.fixture
+def deadline():
+    ctx.deadline = time.monotonic() + 10.0
+    yield ctx.deadline
+    ctx.deadline = None
+
+
+async def test_fetch_no_deadline():
+    connection = mock.AsyncMock()
+    connection.fetch.return_value = []
+    await fetch(connection, ("SELECT 1",))
+    connection.fetch.assert_awaited_once_with("SELECT 1", timeout=None)
+
+
+async def test_fetch_deadline(deadline):
+    connection = mock.AsyncMock()
+    connection.fetch.return_value = []
+    await fetch(connection, ("SELECT 1",))
+    assert 9.0 < connection.fetch.await_args[1]["timeout"] <= 10.0
+
+
+async def test_fetch_timeout(deadline):
+    connection = mock.AsyncMock()
+    connection.fetch.side_effect = asyncio.TimeoutError
+    with pytest.raises(DeadlineExceeded):
+        await fetch(connection, ("SELECT 1",))
+
+
+@pytest.mark.parametrize("format,header", [("csv", True), ("binary", None)])
+async def test_copy_from_query(format, header):
+    connection = mock.AsyncMock()
+    output = mock.AsyncMock()
+    await copy_from_query(connection, ("SELECT $1", 3), output, format)
+    connection.copy_from_query.assert_awaited_once_with(
+        "SELECT $1", 3, output=output, format=format, header=header, timeout=None
+    )
+
+
+async def test_copy_from_query_timeout(deadline):
+    connection = mock.AsyncMock()
+    connection.copy_from_query.side_effect = asyncio.TimeoutError
+    with pytest.raises(DeadlineExceeded):
+        await copy_from_query(connection, ("SELECT 1",), mock.AsyncMock(), "csv")
+
+
+async def test_copy_to(create_pool, pool, sql_builder):
+    db = AsyncpgSQLDatabase("foo")
+    output = mock.AsyncMock()
+    await db.copy_to(sql_builder.select([Filter.for_id(2)]), output)
+    connection = pool.acquire.return_value
+    args, kwargs = connection.copy_from_query.await_args
+    assert args == compile(sql_builder.select([Filter.for_id(2)]))
+    assert kwargs["output"] is output
+
+
+async def test_copy_to_table_file():
+    connection = mock.AsyncMock()
+    source = io.BytesIO(b"id,value\n1,foo\n")
+    await copy_to_table(connection, "myschema.writer", ["id", "value"], source, "csv")
+    connection.copy_to_table.assert_awaited_once_with(
+        "writer",
+        source=source,
+        format="csv",
+        header=True,
+        columns=["id", "value"],
+        schema_name="myschema",
+        timeout=None,
+    )
+
+
+async def test_copy_to_table_records():
+    connection = mock.AsyncMock()
+    records = [(1, "foo")]
+    await copy_to_table(connection, "writer", ["id", "value"], records, "csv")
+    connection.copy_records_to_table.assert_awaited_once_with(
+        "writer",
+        records=records,
+        columns=["id", "value"],
+        schema_name=None,
+        timeout=None,
+    )
+
+
+async def test_copy_to_table_timeout(deadline):
+    connection = mock.AsyncMock()
+    connection.copy_records_to_table.side_effect = asyncio.TimeoutError
+    with pytest.raises(DeadlineExceeded):
+        await copy_to_table(connection, "writer", ["id"], [(1,)], "csv")
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+from sqlalchemy import Text
+
+from clean_python import ctx
+from clean_python.sql import Histogram
+from clean_python.sql import QueryInstrumentation
+from clean_python.sql import SQLBuilder
+from clean_python.sql import SyncQueryInstrumentation
+from clean_python.sql.asyncpg_sql_database import instrumented_fetch
+from clean_python.sql.sqlalchemy_async_sql_database import SQLAlchemyAsyncSQLTransaction
+
+writer = Table(
+    "writer",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("value", Text, nullable=False),
+)
+
+builder = SQLBuilder(writer)
+
+
+class Record(tuple):
+    # asyncpg Records are sequences of values
+    def keys(self):
+        return ("count",)
+
+
+class PlanRecord(tuple):
+    def keys(self):
+        return ("QUERY PLAN",)
+
+
+PLAN = [{"QUERY PLAN": [{"Plan": {"Node Type": "Seq Scan"}}]}]
+
+
+@pytest.fixture
+def gateway():
+    return mock.AsyncMock()
+
+
+@pytest.fixture
+def explain():
+    return mock.AsyncMock(return_value=PLAN)
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0, float("inf")))
+    for value in (0.05, 0.5, 10.0):
+        histogram.observe(value)
+    assert histogram.to_dict() == {"0.1": 1, "1.0": 2, "inf": 3}
+    assert histogram.count == 3
+    assert histogram.sum == pytest.approx(10.55)
+
+
+async def test_stats(explain):
+    instrumentation = QueryInstrumentation()
+    await instrumentation.observe(builder.count([]), "SELECT 1", 0.002, 1, explain)
+    await instrumentation.observe(builder.count([]), "SELECT 1", 0.02, 3, explain)
+    await instrumentation.observe(builder.count([]), "SELECT 2", 0.2, 0, explain)
+    first, second = instrumentation.stats()
+    assert first.query == "SELECT 1"
+    assert first.count == 2
+    assert first.rows == 4
+    assert first.duration_sum == pytest.approx(0.022)
+    assert first.duration_buckets["0.001"] == 0
+    assert first.duration_buckets["0.005"] == 1
+    assert first.duration_buckets["inf"] == 2
+    assert second.query == "SELECT 2"
+    assert not explain.called
+
+
+async def test_max_shapes(explain):
+    instrumentation = QueryInstrumentation(max_shapes=2)
+    for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"):
+        await instrumentation.observe(builder.count([]), sql, 0.1, 1, explain)
+    assert [x.query for x in instrumentation.stats()] == ["SELECT 1", "SELECT 3"]
+
+
+def test_pool_wait():
+    instrumentation = QueryInstrumentation()
+    instrumentation.observe_pool_wait(0.003)
+    assert instrumentation.pool_wait.count == 1
+    instrumentation.clear()
+    assert instrumentation.pool_wait.count == 0
+
+
+async def test_slow_query(gateway, explain):
+    instrumentation = QueryInstrumentation(slow_query_threshold=1.0, gateway=gateway)
+    await instrumentation.observe(builder.count([]), "SELECT 1", 0.5, 1, explain)
+    assert not gateway.add.called
+    ctx.correlation_id = correlation_id = uuid4()
+    try:
+        await instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+    finally:
+        ctx.correlation_id = None
+    gateway.add.assert_awaited_once_with(
+        {
+            "tag_suffix": "slow_query",
+            "query": "SELECT 1",
+            "duration": 1.5,
+            "rows": 1,
+            "plan": None,
+            "correlation_id": str(correlation_id),
+        }
+    )
+    assert not explain.called
+
+
+async def test_slow_query_explain(gateway, explain):
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=1.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    await instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+    await instrumentation.wait_for_explains()
+    explain.assert_awaited_once_with()
+    assert gateway.add.call_args[0][0]["plan"] == {"Plan": {"Node Type": "Seq Scan"}}
+
+
+async def test_slow_query_explain_in_background(gateway):
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def explain():
+        started.set()
+        await finish.wait()
+        return PLAN
+
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=1.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    await instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+    # the query returns before the EXPLAIN is done
+    await started.wait()
+    assert not gateway.add.called
+    finish.set()
+    await instrumentation.wait_for_explains()
+    assert gateway.add.call_args[0][0]["plan"] == {"Plan": {"Node Type": "Seq Scan"}}
+
+
+@pytest.mark.parametrize(
+    "query", [builder.delete(1), builder.select([], for_update=True)]
+)
+async def test_slow_query_no_explain_if_not_read_only(gateway, explain, query):
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=1.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    await instrumentation.observe(query, "DELETE", 1.5, 1, explain)
+    assert not explain.called
+    assert gateway.add.call_args[0][0]["plan"] is None
+
+
+async def test_slow_query_explain_error(gateway, explain, caplog):
+    explain.side_effect = RuntimeError
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=1.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    with caplog.at_level(logging.DEBUG):
+        await instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+        await instrumentation.wait_for_explains()
+    assert gateway.add.call_args[0][0]["plan"] is None
+    assert "Could not explain slow query" in caplog.text
+
+
+async def test_slow_query_gateway_error(gateway, explain, caplog):
+    gateway.add.side_effect = RuntimeError
+    instrumentation = QueryInstrumentation(slow_query_threshold=1.0, gateway=gateway)
+    await instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+    assert gateway.add.called
+    assert "Could not log slow query" in caplog.text
+
+
+def test_sync_slow_query_gateway_error(caplog):
+    gateway = mock.Mock()
+    gateway.add.side_effect = RuntimeError
+    instrumentation = SyncQueryInstrumentation(
+        slow_query_threshold=1.0, gateway=gateway
+    )
+    instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, mock.Mock())
+    assert gateway.add.called
+    assert "Could not log slow query" in caplog.text
+
+
+def test_sync_slow_query_explain():
+    gateway = mock.Mock()
+    explain = mock.Mock(return_value=[{"QUERY PLAN": '[{"Plan": {}}]'}])
+    instrumentation = SyncQueryInstrumentation(
+        slow_query_threshold=1.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    instrumentation.observe(builder.count([]), "SELECT 1", 1.5, 1, explain)
+    assert gateway.add.call_args[0][0]["plan"] == {"Plan": {}}
+    assert instrumentation.stats()[0].count == 1
+
+
+async def test_instrumented_fetch():
+    connection = mock.AsyncMock()
+    connection.fetch.return_value = [Record((2,))]
+    instrumentation = QueryInstrumentation()
+    query = builder.count([])
+    rows = await instrumented_fetch(
+        connection, ("SELECT 1",), query, None, instrumentation
+    )
+    assert rows.to_dicts() == [{"count": 2}]
+    (stats,) = instrumentation.stats()
+    assert stats.query == "SELECT 1"
+    assert stats.rows == 1
+
+
+async def test_instrumented_fetch_explain_on_other_connection(gateway):
+    connection = mock.AsyncMock()
+    connection.fetch.return_value = [Record((2,))]
+    other = mock.AsyncMock()
+    other.fetch.return_value = [PlanRecord(('[{"Plan": {}}]',))]
+
+    @asynccontextmanager
+    async def acquire():
+        yield other
+
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=0.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    await instrumented_fetch(
+        connection, ("SELECT 1",), builder.count([]), None, instrumentation, acquire
+    )
+    await instrumentation.wait_for_explains()
+    connection.fetch.assert_awaited_once()
+    assert other.fetch.call_args[0][0].startswith("EXPLAIN (ANALYZE, BUFFERS")
+    assert gateway.add.call_args[0][0]["plan"] == {"Plan": {}}
+
+
+async def test_instrumented_fetch_no_explain_without_acquire(gateway):
+    connection = mock.AsyncMock()
+    connection.fetch.return_value = [Record((2,))]
+    instrumentation = QueryInstrumentation(
+        slow_query_threshold=0.0, explain_sample_rate=1.0, gateway=gateway
+    )
+    await instrumented_fetch(
+        connection, ("SELECT 1",), builder.count([]), None, instrumentation
+    )
+    connection.fetch.assert_awaited_once()
+    assert gateway.add.call_args[0][0]["plan"] is None
+
+
+async def test_sqlalchemy_transaction():
+    connection = mock.AsyncMock()
+    result = connection.execute.return_value = mock.Mock()
+    result.context.statement = "SELECT count(*) AS count FROM writer"
+    result.keys.return_value = ["count"]
+    result.fetchall.return_value = [(2,)]
+    instrumentation = QueryInstrumentation()
+    transaction = SQLAlchemyAsyncSQLTransaction(connection, instrumentation)
+    assert await transaction.execute(builder.count([])) == [{"count": 2}]
+    (stats,) = instrumentation.stats()
+    assert stats.query == "SELECT count(*) AS count FROM writer"
+    assert stats.rows == 1
@@ -0,0 +1,232 @@
+from contextlib import asynccontextmanager
+from unittest import mock
+
+import pytest
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+from sqlalchemy import text
+from sqlalchemy import Text
+
+from clean_python import ctx
+from clean_python import Filter
+from clean_python.sql import RoutingSQLDatabase
+from clean_python.sql import SQLBuilder
+from clean_python.sql.routing_sql_database import is_advisory_lock
+from clean_python.sql.routing_sql_database import is_read_only
+from clean_python.sql.routing_sql_database import LAG_QUERY
+from clean_python.sql.sql_provider import advisory_lock_query
+from clean_python.sql.sql_provider import advisory_unlock_query
+from clean_python.sql.testing import FakeSQLDatabase
+
+writer = Table(
+    "writer",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("value", Text, nullable=False),
+)
+
+builder = SQLBuilder(writer)
+
+
+@pytest.fixture(autouse=True)
+def reset_ctx():
+    yield
+    ctx.read_your_writes = False
+
+
+@pytest.fixture
+def primary():
+    return FakeSQLDatabase()
+
+
+@pytest.fixture
+def replicas():
+    return [FakeSQLDatabase(), FakeSQLDatabase()]
+
+
+@pytest.fixture
+def database(primary, replicas):
+    return RoutingSQLDatabase(primary, replicas)
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (builder.select([]), True),
+        (builder.count([]), True),
+        (builder.exists([]), True),
+        (builder.select([], for_update=True), False),
+        (builder.insert({"value": "foo"}), False),
+        (builder.delete(1), False),
+        (builder.delete_filtered([Filter(field="id", values=[1])]), False),
+        (builder.update_filtered([], {"value": "foo"}), False),
+        (LAG_QUERY, False),
+    ],
+)
+def test_is_read_only(query, expected):
+    assert is_read_only(query) is expected
+
+
+async def test_round_robin(database, primary, replicas):
+    for _ in range(3):
+        await database.execute(builder.select([]))
+    assert len(primary.queries) == 0
+    assert [len(x.queries) for x in replicas] == [2, 1]
+    assert not ctx.read_your_writes
+
+
+async def test_least_busy(primary, replicas):
+    database = RoutingSQLDatabase(primary, replicas, strategy="least_busy")
+    database.replicas[0].busy = 1
+    await database.execute(builder.select([]))
+    assert [len(x.queries) for x in replicas] == [0, 1]
+    assert [x.busy for x in database.replicas] == [1, 0]
+
+
+async def test_write_goes_to_primary_and_sticks(database, primary, replicas):
+    await database.execute(builder.delete(1))
+    assert len(primary.queries) == 1
+    assert ctx.read_your_writes
+
+    await database.execute(builder.select([]))
+    assert len(primary.queries) == 2
+    assert [len(x.queries) for x in replicas] == [0, 0]
+
+
+async def test_not_sticky(primary, replicas):
+    database = RoutingSQLDatabase(primary, replicas, sticky_after_write=False)
+    await database.execute(builder.delete(1))
+    await database.execute(builder.select([]))
+    assert len(primary.queries) == 1
+    assert not ctx.read_your_writes
+
+
+async def test_read_your_writes(database, primary):
+    ctx.read_your_writes = True
+    await database.execute(builder.select([]))
+    assert len(primary.queries) == 1
+
+
+async def test_transaction_uses_primary(database, primary, replicas):
+    async with database.transaction() as transaction:
+        await transaction.execute(builder.select([]))
+    assert primary.queries == [[mock.ANY]]
+    assert [len(x.queries) for x in replicas] == [0, 0]
+    # a read-only transaction is not a write
+    assert not ctx.read_your_writes
+
+
+async def test_transaction_write_sticks(database):
+    async with database.transaction() as transaction:
+        await transaction.execute(builder.select([]))
+        assert not ctx.read_your_writes
+        await transaction.execute(builder.delete(1))
+        assert ctx.read_your_writes
+
+
+@pytest.mark.parametrize("method", ["connect", "disconnect"])
+async def test_connect_disconnect(database, primary, replicas, method):
+    for provider in [primary] + replicas:
+        setattr(provider, method, mock.AsyncMock())
+    await getattr(database, method)()
+    for provider in [primary] + replicas:
+        getattr(provider, method).assert_awaited_once_with()
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (advisory_lock_query(1, True), True),
+        (advisory_lock_query(1, False, "xact_"), True),
+        (advisory_unlock_query(1), True),
+        (text("SELECT pg_advisory_lock(1); DELETE FROM writer"), False),
+        (builder.select([]), False),
+    ],
+)
+def test_is_advisory_lock(query, expected):
+    assert is_advisory_lock(query) is expected
+
+
+async def test_advisory_lock_is_not_a_write(database, primary, replicas):
+    await database.execute(advisory_lock_query(1, True))
+    assert primary.queries == [[mock.ANY]]
+    assert not ctx.read_your_writes
+
+
+async def test_session_advisory_lock_is_not_a_write(database, primary):
+    @asynccontextmanager
+    async def session():
+        yield primary
+
+    primary.session = session
+    primary.result.return_value = [{"acquired": True}]
+    async with database.advisory_lock(1) as acquired:
+        assert acquired
+    assert len(primary.queries) == 2
+    assert not ctx.read_your_writes
+
+
+async def test_copy_from_uses_primary(database, primary):
+    primary.copy_from = mock.AsyncMock()
+    await database.copy_from("writer", ["id"], [(1,)])
+    primary.copy_from.assert_awaited_once_with("writer", ["id"], [(1,)], "csv")
+    assert ctx.read_your_writes
+
+
+async def test_no_replicas(primary):
+    database = RoutingSQLDatabase(primary, [])
+    await database.execute(builder.select([]))
+    assert len(primary.queries) == 1
+
+
+@pytest.mark.parametrize(
+    "lags,expected,expected_primary",
+    [
+        ([None, None], [2, 0], 0),  # NULL means no lag
+        ([10.0, 0.5], [1, 2], 0),
+        ([10.0, 10.0], [1, 1], 1),
+    ],
+)
+async def test_replication_lag(primary, replicas, lags, expected, expected_primary):
+    database = RoutingSQLDatabase(primary, replicas, max_replication_lag=1.0)
+    for replica, lag in zip(replicas, lags):
+        replica.result.return_value = [{"lag": lag}]
+    await database.execute(builder.select([]))
+    # including the lag queries
+    assert [len(x.queries) for x in replicas] == expected
+    assert len(primary.queries) == expected_primary
+
+
+async def test_replication_lag_cached(primary, replicas):
+    database = RoutingSQLDatabase(
+        primary, replicas[:1], max_replication_lag=1.0, lag_check_interval=60.0
+    )
+    replicas[0].result.return_value = [{"lag": 0.0}]
+    await database.execute(builder.select([]))
+    await database.execute(builder.select([]))
+    assert len(replicas[0].queries) == 3  # 1 lag query
+
+
+async def test_replication_lag_error(primary, replicas):
+    database = RoutingSQLDatabase(primary, replicas[:1], max_replication_lag=1.0)
+    replicas[0].result.side_effect = OSError()
+    await database.execute(builder.select([]))
+    assert len(primary.queries) == 1
+
+
+async def test_iter_execute(database, replicas):
+    replicas[0].result.return_value = [{"id": 1}, {"id": 2}]
+    actual = [x async for x in database.iter_execute(builder.select([]), batch_size=1)]
+    assert actual == [[{"id": 1}], [{"id": 2}]]
+    assert database.replicas[0].busy == 0
+
+
+async def test_execute_many(database, primary, replicas):
+    replicas[0].result.return_value = [{"id": 1}]
+    primary.result.return_value = [{"id": 2}]
+    actual = await database.execute_many([builder.select([]), builder.delete(2)])
+    assert actual == [[{"id": 1}], [{"id": 2}]]
+    assert [len(x.queries) for x in replicas] == [1, 0]
+    assert len(primary.queries) == 1
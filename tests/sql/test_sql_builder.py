@@ -8,13 +8,25 @@ from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import Table
 from sqlalchemy import Text
+from sqlalchemy.dialects.postgresql import ARRAY
 
+from clean_python import BetweenFilter
 from clean_python import ComparisonFilter
 from clean_python import ComparisonOperator
+from clean_python import ContainsFilter
 from clean_python import Filter
+from clean_python import ILikeFilter
+from clean_python import IsNullFilter
 from clean_python import Json
+from clean_python import Metric
+from clean_python import NotFilter
+from clean_python import OrFilter
 from clean_python import PageOptions
+from clean_python import PrefixFilter
+from clean_python import SortKey
 from clean_python.sql import SQLBuilder
+from clean_python.sql.sql_builder import Explain
+from clean_python.sql.sql_builder import in_batch_order
 from clean_python.sql.testing import assert_query_equal
 
 writer = Table(
@@ -44,6 +56,11 @@ def sql_builder() -> SQLBuilder:
             [Filter(field="value", values=["foo", "bar"])],
             " WHERE writer.value IN ('foo', 'bar')",
         ),
+        ([Filter(field="value", values=[None])], " WHERE writer.value IS NULL"),
+        (
+            [Filter(field="value", values=["foo", None])],
+            " WHERE writer.value = 'foo' OR writer.value IS NULL",
+        ),
         ([Filter(field="nonexisting", values=["foo"])], " WHERE false"),
         (
             [Filter(field="id", values=[1]), Filter(field="value", values=["foo"])],
@@ -92,6 +109,30 @@ def test_select_filter_and_pagination(sql_builder: SQLBuilder):
     )
 
 
+@pytest.mark.parametrize(
+    "fields,columns",
+    [
+        (["value"], "writer.id, writer.value"),
+        (["updated_at", "id"], "writer.id, writer.updated_at"),
+        (["nonexisting"], "writer.id"),
+    ],
+)
+def test_select_fields(sql_builder: SQLBuilder, fields, columns):
+    query = sql_builder.select([], fields=fields)
+    assert_query_equal(query, f"SELECT {columns} FROM writer WHERE true")
+
+
+def test_select_fields_with_total(sql_builder: SQLBuilder):
+    query = sql_builder.select(
+        [], PageOptions(limit=5), with_total=True, fields=["value"]
+    )
+    assert_query_equal(
+        query,
+        "SELECT writer.id, writer.value, count(*) OVER () AS _total FROM writer "
+        "WHERE true ORDER BY writer.id ASC LIMIT 5 OFFSET 0",
+    )
+
+
 def test_select_for_update(sql_builder: SQLBuilder):
     query = sql_builder.select([Filter.for_id(2)], for_update=True)
     assert_query_equal(
@@ -100,6 +141,22 @@ def test_select_for_update(sql_builder: SQLBuilder):
     )
 
 
+def test_select_for_update_skip_locked(sql_builder: SQLBuilder):
+    query = sql_builder.select(
+        [Filter(field="value", values=["foo"])],
+        PageOptions(limit=5),
+        for_update=True,
+        skip_locked=True,
+    )
+    assert_query_equal(
+        query,
+        (
+            f"SELECT {ALL_FIELDS} FROM writer WHERE writer.value = 'foo' "
+            "ORDER BY writer.id ASC LIMIT 5 OFFSET 0 FOR UPDATE SKIP LOCKED"
+        ),
+    )
+
+
 @pytest.mark.parametrize(
     "filters,sql",
     [
@@ -232,3 +289,512 @@ def test_select_comparison_filter(
     assert_query_equal(
         query, f"SELECT {ALL_FIELDS} FROM writer WHERE writer.id {expected} 14"
     )
+
+
+@pytest.mark.parametrize(
+    "values,sql",
+    [
+        ([], "false"),
+        (["foo"], "writer.value = 'foo'"),
+        (["foo", "bar"], "writer.value = ANY (ARRAY['foo', 'bar'])"),
+    ],
+)
+def test_select_array_params(values: list[str], sql: str):
+    sql_builder = SQLBuilder(writer, array_params=True)
+    query = sql_builder.select([Filter(field="value", values=values)])
+    assert_query_equal(query, f"SELECT {ALL_FIELDS} FROM writer WHERE {sql}")
+
+
+@pytest.mark.parametrize(
+    "records,batch_size,expected",
+    [
+        ([], 10, []),
+        ([{"value": "a"}, {"value": "b"}], 10, [[{"value": "a"}, {"value": "b"}]]),
+        ([{"value": "a"}, {"value": "b"}], 1, [[{"value": "a"}], [{"value": "b"}]]),
+        (
+            [{"value": "a"}, {"id": 2, "value": "b"}, {"value": "c"}],
+            10,
+            [[{"value": "a"}], [{"id": 2, "value": "b"}], [{"value": "c"}]],
+        ),
+        (
+            [{"value": "a"}, {"id": None, "value": "b", "other": 1}],
+            10,
+            [[{"value": "a"}, {"id": None, "value": "b", "other": 1}]],
+        ),
+        ([{}, {}], 10, [[{}], [{}]]),
+    ],
+)
+def test_batches(sql_builder: SQLBuilder, records, batch_size, expected):
+    assert list(sql_builder.batches(records, batch_size)) == expected
+
+
+def test_batches_max_bind_params(sql_builder: SQLBuilder):
+    records = [{"id": i, "value": "a"} for i in range(20000)]
+    assert [len(x) for x in sql_builder.batches(records, 100000)] == [16383, 3617]
+
+
+def test_insert_many(sql_builder: SQLBuilder):
+    query = sql_builder.insert_many([{"value": "a"}, {"value": "b"}])
+    assert_query_equal(
+        query,
+        f"INSERT INTO writer (value) VALUES ('a'), ('b') RETURNING {ALL_FIELDS}",
+    )
+
+
+def test_insert_many_single(sql_builder: SQLBuilder):
+    query = sql_builder.insert_many([{}])
+    assert_query_equal(
+        query, f"INSERT INTO writer DEFAULT VALUES RETURNING {ALL_FIELDS}"
+    )
+
+
+def test_upsert_many(sql_builder: SQLBuilder):
+    query = sql_builder.upsert_many([{"id": 2, "value": "a"}, {"id": 3, "value": "b"}])
+    assert_query_equal(
+        query,
+        (
+            "INSERT INTO writer (id, value) VALUES (2, 'a'), (3, 'b') "
+            "ON CONFLICT (id) DO UPDATE SET id = excluded.id, value = excluded.value "
+            f"RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+def test_upsert_many_match(sql_builder: SQLBuilder):
+    query = sql_builder.upsert_many(
+        [{"id": 2, "value": "a"}, {"id": 3, "value": "b"}], match="value"
+    )
+    assert_query_equal(
+        query,
+        (
+            "INSERT INTO writer (id, value) VALUES (2, 'a'), (3, 'b') "
+            "ON CONFLICT (id) DO UPDATE SET id = excluded.id, value = excluded.value "
+            f"WHERE writer.value = excluded.value RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+def test_delete_filtered(sql_builder: SQLBuilder):
+    query = sql_builder.delete_filtered([Filter(field="value", values=["foo"])])
+    assert_query_equal(
+        query,
+        (
+            "WITH deleted AS (DELETE FROM writer WHERE writer.value = 'foo' "
+            "RETURNING writer.id) SELECT count(*) AS count FROM deleted"
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "array_params,sql",
+    [
+        (False, "(writer.id NOT IN (1, 2))"),
+        (True, "writer.id != ALL (ARRAY[1, 2])"),
+    ],
+)
+def test_delete_filtered_exclude_ids(array_params, sql):
+    sql_builder = SQLBuilder(writer, array_params=array_params)
+    query = sql_builder.delete_filtered(
+        [Filter(field="value", values=["foo"])], exclude_ids=[1, 2]
+    )
+    assert_query_equal(
+        query,
+        (
+            f"WITH deleted AS (DELETE FROM writer WHERE writer.value = 'foo' AND {sql} "
+            "RETURNING writer.id) SELECT count(*) AS count FROM deleted"
+        ),
+    )
+
+
+def test_update_filtered(sql_builder: SQLBuilder):
+    query = sql_builder.update_filtered(
+        [Filter(field="value", values=["foo"])], {"id": 5, "value": "bar"}
+    )
+    assert_query_equal(
+        query,
+        (
+            "WITH updated AS (UPDATE writer SET value='bar' "
+            "WHERE writer.value = 'foo' RETURNING writer.id) "
+            "SELECT count(*) AS count FROM updated"
+        ),
+    )
+
+
+def test_claim(sql_builder: SQLBuilder):
+    query = sql_builder.claim(
+        [Filter(field="value", values=["foo"])], 10, {"id": 5, "value": "bar"}
+    )
+    assert_query_equal(
+        query,
+        (
+            "WITH claimed AS (SELECT writer.id AS id FROM writer "
+            "WHERE writer.value = 'foo' ORDER BY writer.id LIMIT 10 "
+            "FOR UPDATE SKIP LOCKED) "
+            "UPDATE writer SET value='bar' FROM claimed "
+            f"WHERE writer.id = claimed.id RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "page_options,sql",
+    [
+        (
+            PageOptions(limit=5, cursor=3),
+            "writer.id > 3 ORDER BY writer.id ASC",
+        ),
+        (
+            PageOptions(limit=5, cursor=3, ascending=False),
+            "writer.id < 3 ORDER BY writer.id DESC",
+        ),
+        (
+            PageOptions(limit=5, cursor=3, order_by="value"),
+            (
+                "(writer.value, writer.id) > ((SELECT writer.value "
+                "FROM writer WHERE writer.id = 3), 3) "
+                "ORDER BY writer.value ASC, writer.id ASC"
+            ),
+        ),
+    ],
+)
+def test_select_with_cursor(sql_builder: SQLBuilder, page_options, sql):
+    query = sql_builder.select([], page_options)
+    assert_query_equal(
+        query, f"SELECT {ALL_FIELDS} FROM writer WHERE true AND {sql} LIMIT 5 OFFSET 0"
+    )
+
+
+def test_select_order_by_tiebreaker(sql_builder: SQLBuilder):
+    query = sql_builder.select([], PageOptions(limit=5, order_by="value"))
+    assert_query_equal(
+        query,
+        (
+            f"SELECT {ALL_FIELDS} FROM writer WHERE true "
+            "ORDER BY writer.value ASC, writer.id ASC LIMIT 5 OFFSET 0"
+        ),
+    )
+
+
+def test_select_with_total(sql_builder: SQLBuilder):
+    query = sql_builder.select([], PageOptions(limit=5), with_total=True)
+    assert_query_equal(
+        query,
+        (
+            f"SELECT {ALL_FIELDS}, count(*) OVER () AS _total FROM writer "
+            "WHERE true ORDER BY writer.id ASC LIMIT 5 OFFSET 0"
+        ),
+    )
+
+
+def test_estimate_count(sql_builder: SQLBuilder):
+    query = sql_builder.estimate_count([Filter(field="value", values=["foo"])])
+    assert_query_equal(
+        query,
+        (
+            "EXPLAIN (FORMAT JSON) SELECT true AS anon_1 FROM writer "
+            "WHERE writer.value = 'foo'"
+        ),
+    )
+
+
+def test_explain_analyze(sql_builder: SQLBuilder):
+    query = Explain(sql_builder.count([]), analyze=True)
+    assert_query_equal(
+        query,
+        (
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+            "SELECT count(*) AS count FROM writer WHERE true"
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "plan", [[{"Plan": {"Plan Rows": 12}}], '[{"Plan": {"Plan Rows": 12}}]']
+)
+def test_parse_estimate_count(plan):
+    assert SQLBuilder.parse_estimate_count([{"QUERY PLAN": plan}]) == 12
+
+
+@pytest.mark.parametrize(
+    "filter,sql",
+    [
+        (IsNullFilter(field="value"), "writer.value IS NULL"),
+        (
+            NotFilter(filters=[IsNullFilter(field="value")]),
+            "writer.value IS NOT NULL",
+        ),
+        (
+            NotFilter(filters=[Filter(field="value", values=["a", "b"])]),
+            "(writer.value NOT IN ('a', 'b'))",
+        ),
+        (
+            NotFilter(filters=[Filter.for_id(1), Filter(field="value", values=["a"])]),
+            "NOT (writer.id = 1 AND writer.value = 'a')",
+        ),
+        (
+            OrFilter(filters=[Filter.for_id(1), IsNullFilter(field="value")]),
+            "writer.id = 1 OR writer.value IS NULL",
+        ),
+        (OrFilter(filters=[]), "false"),
+        (BetweenFilter(field="id", values=[1, 5]), "writer.id BETWEEN 1 AND 5"),
+        (
+            PrefixFilter(field="value", values=["a_b%"]),
+            "writer.value LIKE 'a/_b/%%%%' ESCAPE '/'",
+        ),
+        (ILikeFilter(field="value", values=["%a%"]), "writer.value ILIKE '%%a%%'"),
+        (IsNullFilter(field="nonexisting"), "false"),
+    ],
+)
+def test_select_filter_algebra(sql_builder: SQLBuilder, filter: Filter, sql: str):
+    query = sql_builder.select([filter])
+    assert_query_equal(query, f"SELECT {ALL_FIELDS} FROM writer WHERE {sql}")
+
+
+def test_select_or_filter_and(sql_builder: SQLBuilder):
+    or_filter = OrFilter(filters=[Filter.for_id(1), IsNullFilter(field="value")])
+    query = sql_builder.select([or_filter, Filter(field="value", values=["a"])])
+    assert_query_equal(
+        query,
+        f"SELECT {ALL_FIELDS} FROM writer "
+        "WHERE (writer.id = 1 OR writer.value IS NULL) AND writer.value = 'a'",
+    )
+
+
+tagged = Table(
+    "tagged",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("tags", ARRAY(Text), nullable=False),
+    Column("name", Text, nullable=False),
+)
+
+
+def test_select_contains_filter():
+    query = SQLBuilder(tagged).select([ContainsFilter(field="tags", values=["a"])])
+    assert_query_equal(
+        query,
+        "SELECT tagged.id, tagged.tags, tagged.name FROM tagged "
+        "WHERE tagged.tags @> ARRAY['a']",
+    )
+
+
+def test_select_contains_filter_err():
+    with pytest.raises(ValueError):
+        SQLBuilder(tagged).select([ContainsFilter(field="name", values=["a"])])
+
+
+@pytest.mark.parametrize(
+    "sort,sql",
+    [
+        (
+            [SortKey(field="value", ascending=False), SortKey(field="updated_at")],
+            "writer.value DESC, writer.updated_at ASC, writer.id ASC",
+        ),
+        (
+            [SortKey(field="value", nulls="first"), SortKey(field="id")],
+            "writer.value ASC NULLS FIRST, writer.id ASC",
+        ),
+        (
+            [SortKey(field="updated_at", ascending=False, nulls="last")],
+            "writer.updated_at DESC NULLS LAST, writer.id DESC",
+        ),
+    ],
+)
+def test_select_with_sort(sql_builder: SQLBuilder, sort, sql):
+    query = sql_builder.select([], PageOptions(limit=5, sort=sort))
+    assert_query_equal(
+        query,
+        f"SELECT {ALL_FIELDS} FROM writer WHERE true ORDER BY {sql} LIMIT 5 OFFSET 0",
+    )
+
+
+def test_select_with_sort_and_cursor(sql_builder: SQLBuilder):
+    sort = [SortKey(field="value"), SortKey(field="updated_at")]
+    query = sql_builder.select([], PageOptions(limit=5, cursor=3, sort=sort))
+    assert_query_equal(
+        query,
+        f"SELECT {ALL_FIELDS} FROM writer WHERE true AND "
+        "(writer.value, writer.updated_at, writer.id) > ("
+        "(SELECT writer.value FROM writer WHERE writer.id = 3), "
+        "(SELECT writer.updated_at FROM writer WHERE writer.id = 3), 3) "
+        "ORDER BY writer.value ASC, writer.updated_at ASC, writer.id ASC "
+        "LIMIT 5 OFFSET 0",
+    )
+
+
+def test_select_with_mixed_sort_and_cursor(sql_builder: SQLBuilder):
+    sort = [SortKey(field="value", ascending=False), SortKey(field="id")]
+    query = sql_builder.select([], PageOptions(limit=5, cursor=3, sort=sort))
+    assert_query_equal(
+        query,
+        f"SELECT {ALL_FIELDS} FROM writer WHERE true AND "
+        "(writer.value < (SELECT writer.value FROM writer WHERE writer.id = 3) "
+        "OR writer.value = (SELECT writer.value FROM writer WHERE writer.id = 3) "
+        "AND writer.id > 3) "
+        "ORDER BY writer.value DESC, writer.id ASC LIMIT 5 OFFSET 0",
+    )
+
+
+@pytest.mark.parametrize(
+    "ascending,sql",
+    [
+        (
+            True,
+            "(EXISTS (SELECT note.id FROM note WHERE note.id = 3)) AND "
+            "(note.text > (SELECT note.text FROM note WHERE note.id = 3) "
+            "OR note.text IS NULL "
+            "AND (SELECT note.text FROM note WHERE note.id = 3) IS NOT NULL "
+            "OR note.text IS NOT DISTINCT FROM "
+            "(SELECT note.text FROM note WHERE note.id = 3) AND note.id > 3) "
+            "ORDER BY note.text ASC, note.id ASC",
+        ),
+        (
+            False,
+            "(EXISTS (SELECT note.id FROM note WHERE note.id = 3)) AND "
+            "(note.text < (SELECT note.text FROM note WHERE note.id = 3) "
+            "OR note.text IS NOT NULL "
+            "AND (SELECT note.text FROM note WHERE note.id = 3) IS NULL "
+            "OR note.text IS NOT DISTINCT FROM "
+            "(SELECT note.text FROM note WHERE note.id = 3) AND note.id < 3) "
+            "ORDER BY note.text DESC, note.id DESC",
+        ),
+    ],
+)
+def test_select_with_nullable_cursor(ascending, sql):
+    note = Table(
+        "note",
+        MetaData(),
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("text", Text, nullable=True),
+    )
+    query = SQLBuilder(note).select(
+        [], PageOptions(limit=5, cursor=3, order_by="text", ascending=ascending)
+    )
+    assert_query_equal(
+        query,
+        "SELECT note.id, note.text FROM note WHERE true AND " f"{sql} LIMIT 5 OFFSET 0",
+    )
+
+
+def test_select_with_nulls_and_cursor_err(sql_builder: SQLBuilder):
+    sort = [SortKey(field="value", nulls="first")]
+    with pytest.raises(ValueError):
+        sql_builder.select([], PageOptions(limit=5, cursor=3, sort=sort))
+
+
+def test_aggregate(sql_builder: SQLBuilder):
+    query = sql_builder.aggregate(
+        [Filter(field="id", values=[1, 2])],
+        ["value"],
+        [
+            Metric(function="count"),
+            Metric(function="max", field="updated_at", name="last"),
+            Metric(function="avg", field="id"),
+        ],
+    )
+    assert_query_equal(
+        query,
+        "SELECT writer.value, count(*) AS count, max(writer.updated_at) AS last, "
+        "avg(writer.id) AS avg_id FROM writer WHERE writer.id IN (1, 2) "
+        "GROUP BY writer.value ORDER BY writer.value",
+    )
+
+
+def test_aggregate_no_group_by(sql_builder: SQLBuilder):
+    query = sql_builder.aggregate([], [], [Metric(function="sum", field="id")])
+    assert_query_equal(query, "SELECT sum(writer.id) AS sum_id FROM writer WHERE true")
+
+
+@pytest.mark.parametrize(
+    "group_by,metric",
+    [
+        (["nonexisting"], Metric(function="count")),
+        ([], Metric(function="sum", field="nonexisting")),
+    ],
+)
+def test_aggregate_unknown_column(sql_builder: SQLBuilder, group_by, metric):
+    with pytest.raises(ValueError):
+        sql_builder.aggregate([], group_by, [metric])
+
+
+def test_create_staging_table(sql_builder: SQLBuilder):
+    query = sql_builder.create_staging_table("import_1", ["id", "value"])
+    assert_query_equal(
+        query,
+        'CREATE TEMP TABLE "import_1" ON COMMIT DROP AS SELECT "id", "value" '
+        'FROM "writer" WITH NO DATA',
+    )
+
+
+def test_create_staging_table_unknown_column(sql_builder: SQLBuilder):
+    with pytest.raises(ValueError):
+        sql_builder.create_staging_table("import_1", ["id", "foo"])
+
+
+MERGE_COUNTS = (
+    "RETURNING xmax = 0 AS inserted) "
+    "SELECT count(*) FILTER (WHERE merged.inserted) AS inserted, "
+    "count(*) FILTER (WHERE NOT merged.inserted) AS updated FROM merged"
+)
+
+
+@pytest.mark.parametrize(
+    "on_conflict,sql",
+    [
+        ("error", ""),
+        ("ignore", "ON CONFLICT DO NOTHING "),
+        ("update", "ON CONFLICT (id) DO UPDATE SET value = excluded.value "),
+    ],
+)
+def test_merge_staging_table(sql_builder: SQLBuilder, on_conflict, sql):
+    query = sql_builder.merge_staging_table("import_1", ["id", "value"], on_conflict)
+    assert_query_equal(
+        query,
+        "WITH merged AS (INSERT INTO writer (id, value) "
+        "SELECT import_1.id AS id, import_1.value AS value FROM import_1 "
+        f"{sql}{MERGE_COUNTS}",
+    )
+
+
+def test_merge_staging_table_update_without_id(sql_builder: SQLBuilder):
+    with pytest.raises(ValueError):
+        sql_builder.merge_staging_table("import_1", ["value"], "update")
+
+
+async def test_update_if_unmodified_since(sql_builder: SQLBuilder):
+    query = sql_builder.update_if_unmodified_since(
+        2, {"value": "foo"}, datetime(2010, 1, 1, tzinfo=timezone.utc)
+    )
+    assert_query_equal(
+        query,
+        (
+            "WITH updated AS (UPDATE writer SET value='foo' WHERE writer.id = 2 "
+            "AND writer.updated_at = '2010-01-01 00:00:00+00:00' "
+            f"RETURNING {ALL_FIELDS}) "
+            "SELECT updated.id, updated.value, updated.updated_at, found._exists "
+            "FROM (SELECT EXISTS (SELECT true AS anon_1 FROM writer "
+            "WHERE writer.id = 2) AS _exists) AS found "
+            "LEFT OUTER JOIN updated ON true"
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "batch,rows,expected",
+    [
+        # matched by id
+        ([{"id": 3}, {"id": 1}], [{"id": 1}, {"id": 3}], [{"id": 3}, {"id": 1}]),
+        # generated ids are in the order of the VALUES list
+        (
+            [{"value": "a"}, {"value": "b"}],
+            [{"id": 6}, {"id": 5}],
+            [{"id": 5}, {"id": 6}],
+        ),
+        ([{"id": None}, {"id": None}], [{"id": 6}, {"id": 5}], [{"id": 5}, {"id": 6}]),
+        # records that were not written are left out
+        ([{"id": 3}, {"id": 1}], [{"id": 1}], [{"id": 1}]),
+        ([], [], []),
+    ],
+)
+def test_in_batch_order(batch, rows, expected):
+    assert in_batch_order(batch, rows) == expected
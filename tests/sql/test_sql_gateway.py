@@ -11,13 +11,23 @@ from sqlalchemy import MetaData
 from sqlalchemy import Table
 from sqlalchemy import Text
 
+from clean_python import AlreadyExists
+from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
+from clean_python import Json
+from clean_python import Mapper
+from clean_python import Metric
 from clean_python import PageOptions
+from clean_python import Rows
+from clean_python.sql import ImportResult
+from clean_python.sql import ManyToOne
+from clean_python.sql import OneToMany
 from clean_python.sql import SQLGateway
 from clean_python.sql.testing import assert_query_equal
 from clean_python.sql.testing import FakeSQLDatabase
+from clean_python.sql.testing import FakeSQLTransaction
 
 writer = Table(
     "writer",
@@ -207,14 +217,6 @@ async def test_add(sql_gateway, record, sql):
             "SET id=2, value='foo' WHERE writer.id = 2",
         ),
         ({"id": 2, "other": "foo"}, None, "SET id=2 WHERE writer.id = 2"),
-        (
-            {"id": 2, "value": "foo"},
-            datetime(2010, 1, 1, tzinfo=timezone.utc),
-            (
-                "SET id=2, value='foo' WHERE writer.id = 2 "
-                "AND writer.updated_at = '2010-01-01 00:00:00+00:00'"
-            ),
-        ),
     ],
 )
 async def test_update(sql_gateway, record, if_unmodified_since, sql):
@@ -235,28 +237,41 @@ async def test_update_does_not_exist(sql_gateway):
     assert len(sql_gateway.provider.queries) == 1
 
 
-@mock.patch.object(SQLGateway, "exists")
-async def test_update_if_unmodified_since_does_not_exist(exists_m, sql_gateway):
-    exists_m.return_value = False
-    sql_gateway.provider.result.return_value = []
-    with pytest.raises(DoesNotExist):
-        await sql_gateway.update(
-            {"id": 2}, if_unmodified_since=datetime(2010, 1, 1, tzinfo=timezone.utc)
-        )
+async def test_update_if_unmodified_since(sql_gateway):
+    sql_gateway.provider.result.return_value = [
+        {"id": 2, "value": "foo", "_exists": True}
+    ]
+    actual = await sql_gateway.update(
+        {"id": 2, "value": "foo"},
+        if_unmodified_since=datetime(2010, 1, 1, tzinfo=timezone.utc),
+    )
+    assert actual == {"id": 2, "value": "foo"}
+    # a single statement, also in case of a conflict or a missing record
     assert len(sql_gateway.provider.queries) == 1
-    exists_m.assert_awaited_once_with([Filter(field="id", values=[2])])
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH updated AS (UPDATE writer SET id=2, value='foo' "
+            "WHERE writer.id = 2 AND writer.updated_at = '2010-01-01 00:00:00+00:00' "
+            f"RETURNING {ALL_FIELDS}) "
+            "SELECT updated.id, updated.value, updated.updated_at, found._exists "
+            "FROM (SELECT EXISTS (SELECT true AS anon_1 FROM writer "
+            "WHERE writer.id = 2) AS _exists) AS found "
+            "LEFT OUTER JOIN updated ON true"
+        ),
+    )
 
 
-@mock.patch.object(SQLGateway, "exists")
-async def test_update_if_unmodified_since_conflict(exists_m, sql_gateway):
-    exists_m.return_value = True
-    sql_gateway.provider.result.return_value = []
-    with pytest.raises(Conflict):
+@pytest.mark.parametrize("exists,error", [(False, DoesNotExist), (True, Conflict)])
+async def test_update_if_unmodified_since_not_updated(sql_gateway, exists, error):
+    sql_gateway.provider.result.return_value = [
+        {"id": None, "value": None, "_exists": exists}
+    ]
+    with pytest.raises(error):
         await sql_gateway.update(
             {"id": 2}, if_unmodified_since=datetime(2010, 1, 1, tzinfo=timezone.utc)
         )
     assert len(sql_gateway.provider.queries) == 1
-    exists_m.assert_awaited_once_with([Filter(field="id", values=[2])])
 
 
 async def test_remove(sql_gateway):
@@ -334,45 +349,66 @@ async def test_get_related_one_to_many(related_sql_gateway: SQLGateway):
         (
             [{"id": 3, "title": "x", "writer_id": 2}],
             [{"id": 3, "title": "x", "writer_id": 2}],
-            [],
-            [],
-        ),
-        # added a book (without an id)
-        (
-            [{"title": "x", "writer_id": 2}],
-            [],
             [
-                f"INSERT INTO book (title, writer_id) VALUES ('x', 2) RETURNING {BOOK_FIELDS}"
+                "WITH deleted AS (DELETE FROM book WHERE book.writer_id = 2 "
+                "AND (book.id NOT IN (3)) RETURNING book.id) "
+                "SELECT count(*) AS count FROM deleted",
             ],
-            [[{"id": 3, "title": "x", "writer_id": 2}]],
+            [[{"count": 0}]],
         ),
-        # added a book (with an id)
+        # added or updated books
         (
-            [{"id": 3, "title": "x", "writer_id": 2}],
-            [],
+            [{"id": 3, "title": "x"}, {"id": 4, "title": "y"}],
+            [{"id": 3, "title": "a", "writer_id": 2}],
             [
-                f"INSERT INTO book (id, title, writer_id) VALUES (3, 'x', 2) RETURNING {BOOK_FIELDS}"
+                f"INSERT INTO book (id, title, writer_id) VALUES (3, 'x', 2), "
+                f"(4, 'y', 2) ON CONFLICT (id) DO UPDATE SET id = excluded.id, "
+                f"title = excluded.title, writer_id = excluded.writer_id "
+                f"WHERE book.writer_id = excluded.writer_id "
+                f"RETURNING {BOOK_FIELDS}",
+                "WITH deleted AS (DELETE FROM book WHERE book.writer_id = 2 "
+                "AND (book.id NOT IN (3, 4)) RETURNING book.id) "
+                "SELECT count(*) AS count FROM deleted",
+            ],
+            [
+                [
+                    {"id": 3, "title": "x", "writer_id": 2},
+                    {"id": 4, "title": "y", "writer_id": 2},
+                ],
+                [{"count": 0}],
             ],
-            [[{"id": 3, "title": "x", "writer_id": 2}]],
         ),
-        # updated a book
+        # added books (without an id), replacing an existing one
         (
-            [{"id": 3, "title": "x", "writer_id": 2}],
-            [{"id": 3, "title": "a", "writer_id": 2}],
+            [{"title": "x"}, {"title": "y"}],
+            [{"id": 15, "title": "a", "writer_id": 2}],
+            [
+                f"INSERT INTO book (title, writer_id) VALUES ('x', 2), ('y', 2) "
+                f"ON CONFLICT (id) DO UPDATE SET title = excluded.title, "
+                f"writer_id = excluded.writer_id "
+                f"WHERE book.writer_id = excluded.writer_id "
+                f"RETURNING {BOOK_FIELDS}",
+                "WITH deleted AS (DELETE FROM book WHERE book.writer_id = 2 "
+                "AND (book.id NOT IN (3, 4)) RETURNING book.id) "
+                "SELECT count(*) AS count FROM deleted",
+            ],
             [
-                f"UPDATE book SET id=3, title='x', writer_id=2 WHERE book.id = 3 RETURNING {BOOK_FIELDS}"
+                [
+                    {"id": 3, "title": "x", "writer_id": 2},
+                    {"id": 4, "title": "y", "writer_id": 2},
+                ],
+                [{"count": 1}],
             ],
-            [[{"id": 3, "title": "x", "writer_id": 2}]],
         ),
-        # replaced a book with a new one
+        # removed all books
         (
-            [{"title": "x", "writer_id": 2}],
-            [{"id": 15, "title": "a", "writer_id": 2}],
+            [],
+            [{"id": 3, "title": "x", "writer_id": 2}],
             [
-                f"INSERT INTO book (title, writer_id) VALUES ('x', 2) RETURNING {BOOK_FIELDS}",
-                "DELETE FROM book WHERE book.id = 15 RETURNING book.id",
+                "WITH deleted AS (DELETE FROM book WHERE book.writer_id = 2 "
+                "RETURNING book.id) SELECT count(*) AS count FROM deleted",
             ],
-            [[{"id": 3, "title": "x", "writer_id": 2}], [{"id": 15}]],
+            [[{"count": 1}]],
         ),
     ],
 )
@@ -393,10 +429,9 @@ async def test_set_related_one_to_many(
         fk_name="writer_id",
     )
 
-    assert result == {
-        "id": 2,
-        "books": [{"id": 3, "title": "x", "writer_id": 2}],
-    }
+    # without an upsert, the books are unchanged
+    expected_books = query_results[0] if len(query_results) == 2 else books
+    assert result == {"id": 2, "books": expected_books}
     assert len(related_sql_gateway.provider.queries) == len(expected_queries) + 1
     assert_query_equal(
         related_sql_gateway.provider.queries[0][0],
@@ -408,6 +443,43 @@ async def test_set_related_one_to_many(
         assert_query_equal(actual_query, expected_query)
 
 
+async def test_set_related_one_to_many_other_parent(related_sql_gateway: SQLGateway):
+    writer = {"id": 2, "books": [{"id": 3, "title": "x"}]}
+    # book 3 belongs to another writer: the conflicting row is not updated
+    related_sql_gateway.provider.result.side_effect = [[], []]
+    with pytest.raises(AlreadyExists):
+        await related_sql_gateway._set_related_one_to_many(
+            item=writer,
+            result=writer.copy(),
+            field_name="books",
+            fk_name="writer_id",
+        )
+
+    assert len(related_sql_gateway.provider.queries) == 2
+
+
+async def test_get_related_many_to_one(sql_gateway: SQLGateway):
+    books = [
+        {"id": 3, "writer_id": 2},
+        {"id": 4, "writer_id": 2},
+        {"id": 5, "writer_id": None},
+    ]
+    writers = [{"id": 2, "value": "foo"}]
+    sql_gateway.provider.result.return_value = writers
+    await sql_gateway._get_related_many_to_one(
+        items=books,
+        field_name="writer",
+        fk_name="writer_id",
+    )
+
+    assert [x["writer"] for x in books] == [writers[0], writers[0], None]
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        f"SELECT {ALL_FIELDS} FROM writer WHERE writer.id = 2",
+    )
+
+
 async def test_update_transactional(sql_gateway):
     existing = {"id": 2, "value": "foo"}
     expected = {"id": 2, "value": "bar"}
@@ -456,3 +528,507 @@ async def test_exists(sql_gateway, filters, sql):
         sql_gateway.provider.queries[0][0],
         f"SELECT true AS exists FROM writer{sql} LIMIT 1",
     )
+
+
+class TstArraySQLGateway(SQLGateway, table=writer, array_params=True):
+    pass
+
+
+async def test_filter_array_params():
+    sql_gateway = TstArraySQLGateway(FakeSQLDatabase())
+    await sql_gateway.filter([Filter(field="id", values=[1, 2])])
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        f"SELECT {ALL_FIELDS} FROM writer WHERE writer.id = ANY (ARRAY[1, 2])",
+    )
+
+
+async def test_add_many(sql_gateway):
+    records = [{"id": 2, "value": "a"}, {"id": 3, "value": "b"}]
+    sql_gateway.provider.result.return_value = records
+    assert await sql_gateway.add_many([{"value": "a"}, {"value": "b"}]) == records
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        f"INSERT INTO writer (value) VALUES ('a'), ('b') RETURNING {ALL_FIELDS}",
+    )
+
+
+async def test_add_many_returning_order(sql_gateway):
+    # the order of RETURNING rows is not guaranteed, generated ids are in order
+    records = [{"id": 2, "value": "a"}, {"id": 3, "value": "b"}]
+    sql_gateway.provider.result.return_value = records[::-1]
+    assert await sql_gateway.add_many([{"value": "a"}, {"value": "b"}]) == records
+
+
+async def test_upsert_many_returning_order(sql_gateway):
+    records = [{"id": 3, "value": "b"}, {"id": 2, "value": "a"}]
+    sql_gateway.provider.result.return_value = records[::-1]
+    assert await sql_gateway.upsert_many(records) == records
+
+
+async def test_add_many_batches(sql_gateway):
+    sql_gateway.batch_size = 1
+    sql_gateway.provider.result.side_effect = [
+        [{"id": 2, "value": "a"}],
+        [{"id": 3, "value": "b"}],
+    ]
+    assert await sql_gateway.add_many([{"value": "a"}, {"value": "b"}]) == [
+        {"id": 2, "value": "a"},
+        {"id": 3, "value": "b"},
+    ]
+    # the batches are executed in one transaction
+    (queries,) = sql_gateway.provider.queries
+    assert len(queries) == 2
+    assert_query_equal(
+        queries[0], f"INSERT INTO writer (value) VALUES ('a') RETURNING {ALL_FIELDS}"
+    )
+    assert_query_equal(
+        queries[1], f"INSERT INTO writer (value) VALUES ('b') RETURNING {ALL_FIELDS}"
+    )
+
+
+async def test_add_many_empty(sql_gateway):
+    assert await sql_gateway.add_many([]) == []
+    assert len(sql_gateway.provider.queries) == 0
+
+
+async def test_upsert_many(sql_gateway):
+    records = [{"id": 2, "value": "a"}, {"id": 3, "value": "b"}]
+    sql_gateway.provider.result.return_value = records
+    assert await sql_gateway.upsert_many(records) == records
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "INSERT INTO writer (id, value) VALUES (2, 'a'), (3, 'b') "
+            "ON CONFLICT (id) DO UPDATE SET id = excluded.id, value = excluded.value "
+            f"RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+async def test_remove_filtered(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"count": 2}]
+    assert (
+        await sql_gateway.remove_filtered([Filter(field="value", values=["foo"])]) == 2
+    )
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH deleted AS (DELETE FROM writer WHERE writer.value = 'foo' "
+            "RETURNING writer.id) SELECT count(*) AS count FROM deleted"
+        ),
+    )
+
+
+@mock.patch(
+    "clean_python.sql.sql_gateway.now",
+    return_value=datetime(2010, 1, 1, tzinfo=timezone.utc),
+)
+async def test_update_filtered(now, sql_gateway):
+    sql_gateway.provider.result.return_value = [{"count": 2}]
+    actual = await sql_gateway.update_filtered(
+        [Filter(field="value", values=["foo"])], {"value": "bar"}
+    )
+    assert actual == 2
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH updated AS (UPDATE writer SET value='bar', "
+            "updated_at='2010-01-01 00:00:00+00:00' "
+            "WHERE writer.value = 'foo' RETURNING writer.id) "
+            "SELECT count(*) AS count FROM updated"
+        ),
+    )
+
+
+async def test_claim(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"id": 3, "value": "bar"}]
+    actual = await sql_gateway.claim(
+        [Filter(field="value", values=["foo"])], 2, {"value": "bar"}
+    )
+    assert actual == [{"id": 3, "value": "bar"}]
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH claimed AS (SELECT writer.id AS id FROM writer "
+            "WHERE writer.value = 'foo' ORDER BY writer.id LIMIT 2 "
+            "FOR UPDATE SKIP LOCKED) "
+            "UPDATE writer SET value='bar' FROM claimed "
+            f"WHERE writer.id = claimed.id RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+async def test_claim_no_values(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"id": 3, "value": "foo"}]
+    actual = await sql_gateway.claim([Filter(field="value", values=["foo"])], 2)
+    assert actual == [{"id": 3, "value": "foo"}]
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            f"SELECT {ALL_FIELDS} FROM writer WHERE writer.value = 'foo' "
+            "ORDER BY writer.id ASC LIMIT 2 OFFSET 0 FOR UPDATE SKIP LOCKED"
+        ),
+    )
+
+
+async def test_export(sql_gateway):
+    sql_gateway.provider.copy_to = mock.AsyncMock()
+    output = mock.AsyncMock()
+    await sql_gateway.export(
+        [Filter(field="value", values=["foo"])], output, fields=["value"]
+    )
+    query, actual_output, format = sql_gateway.provider.copy_to.await_args[0]
+    assert_query_equal(
+        query, "SELECT writer.id, writer.value FROM writer WHERE writer.value = 'foo'"
+    )
+    assert actual_output is output
+    assert format == "csv"
+
+
+class TstWindowSQLGateway(SQLGateway, table=writer):
+    total_mode = "window"
+
+
+class TstEstimateSQLGateway(SQLGateway, table=writer):
+    total_mode = "estimate"
+
+
+async def test_filter_with_total_window():
+    sql_gateway = TstWindowSQLGateway(FakeSQLDatabase())
+    sql_gateway.provider.result.return_value = [{"id": 2, "value": "foo", "_total": 12}]
+    actual = await sql_gateway.filter_with_total([], PageOptions(limit=1, offset=3))
+    assert actual == ([{"id": 2, "value": "foo"}], 12)
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            f"SELECT {ALL_FIELDS}, count(*) OVER () AS _total FROM writer "
+            "WHERE true ORDER BY writer.id ASC LIMIT 1 OFFSET 3"
+        ),
+    )
+
+
+@pytest.mark.parametrize("offset,expected_queries", [(0, 1), (3, 2)])
+async def test_filter_with_total_window_empty(offset, expected_queries):
+    sql_gateway = TstWindowSQLGateway(FakeSQLDatabase())
+    sql_gateway.provider.result.side_effect = [[], [{"count": 0}]]
+    actual = await sql_gateway.filter_with_total(
+        [], PageOptions(limit=1, offset=offset)
+    )
+    assert actual == ([], 0)
+    assert len(sql_gateway.provider.queries) == expected_queries
+
+
+async def test_filter_with_total_window_cursor():
+    sql_gateway = TstWindowSQLGateway(FakeSQLDatabase())
+    sql_gateway.provider.result.side_effect = [
+        [{"id": 2, "value": "foo"}],
+        [{"count": 5}],
+    ]
+    actual = await sql_gateway.filter_with_total([], PageOptions(limit=1, cursor=1))
+    assert actual == ([{"id": 2, "value": "foo"}], 5)
+    assert len(sql_gateway.provider.queries) == 2
+
+
+async def test_filter_with_total_estimate():
+    sql_gateway = TstEstimateSQLGateway(FakeSQLDatabase())
+    sql_gateway.provider.result.side_effect = [
+        [{"id": 2, "value": "foo"}],
+        [{"QUERY PLAN": [{"Plan": {"Plan Rows": 1000}}]}],
+    ]
+    actual = await sql_gateway.filter_with_total([], PageOptions(limit=1))
+    assert actual == ([{"id": 2, "value": "foo"}], 1000)
+    assert len(sql_gateway.provider.queries) == 2
+    assert_query_equal(
+        sql_gateway.provider.queries[1][0],
+        "EXPLAIN (FORMAT JSON) SELECT true AS anon_1 FROM writer WHERE true",
+    )
+
+
+async def test_filter_with_total_estimate_first_page():
+    sql_gateway = TstEstimateSQLGateway(FakeSQLDatabase())
+    sql_gateway.provider.result.return_value = [{"id": 2, "value": "foo"}]
+    actual = await sql_gateway.filter_with_total([], PageOptions(limit=2))
+    assert actual == ([{"id": 2, "value": "foo"}], 1)
+    assert len(sql_gateway.provider.queries) == 1
+
+
+async def test_iter_filter(sql_gateway):
+    records = [{"id": 2, "value": "foo"}, {"id": 3, "value": "bar"}]
+    sql_gateway.provider.result.return_value = records
+    actual = [x async for x in sql_gateway.iter_filter([], batch_size=1)]
+    assert actual == records
+    # the query is executed within a transaction
+    (queries,) = sql_gateway.provider.queries
+    assert len(queries) == 1
+    assert_query_equal(queries[0], f"SELECT {ALL_FIELDS} FROM writer WHERE true")
+
+
+class TstWriterWithBooksSQLGateway(
+    SQLGateway,
+    table=writer,
+    relations=[
+        OneToMany(field_name="books", gateway=TstRelatedSQLGateway, fk_name="writer_id")
+    ],
+):
+    pass
+
+
+class TstBookWithWriterSQLGateway(
+    SQLGateway,
+    table=book,
+    relations=[
+        ManyToOne(field_name="writer", gateway=TstSQLGateway, fk_name="writer_id")
+    ],
+):
+    pass
+
+
+def test_relations_imply_has_related():
+    assert TstWriterWithBooksSQLGateway.has_related
+    assert not TstSQLGateway.has_related
+
+
+async def test_filter_one_to_many():
+    gateway = TstWriterWithBooksSQLGateway(FakeSQLDatabase())
+    books = [{"id": 3, "title": "x", "writer_id": 2}]
+    gateway.provider.result.side_effect = [[{"id": 2}, {"id": 5}], books]
+    assert await gateway.filter([]) == [
+        {"id": 2, "books": books},
+        {"id": 5, "books": []},
+    ]
+    (queries,) = gateway.provider.queries
+    assert len(queries) == 2
+    assert_query_equal(
+        queries[1], f"SELECT {BOOK_FIELDS} FROM book WHERE book.writer_id IN (2, 5)"
+    )
+
+
+async def test_filter_many_to_one():
+    gateway = TstBookWithWriterSQLGateway(FakeSQLDatabase())
+    writer = {"id": 2, "value": "foo"}
+    gateway.provider.result.side_effect = [[{"id": 3, "writer_id": 2}], [writer]]
+    assert await gateway.filter([]) == [{"id": 3, "writer_id": 2, "writer": writer}]
+    (queries,) = gateway.provider.queries
+    assert len(queries) == 2
+    assert_query_equal(
+        queries[1], f"SELECT {ALL_FIELDS} FROM writer WHERE writer.id = 2"
+    )
+
+
+async def test_add_one_to_many_constant_statements():
+    gateway = TstWriterWithBooksSQLGateway(FakeSQLDatabase())
+    books = [{"title": str(i)} for i in range(500)]
+    upserted = [{"id": i, "title": str(i), "writer_id": 2} for i in range(500)]
+    gateway.provider.result.side_effect = [
+        [{"id": 2}],
+        [],
+        upserted,
+        [{"count": 0}],
+    ]
+    actual = await gateway.add({"value": "foo", "books": books})
+    assert actual == {"id": 2, "books": upserted}
+    (queries,) = gateway.provider.queries
+    assert len(queries) == 4
+
+
+async def test_gather(sql_gateway):
+    sql_gateway.provider.result.side_effect = [[{"id": 2}], [{"count": 1}]]
+    actual = await sql_gateway.gather(
+        sql_gateway.builder.select([]), sql_gateway.builder.count([])
+    )
+    assert actual == [[{"id": 2}], [{"count": 1}]]
+    (queries,) = sql_gateway.provider.queries
+    assert len(queries) == 2
+    assert_query_equal(queries[0], f"SELECT {ALL_FIELDS} FROM writer WHERE true")
+    assert_query_equal(queries[1], "SELECT count(*) AS count FROM writer WHERE true")
+
+
+async def test_gather_in_transaction(sql_gateway):
+    async with sql_gateway.transaction() as transaction:
+        await transaction.gather(
+            sql_gateway.builder.select([]), sql_gateway.builder.count([])
+        )
+    (queries,) = sql_gateway.provider.queries
+    assert len(queries) == 2
+
+
+async def test_filter_rows(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"id": 2, "value": "foo"}]
+    actual = await sql_gateway.filter_rows([])
+    assert actual == Rows(("id", "value"), [(2, "foo")])
+    assert len(sql_gateway.provider.queries) == 1
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        f"SELECT {ALL_FIELDS} FROM writer WHERE true",
+    )
+
+
+async def test_filter_rows_has_related():
+    gateway = TstWriterWithBooksSQLGateway(FakeSQLDatabase())
+    gateway.provider.result.side_effect = [[{"id": 2}], []]
+    actual = await gateway.filter_rows([])
+    assert actual == Rows(("id", "books"), [(2, [])])
+
+
+async def test_filter_fields(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"id": 2, "value": "foo"}]
+    assert await sql_gateway.filter([], fields=["value"]) == [{"id": 2, "value": "foo"}]
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        "SELECT writer.id, writer.value FROM writer WHERE true",
+    )
+
+
+class RenamingMapper(Mapper):
+    def to_external(self, internal: Json) -> Json:
+        return {"id": internal.get("id"), "value": internal.get("name")}
+
+    def to_internal(self, external: Json) -> Json:
+        return {"id": external["id"], "name": external["value"]}
+
+
+class TstMappedSQLGateway(SQLGateway, table=writer):
+    mapper = RenamingMapper()
+
+
+@pytest.mark.parametrize("total_mode", ["count", "window"])
+async def test_filter_fields_custom_mapper(total_mode):
+    gateway = TstMappedSQLGateway(FakeSQLDatabase())
+    gateway.total_mode = total_mode
+    gateway.provider.result.return_value = [
+        {"id": 2, "value": "foo", "updated_at": None, "_total": 1}
+    ]
+    actual, _ = await gateway.filter_with_total(
+        [], PageOptions(limit=5), fields=["name"]
+    )
+    # complete records are selected and mapped, then projected
+    assert actual == [{"id": 2, "name": "foo"}]
+    assert_query_equal(
+        gateway.provider.queries[0][0],
+        f"SELECT {ALL_FIELDS} FROM writer WHERE true "
+        "ORDER BY writer.id ASC LIMIT 5 OFFSET 0",
+    )
+
+
+async def test_update_filtered_custom_mapper():
+    gateway = TstMappedSQLGateway(FakeSQLDatabase())
+    gateway.provider.result.side_effect = [
+        [{"id": 2, "value": "foo"}],
+        [{"id": 2, "value": "bar"}],
+    ]
+    actual = await gateway.update_filtered([], {"name": "bar"})
+    assert actual == 1
+    # complete records are updated, no column is set to NULL
+    assert len(gateway.provider.queries) == 2
+    assert_query_equal(
+        gateway.provider.queries[1][0],
+        f"UPDATE writer SET id=2, value='bar' WHERE writer.id = 2 "
+        f"RETURNING {ALL_FIELDS}",
+    )
+
+
+@pytest.mark.parametrize("exists,raises", [([{"id": 3}], False), ([], True)])
+async def test_filter_empty_page_with_cursor(sql_gateway, exists, raises):
+    sql_gateway.provider.result.side_effect = [[], exists]
+    params = PageOptions(limit=5, cursor=3, order_by="value")
+    if raises:
+        with pytest.raises(BadRequest):
+            await sql_gateway.filter([], params)
+    else:
+        assert await sql_gateway.filter([], params) == []
+    assert len(sql_gateway.provider.queries) == 2
+
+
+async def test_filter_empty_page_with_id_cursor(sql_gateway):
+    sql_gateway.provider.result.return_value = []
+    assert await sql_gateway.filter([], PageOptions(limit=5, cursor=3)) == []
+    # ordering by id doesn't need the cursor record
+    assert len(sql_gateway.provider.queries) == 1
+
+
+async def test_aggregate_custom_mapper():
+    gateway = TstMappedSQLGateway(FakeSQLDatabase())
+    gateway.provider.result.return_value = [
+        {"id": 2, "value": "foo"},
+        {"id": 3, "value": "foo"},
+    ]
+    actual = await gateway.aggregate([], ["name"], [Metric(function="count")])
+    # the entity fields are aggregated after mapping complete records
+    assert actual == [{"name": "foo", "count": 2}]
+    assert_query_equal(
+        gateway.provider.queries[0][0], f"SELECT {ALL_FIELDS} FROM writer WHERE true"
+    )
+
+
+async def test_filter_rows_fields(sql_gateway):
+    await sql_gateway.filter_rows([], fields=["value"])
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        "SELECT writer.id, writer.value FROM writer WHERE true",
+    )
+
+
+async def test_filter_fields_many_to_one():
+    gateway = TstBookWithWriterSQLGateway(FakeSQLDatabase())
+    gateway.provider.result.side_effect = [[{"id": 3, "writer_id": 2}], []]
+    await gateway.filter([], fields=["writer"])
+    (queries,) = gateway.provider.queries
+    assert_query_equal(
+        queries[0], "SELECT book.id, book.writer_id FROM book WHERE true"
+    )
+
+
+async def test_filter_fields_many_to_one_projected():
+    gateway = TstBookWithWriterSQLGateway(FakeSQLDatabase())
+    writer = {"id": 2, "value": "foo", "updated_at": None}
+    gateway.provider.result.side_effect = [[{"id": 3, "writer_id": 2}], [writer]]
+    # the foreign key is not returned
+    assert await gateway.filter([], fields=["writer"]) == [{"id": 3, "writer": writer}]
+
+
+async def test_filter_fields_without_relations():
+    gateway = TstWriterWithBooksSQLGateway(FakeSQLDatabase())
+    gateway.provider.result.return_value = [{"id": 2, "value": "foo"}]
+    assert await gateway.filter([], fields=["value"]) == [{"id": 2, "value": "foo"}]
+    # the books are not fetched
+    (queries,) = gateway.provider.queries
+    assert len(queries) == 1
+    assert_query_equal(
+        queries[0], "SELECT writer.id, writer.value FROM writer WHERE true"
+    )
+
+
+async def test_import_rows(sql_gateway):
+    sql_gateway.provider.result.return_value = [{"inserted": 2, "updated": 0}]
+    records = [(1, "foo"), (2, "bar")]
+    with mock.patch.object(FakeSQLTransaction, "copy_from") as copy_from:
+        actual = await sql_gateway.import_rows(records, ["id", "value"])
+    assert actual == ImportResult(inserted=2, updated=0)
+    staging, columns, source, format = copy_from.call_args[0]
+    assert staging.startswith("import_")
+    assert columns == ["id", "value"]
+    assert source is records
+    assert format == "csv"
+    # the staging table, COPY and merge happen in a single transaction
+    assert len(sql_gateway.provider.queries) == 1
+    create, merge = sql_gateway.provider.queries[0]
+    assert_query_equal(
+        create,
+        f'CREATE TEMP TABLE "{staging}" ON COMMIT DROP AS SELECT "id", "value" '
+        'FROM "writer" WITH NO DATA',
+    )
+    assert_query_equal(
+        merge,
+        "WITH merged AS (INSERT INTO writer (id, value) "
+        f"SELECT {staging}.id AS id, {staging}.value AS value FROM {staging} "
+        "RETURNING xmax = 0 AS inserted) "
+        "SELECT count(*) FILTER (WHERE merged.inserted) AS inserted, "
+        "count(*) FILTER (WHERE NOT merged.inserted) AS updated FROM merged",
+    )
@@ -1,3 +1,7 @@
+from datetime import datetime
+from datetime import timezone
+from unittest import mock
+
 import pytest
 from sqlalchemy import Column
 from sqlalchemy import DateTime
@@ -7,11 +11,14 @@ from sqlalchemy import Table
 from sqlalchemy import Text
 
 from clean_python import ctx
+from clean_python import DoesNotExist
 from clean_python import Filter
+from clean_python import Metric
 from clean_python import Tenant
 from clean_python.sql import SQLGateway
 from clean_python.sql.testing import assert_query_equal
 from clean_python.sql.testing import FakeSQLDatabase
+from clean_python.sql.testing import FakeSQLTransaction
 
 writer = Table(
     "writer",
@@ -111,6 +118,31 @@ async def test_update(sql_gateway, tenant):
     )
 
 
+async def test_update_if_unmodified_since(sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [
+        {"id": None, "value": None, "tenant": None, "_exists": False}
+    ]
+    with pytest.raises(DoesNotExist):
+        await sql_gateway.update(
+            {"id": 2, "value": "foo"},
+            if_unmodified_since=datetime(2010, 1, 1, tzinfo=timezone.utc),
+        )
+    # the existence check is limited to the tenant as well
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            f"WITH updated AS (UPDATE writer SET id=2, value='foo', tenant={tenant.id} "
+            f"WHERE writer.id = 2 AND writer.tenant = {tenant.id} "
+            "AND writer.updated_at = '2010-01-01 00:00:00+00:00' "
+            f"RETURNING {ALL_FIELDS}) "
+            "SELECT updated.id, updated.value, updated.updated_at, updated.tenant, "
+            "found._exists FROM (SELECT EXISTS (SELECT true AS anon_1 FROM writer "
+            f"WHERE writer.id = 2 AND writer.tenant = {tenant.id}) AS _exists) AS found "
+            "LEFT OUTER JOIN updated ON true"
+        ),
+    )
+
+
 async def test_remove(sql_gateway, tenant):
     sql_gateway.provider.result.return_value = [{"id": 2}]
     assert (await sql_gateway.remove(2)) is True
@@ -178,3 +210,78 @@ async def test_exists(sql_gateway, tenant):
             f"WHERE writer.id = 1 AND writer.tenant = {tenant.id} LIMIT 1"
         ),
     )
+
+
+async def test_add_many(sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [{"id": 2}, {"id": 3}]
+    await sql_gateway.add_many([{"value": "a"}, {"value": "b"}])
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "INSERT INTO writer (value, tenant) VALUES ('a', 2), ('b', 2) "
+            f"RETURNING {ALL_FIELDS}"
+        ),
+    )
+
+
+async def test_remove_filtered(sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [{"count": 2}]
+    assert await sql_gateway.remove_filtered([]) == 2
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH deleted AS (DELETE FROM writer WHERE writer.tenant = 2 "
+            "RETURNING writer.id) SELECT count(*) AS count FROM deleted"
+        ),
+    )
+
+
+@mock.patch(
+    "clean_python.sql.sql_gateway.now",
+    return_value=datetime(2010, 1, 1, tzinfo=timezone.utc),
+)
+async def test_update_filtered(now, sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [{"count": 2}]
+    assert await sql_gateway.update_filtered([], {"value": "bar"}) == 2
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        (
+            "WITH updated AS (UPDATE writer SET value='bar', "
+            "updated_at='2010-01-01 00:00:00+00:00', tenant=2 "
+            "WHERE writer.tenant = 2 RETURNING writer.id) "
+            "SELECT count(*) AS count FROM updated"
+        ),
+    )
+
+
+async def test_aggregate(sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [{"value": "foo", "count": 4}]
+    actual = await sql_gateway.aggregate([], ["value"], [Metric(function="count")])
+    assert actual == [{"value": "foo", "count": 4}]
+    assert_query_equal(
+        sql_gateway.provider.queries[0][0],
+        "SELECT writer.value, count(*) AS count FROM writer "
+        f"WHERE writer.tenant = {tenant.id} GROUP BY writer.value ORDER BY writer.value",
+    )
+
+
+async def test_import_rows(sql_gateway, tenant):
+    sql_gateway.provider.result.return_value = [{"inserted": 1, "updated": 1}]
+    with mock.patch.object(FakeSQLTransaction, "copy_from") as copy_from:
+        await sql_gateway.import_rows([(1, "foo")], ["id", "value"], "update")
+    staging = copy_from.call_args[0][0]
+    assert_query_equal(
+        sql_gateway.provider.queries[0][1],
+        "WITH merged AS (INSERT INTO writer (id, value, tenant) "
+        f"SELECT {staging}.id AS id, {staging}.value AS value, 2 AS anon_1 "
+        f"FROM {staging} ON CONFLICT (id, tenant) DO UPDATE SET value = excluded.value "
+        "RETURNING xmax = 0 AS inserted) "
+        "SELECT count(*) FILTER (WHERE merged.inserted) AS inserted, "
+        "count(*) FILTER (WHERE NOT merged.inserted) AS updated FROM merged",
+    )
+
+
+async def test_import_rows_tenant_column(sql_gateway, tenant):
+    with pytest.raises(ValueError):
+        await sql_gateway.import_rows([(1, 3)], ["id", "tenant"])
+    assert sql_gateway.provider.queries == [[]]
@@ -0,0 +1,266 @@
+import io
+import time
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from typing import Any
+from unittest import mock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import literal_column
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import psycopg2
+from sqlalchemy.sql import Executable
+
+from clean_python import ctx
+from clean_python import Json
+from clean_python.sql import SQLDatabase
+from clean_python.sql import SyncSQLDatabase
+from clean_python.sql.sqlalchemy_async_sql_database import SQLAlchemyAsyncSQLTransaction
+from clean_python.sql.sqlalchemy_async_sql_database import statement_timeout_query
+from clean_python.sql.sqlalchemy_sync_sql_database import records_to_copy_text
+from clean_python.sql.sqlalchemy_sync_sql_database import SQLAlchemySyncSQLTransaction
+from clean_python.sql.sqlalchemy_sync_sql_database import to_array_literal
+from clean_python.sql.sqlalchemy_sync_sql_database import to_copy_text
+
+
+class TstSQLDatabase(SQLDatabase):
+    def __init__(self, acquired: bool = True):
+        self.queries: list[Executable] = []
+        self.acquired = acquired
+
+    async def execute_autocommit(self, query: Executable) -> None:
+        self.queries.append(query)
+
+    async def execute(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> list[Json]:
+        self.queries.append(query)
+        return [{"acquired": self.acquired}]
+
+    @asynccontextmanager
+    async def session(self):
+        yield self
+
+
+class TstSyncSQLDatabase(SyncSQLDatabase):
+    def __init__(self, acquired: bool = True):
+        self.queries: list[Executable] = []
+        self.acquired = acquired
+
+    def execute_autocommit(self, query: Executable) -> None:
+        self.queries.append(query)
+
+    def execute(
+        self, query: Executable, bind_params: dict[str, Any] | None = None
+    ) -> list[Json]:
+        self.queries.append(query)
+        return [{"acquired": self.acquired}]
+
+    @contextmanager
+    def session(self):
+        yield self
+
+
+@pytest.mark.parametrize(
+    "names,expected",
+    [
+        ([], []),
+        (["foo"], ['TRUNCATE TABLE "foo"']),
+        (["foo", "bar", "foo"], ['TRUNCATE TABLE "foo", "bar"']),
+        (["public.foo"], ['TRUNCATE TABLE "public"."foo"']),
+    ],
+)
+async def test_truncate_tables(names, expected):
+    database = TstSQLDatabase()
+    await database.truncate_tables(names)
+    assert [str(x) for x in database.queries] == expected
+
+    sync_database = TstSyncSQLDatabase()
+    sync_database.truncate_tables(names)
+    assert [str(x) for x in sync_database.queries] == expected
+
+
+def test_statement_timeout_query_no_deadline():
+    assert statement_timeout_query() is None
+
+
+def test_statement_timeout_query():
+    ctx.deadline = time.monotonic() + 1.5
+    try:
+        query = statement_timeout_query()
+    finally:
+        ctx.deadline = None
+    assert str(query) in {
+        "SET LOCAL statement_timeout = 1500",
+        "SET LOCAL statement_timeout = 1499",
+    }
+
+
+@pytest.mark.parametrize(
+    "wait,expected",
+    [
+        (True, "SELECT true AS acquired FROM pg_advisory_xact_lock(:key)"),
+        (False, "SELECT pg_try_advisory_xact_lock(:key) AS acquired"),
+    ],
+)
+async def test_advisory_xact_lock(wait, expected):
+    database = TstSQLDatabase()
+    assert await database.advisory_xact_lock(42, wait=wait)
+    assert [str(x) for x in database.queries] == [expected]
+    assert database.queries[0].compile().params == {"key": 42}
+
+    sync_database = TstSyncSQLDatabase()
+    assert sync_database.advisory_xact_lock(42, wait=wait)
+    assert [str(x) for x in sync_database.queries] == [expected]
+
+
+async def test_advisory_lock():
+    database = TstSQLDatabase()
+    async with database.advisory_lock(42) as acquired:
+        assert acquired
+        assert len(database.queries) == 1
+    assert [str(x) for x in database.queries] == [
+        "SELECT true AS acquired FROM pg_advisory_lock(:key)",
+        "SELECT pg_advisory_unlock(:key) AS released",
+    ]
+
+
+async def test_advisory_lock_released_on_error():
+    database = TstSQLDatabase()
+    with pytest.raises(RuntimeError):
+        async with database.advisory_lock(42):
+            raise RuntimeError()
+    assert str(database.queries[-1]) == "SELECT pg_advisory_unlock(:key) AS released"
+
+
+async def test_advisory_lock_not_acquired():
+    database = TstSQLDatabase(acquired=False)
+    async with database.advisory_lock(42, wait=False) as acquired:
+        assert not acquired
+    assert [str(x) for x in database.queries] == [
+        "SELECT pg_try_advisory_lock(:key) AS acquired"
+    ]
+
+
+def test_advisory_lock_sync():
+    database = TstSyncSQLDatabase()
+    with database.advisory_lock(42) as acquired:
+        assert acquired
+    assert [str(x) for x in database.queries] == [
+        "SELECT true AS acquired FROM pg_advisory_lock(:key)",
+        "SELECT pg_advisory_unlock(:key) AS released",
+    ]
+
+
+def test_sqlalchemy_sync_copy_to():
+    connection = mock.Mock()
+    connection.dialect = psycopg2.dialect()
+    cursor = connection.connection.cursor.return_value
+    cursor.mogrify.return_value = b"SELECT 2"
+    output = mock.Mock()
+    query = select(literal_column("id")).where(literal_column("id") == 2)
+
+    SQLAlchemySyncSQLTransaction(connection).copy_to(query, output)
+
+    cursor.mogrify.assert_called_once_with(
+        "SELECT id \nWHERE id = %(id_1)s", {"id_1": 2}
+    )
+    cursor.copy_expert.assert_called_once_with(
+        "COPY (SELECT 2) TO STDOUT WITH (FORMAT csv, HEADER)", output
+    )
+    cursor.close.assert_called_once_with()
+
+
+def test_sqlalchemy_sync_copy_from_records():
+    connection = mock.Mock()
+    cursor = connection.connection.cursor.return_value
+    records = [(1, "a\tb", None, True, {"x": 1})]
+
+    SQLAlchemySyncSQLTransaction(connection).copy_from(
+        "public.writer", ["id", "value", "n", "b", "json"], records
+    )
+
+    sql, source = cursor.copy_expert.call_args[0]
+    assert sql == (
+        'COPY "public"."writer" ("id", "value", "n", "b", "json") '
+        "FROM STDIN WITH (FORMAT text)"
+    )
+    assert source.read() == b'1\ta\\tb\t\\N\tt\t{"x": 1}\n'
+    cursor.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (["a", "b c"], '{"a","b c"}'),
+        ([1, None, True], '{"1",NULL,"t"}'),
+        ([[1, 2], [3, 4]], '{{"1","2"},{"3","4"}}'),
+        (['"', "\\", "{,}"], '{"\\"","\\\\","{,}"}'),
+        ([], "{}"),
+    ],
+)
+def test_to_array_literal(value, expected):
+    assert to_array_literal(value) == expected
+
+
+def test_to_copy_text_array():
+    # the backslashes of the array literal are escaped again for COPY
+    assert to_copy_text(['a"b', "c\\d", "e\tf"]) == r'{"a\\"b","c\\\\d","e\tf"}'
+
+
+def test_records_to_copy_text_is_lazy():
+    lines = iter([(1, "a"), (2, "b")])
+
+    source = records_to_copy_text(x for x in lines)
+
+    assert next(lines) == (1, "a")  # nothing was consumed yet
+    assert source.read() == b"2\tb\n"
+
+
+def test_sqlalchemy_sync_copy_from_file():
+    connection = mock.Mock()
+    cursor = connection.connection.cursor.return_value
+    source = io.BytesIO(b"id\n1\n")
+
+    SQLAlchemySyncSQLTransaction(connection).copy_from("writer", ["id"], source)
+
+    cursor.copy_expert.assert_called_once_with(
+        'COPY "writer" ("id") FROM STDIN WITH (FORMAT csv, HEADER)', source
+    )
+
+
+@pytest.fixture
+def sqlite_connection():
+    with create_engine("sqlite://").connect() as connection:
+        yield connection
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("CREATE TEMP TABLE staging (id INTEGER)", []),
+        ("SELECT 1 AS id", [{"id": 1}]),
+    ],
+)
+def test_sqlalchemy_sync_execute(sqlite_connection, query, expected):
+    transaction = SQLAlchemySyncSQLTransaction(sqlite_connection)
+    assert transaction.execute(text(query)) == expected
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("CREATE TEMP TABLE staging (id INTEGER)", []),
+        ("SELECT 1 AS id", [{"id": 1}]),
+    ],
+)
+async def test_sqlalchemy_async_execute(sqlite_connection, query, expected):
+    # a real (buffered) result, as returned by AsyncConnection.execute
+    connection = mock.Mock()
+    connection.execute = mock.AsyncMock(
+        side_effect=lambda *args: sqlite_connection.execute(*args)
+    )
+    transaction = SQLAlchemyAsyncSQLTransaction(connection)
+    assert await transaction.execute(text(query)) == expected
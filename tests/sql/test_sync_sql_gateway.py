@@ -9,11 +9,16 @@ from sqlalchemy import MetaData
 from sqlalchemy import Table
 from sqlalchemy import Text
 
+from clean_python import BadRequest
 from clean_python import Conflict
 from clean_python import DoesNotExist
 from clean_python import Filter
 from clean_python import Json
 from clean_python import Mapper
+from clean_python import Metric
+from clean_python import PageOptions
+from clean_python import Rows
+from clean_python.sql import ImportResult
 from clean_python.sql import SyncSQLDatabase
 from clean_python.sql import SyncSQLGateway
 
@@ -68,18 +73,14 @@ def test_add(sql_gateway: SyncSQLGateway):
     )
 
 
-@pytest.mark.parametrize("if_unmodified_since", [None, DT])
-def test_update(sql_gateway: SyncSQLGateway, if_unmodified_since: datetime | None):
+def test_update(sql_gateway: SyncSQLGateway):
     records = [{"id": 2, "value": "foo"}]
     sql_gateway.provider.execute.return_value = records
-    assert sql_gateway.update({"id": 2, "name": "foo"}, if_unmodified_since) == {
-        "id": 2,
-        "name": "foo",
-    }
+    assert sql_gateway.update({"id": 2, "name": "foo"}) == {"id": 2, "name": "foo"}
 
     # query builder was called with mapped record
     sql_gateway.builder.update.assert_called_once_with(
-        2, {"id": 2, "value": "foo"}, if_unmodified_since
+        2, {"id": 2, "value": "foo"}, None
     )
 
     # provider was called with query
@@ -108,34 +109,33 @@ def test_update_not_found(sql_gateway: SyncSQLGateway):
     assert sql_gateway.provider.execute.called
 
 
-@mock.patch.object(SyncSQLGateway, "exists")
-def test_update_if_unmodified_since_not_found(exists, sql_gateway: SyncSQLGateway):
-    exists.return_value = False
-    sql_gateway.provider.execute.return_value = []
-    with pytest.raises(DoesNotExist):
-        assert sql_gateway.update({"id": 2, "name": "foo"}, if_unmodified_since=DT)
-
-    # query builder and provider were called (call args tested earlier)
-    assert sql_gateway.builder.update.called
-    assert sql_gateway.provider.execute.called
-
-    # existence of record was checked to raise the correct error
-    exists.assert_called_once_with([Filter.for_id(2)])
+def test_update_if_unmodified_since(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [
+        {"id": 2, "value": "foo", "_exists": True}
+    ]
+    actual = sql_gateway.update({"id": 2, "name": "foo"}, if_unmodified_since=DT)
+    assert actual == {"id": 2, "name": "foo"}
 
+    # a single statement, that also tells whether the record exists
+    sql_gateway.builder.update_if_unmodified_since.assert_called_once_with(
+        2, {"id": 2, "value": "foo"}, DT
+    )
+    sql_gateway.provider.execute.assert_called_once_with(
+        sql_gateway.builder.update_if_unmodified_since.return_value
+    )
 
-@mock.patch.object(SyncSQLGateway, "exists")
-def test_update_if_unmodified_since_conflict(exists, sql_gateway: SyncSQLGateway):
-    exists.return_value = True
-    sql_gateway.provider.execute.return_value = []
-    with pytest.raises(Conflict):
-        assert sql_gateway.update({"id": 2, "name": "foo"}, if_unmodified_since=DT)
 
-    # query builder and provider were called (call args tested earlier)
-    assert sql_gateway.builder.update.called
-    assert sql_gateway.provider.execute.called
+@pytest.mark.parametrize("exists,error", [(False, DoesNotExist), (True, Conflict)])
+def test_update_if_unmodified_since_not_updated(
+    sql_gateway: SyncSQLGateway, exists: bool, error: type[Exception]
+):
+    sql_gateway.provider.execute.return_value = [
+        {"id": None, "value": None, "_exists": exists}
+    ]
+    with pytest.raises(error):
+        sql_gateway.update({"id": 2, "name": "foo"}, if_unmodified_since=DT)
 
-    # existence of record was checked to raise the correct error
-    exists.assert_called_once_with([Filter.for_id(2)])
+    assert sql_gateway.provider.execute.call_count == 1
 
 
 def test_upsert(sql_gateway: SyncSQLGateway):
@@ -186,7 +186,7 @@ def test_filter(sql_gateway: SyncSQLGateway):
     ]
 
     # query builder was called with filters and params
-    sql_gateway.builder.select.assert_called_once_with(*args)
+    sql_gateway.builder.select.assert_called_once_with(*args, fields=None)
 
     # provider was called with query
     sql_gateway.provider.execute.assert_called_once_with(
@@ -194,6 +194,24 @@ def test_filter(sql_gateway: SyncSQLGateway):
     )
 
 
+def test_filter_nonexisting_cursor(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.side_effect = [[], []]
+    with pytest.raises(BadRequest):
+        sql_gateway.filter([], PageOptions(limit=5, cursor=3, order_by="value"))
+
+    sql_gateway.builder.exists.assert_called_once_with([Filter.for_id(3)])
+
+
+def test_aggregate_custom_mapper(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [
+        {"id": 2, "value": "foo"},
+        {"id": 3, "value": "foo"},
+    ]
+    actual = sql_gateway.aggregate([], ["name"], [Metric(function="count")])
+    assert actual == [{"name": "foo", "count": 2}]
+    assert not sql_gateway.builder.aggregate.called
+
+
 def test_count(sql_gateway: SyncSQLGateway):
     sql_gateway.provider.execute.return_value = [{"count": 15}]
     assert sql_gateway.count("a") == 15
@@ -219,3 +237,203 @@ def test_exists(sql_gateway: SyncSQLGateway, exists: bool):
     sql_gateway.provider.execute.assert_called_once_with(
         sql_gateway.builder.exists.return_value
     )
+
+
+def test_add_many(sql_gateway: SyncSQLGateway):
+    sql_gateway.builder.batches.return_value = [[{"id": None, "value": "foo"}]]
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    assert sql_gateway.add_many([{"name": "foo"}]) == [{"id": 2, "name": "foo"}]
+
+    # query builder was called with mapped records
+    sql_gateway.builder.batches.assert_called_once_with(
+        [{"id": None, "value": "foo"}], sql_gateway.batch_size
+    )
+    sql_gateway.builder.insert_many.assert_called_once_with(
+        [{"id": None, "value": "foo"}]
+    )
+
+    # provider was called with query
+    sql_gateway.provider.execute.assert_called_once_with(
+        sql_gateway.builder.insert_many.return_value
+    )
+
+
+def test_upsert_many_returning_order(sql_gateway: SyncSQLGateway):
+    sql_gateway.builder.batches.return_value = [
+        [{"id": 3, "value": "bar"}, {"id": 2, "value": "foo"}]
+    ]
+    sql_gateway.provider.execute.return_value = [
+        {"id": 2, "value": "foo"},
+        {"id": 3, "value": "bar"},
+    ]
+    assert sql_gateway.upsert_many(
+        [{"id": 3, "name": "bar"}, {"id": 2, "name": "foo"}]
+    ) == [{"id": 3, "name": "bar"}, {"id": 2, "name": "foo"}]
+
+
+def test_upsert_many_multiple_batches(sql_gateway: SyncSQLGateway):
+    sql_gateway.builder.batches.return_value = [
+        [{"id": 2, "value": "foo"}],
+        [{"id": 3, "value": "bar"}],
+    ]
+    sql_gateway.provider.transaction.return_value = mock.MagicMock()
+    transaction = sql_gateway.provider.transaction.return_value.__enter__.return_value
+    transaction.execute.side_effect = [
+        [{"id": 2, "value": "foo"}],
+        [{"id": 3, "value": "bar"}],
+    ]
+    assert sql_gateway.upsert_many(
+        [{"id": 2, "name": "foo"}, {"id": 3, "name": "bar"}]
+    ) == [{"id": 2, "name": "foo"}, {"id": 3, "name": "bar"}]
+
+    # batches are executed in a single transaction
+    assert transaction.execute.call_count == 2
+    assert sql_gateway.builder.upsert_many.call_count == 2
+
+
+def test_add_many_empty(sql_gateway: SyncSQLGateway):
+    sql_gateway.builder.batches.return_value = []
+    assert sql_gateway.add_many([]) == []
+    assert not sql_gateway.provider.execute.called
+
+
+def test_remove_filtered(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [{"count": 2}]
+    assert sql_gateway.remove_filtered("a") == 2
+
+    sql_gateway.builder.delete_filtered.assert_called_once_with("a")
+    sql_gateway.provider.execute.assert_called_once_with(
+        sql_gateway.builder.delete_filtered.return_value
+    )
+
+
+def test_update_filtered_custom_mapper(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.side_effect = [
+        [{"id": 2, "value": "a"}],
+        [{"id": 2, "value": "foo"}],
+    ]
+    assert sql_gateway.update_filtered("a", {"name": "foo"}) == 1
+
+    # the complete record is mapped and updated, other columns are not set to NULL
+    assert not sql_gateway.builder.update_filtered.called
+    sql_gateway.builder.update.assert_called_once_with(
+        2, {"id": 2, "value": "foo"}, None
+    )
+
+
+def test_claim(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    actual = sql_gateway.claim("a", 5, {"name": "foo"})
+    assert actual == [{"id": 2, "name": "foo"}]
+
+    # query builder was called with mapped values
+    sql_gateway.builder.claim.assert_called_once_with(
+        "a", 5, {"id": None, "value": "foo"}
+    )
+    sql_gateway.provider.execute.assert_called_once_with(
+        sql_gateway.builder.claim.return_value
+    )
+
+
+def test_claim_no_values(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    assert sql_gateway.claim("a", 5) == [{"id": 2, "name": "foo"}]
+    sql_gateway.builder.select.assert_called_once_with(
+        "a", PageOptions(limit=5), for_update=True, skip_locked=True
+    )
+
+
+def test_export(sql_gateway: SyncSQLGateway):
+    output = mock.Mock()
+    sql_gateway.export("a", output, format="binary")
+    sql_gateway.builder.select.assert_called_once_with("a", fields=None)
+    sql_gateway.provider.copy_to.assert_called_once_with(
+        sql_gateway.builder.select.return_value, output, "binary"
+    )
+
+
+class TstWindowSQLGateway(SyncSQLGateway, table=writer):
+    mapper = TstMapper()
+    total_mode = "window"
+
+
+def test_filter_with_total_window():
+    provider = mock.Mock(spec=SyncSQLDatabase)
+    sql_gateway = TstWindowSQLGateway(provider)
+    provider.execute.return_value = [{"id": 2, "value": "foo", "_total": 12}]
+    actual = sql_gateway.filter_with_total([], PageOptions(limit=1, offset=3))
+    assert actual == ([{"id": 2, "name": "foo"}], 12)
+    assert provider.execute.call_count == 1
+
+
+def test_filter_with_total_estimate(sql_gateway: SyncSQLGateway):
+    sql_gateway.total_mode = "estimate"
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    sql_gateway.builder.parse_estimate_count.return_value = 1000
+    actual = sql_gateway.filter_with_total([], PageOptions(limit=1))
+    assert actual == ([{"id": 2, "name": "foo"}], 1000)
+
+    sql_gateway.builder.estimate_count.assert_called_once_with([])
+    sql_gateway.provider.execute.assert_called_with(
+        sql_gateway.builder.estimate_count.return_value
+    )
+
+
+def test_iter_filter(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.iter_execute.return_value = iter(
+        [[{"id": 2, "value": "foo"}], [{"id": 3, "value": "bar"}]]
+    )
+    assert list(sql_gateway.iter_filter("a", batch_size=1)) == [
+        {"id": 2, "name": "foo"},
+        {"id": 3, "name": "bar"},
+    ]
+
+    # query builder was called with filters
+    sql_gateway.builder.select.assert_called_once_with("a")
+
+    # provider was called with query
+    sql_gateway.provider.iter_execute.assert_called_once_with(
+        sql_gateway.builder.select.return_value, batch_size=1
+    )
+
+
+def test_filter_rows_with_mapper(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    actual = sql_gateway.filter_rows([])
+    assert actual == Rows(("id", "name"), [(2, "foo")])
+
+
+class TstNoMapperSQLGateway(SyncSQLGateway, table=writer):
+    pass
+
+
+def test_filter_rows():
+    provider = mock.Mock(spec=SyncSQLDatabase)
+    gateway = TstNoMapperSQLGateway(provider)
+    assert gateway.filter_rows([]) is provider.execute_rows.return_value
+    assert not provider.execute.called
+
+
+def test_import_rows(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.transaction.return_value = mock.MagicMock()
+    provider = sql_gateway.provider.transaction.return_value.__enter__.return_value
+    provider.execute.side_effect = [[], [{"inserted": 1, "updated": 2}]]
+    source = mock.Mock()
+    actual = sql_gateway.import_rows(source, ["id", "value"], "update")
+    assert actual == ImportResult(inserted=1, updated=2)
+    staging = sql_gateway.builder.create_staging_table.call_args[0][0]
+    sql_gateway.builder.create_staging_table.assert_called_once_with(
+        staging, ["id", "value"]
+    )
+    provider.copy_from.assert_called_once_with(staging, ["id", "value"], source, "csv")
+    sql_gateway.builder.merge_staging_table.assert_called_once_with(
+        staging, ["id", "value"], "update"
+    )
+
+
+def test_filter_fields_custom_mapper(sql_gateway: SyncSQLGateway):
+    sql_gateway.provider.execute.return_value = [{"id": 2, "value": "foo"}]
+    assert sql_gateway.filter([], fields=["name"]) == [{"id": 2, "name": "foo"}]
+
+    # the custom mapper requires complete records, so the projection is done after
+    sql_gateway.builder.select.assert_called_once_with([], None, fields=None)
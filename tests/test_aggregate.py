@@ -0,0 +1,64 @@
+import pytest
+
+from clean_python import Metric
+from clean_python.base.domain.aggregate import aggregate_records
+
+RECORDS = [
+    {"id": 1, "status": "a", "size": 2},
+    {"id": 2, "status": "b", "size": None},
+    {"id": 3, "status": "a", "size": 5},
+    {"id": 4, "status": None, "size": 1},
+]
+
+
+@pytest.mark.parametrize(
+    "metric,label",
+    [
+        (Metric(function="count"), "count"),
+        (Metric(function="sum", field="size"), "sum_size"),
+        (Metric(function="avg", field="size", name="mean"), "mean"),
+    ],
+)
+def test_metric_label(metric, label):
+    assert metric.label == label
+
+
+def test_metric_needs_field():
+    with pytest.raises(ValueError):
+        Metric(function="sum")
+
+
+@pytest.mark.parametrize(
+    "function,field,expected",
+    [
+        ("count", None, 4),
+        ("count", "size", 3),
+        ("sum", "size", 8),
+        ("min", "size", 1),
+        ("max", "size", 5),
+        ("avg", "size", 8 / 3),
+    ],
+)
+def test_metric_compute(function, field, expected):
+    assert Metric(function=function, field=field).compute(RECORDS) == expected
+
+
+def test_metric_compute_no_values():
+    assert Metric(function="sum", field="size").compute([RECORDS[1]]) is None
+
+
+def test_aggregate_records():
+    actual = aggregate_records(
+        RECORDS,
+        ["status"],
+        [Metric(function="count"), Metric(function="sum", field="size")],
+    )
+    assert actual == [
+        {"status": "a", "count": 2, "sum_size": 7},
+        {"status": "b", "count": 1, "sum_size": None},
+        {"status": None, "count": 1, "sum_size": 1},
+    ]
+
+
+def test_aggregate_records_no_group_by():
+    assert aggregate_records([], [], [Metric(function="count")]) == [{"count": 0}]
@@ -1,9 +1,12 @@
 import asyncio
 import os
+import time
 
+import pytest
 from pydantic import HttpUrl
 
 from clean_python import ctx
+from clean_python import DeadlineExceeded
 from clean_python import Tenant
 from clean_python import User
 
@@ -13,6 +16,9 @@ def test_default_context():
     assert ctx.user.id == "ANONYMOUS"
     assert ctx.user.name == "anonymous"
     assert ctx.tenant is None
+    assert ctx.read_your_writes is False
+    assert ctx.deadline is None
+    assert ctx.time_remaining() is None
 
 
 async def test_task_isolation():
@@ -32,9 +38,27 @@ async def test_tenant():
 
     ctx.tenant = None
     assert ctx.tenant is None
+    assert ctx.read_your_writes is False
 
 
 async def test_path():
     url = HttpUrl("http://testserver/foo?a=b")
     ctx.path = url
     assert ctx.path == url
+
+
+def test_time_remaining():
+    ctx.deadline = time.monotonic() + 10.0
+    try:
+        assert 9.0 < ctx.time_remaining() <= 10.0
+    finally:
+        ctx.deadline = None
+
+
+def test_time_remaining_exceeded():
+    ctx.deadline = time.monotonic() - 1.0
+    try:
+        with pytest.raises(DeadlineExceeded):
+            ctx.time_remaining()
+    finally:
+        ctx.deadline = None
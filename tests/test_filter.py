@@ -1,8 +1,13 @@
 import pytest
 
+from clean_python import BetweenFilter
 from clean_python import ComparisonFilter
 from clean_python import ComparisonOperator
 from clean_python import Filter
+from clean_python import ILikeFilter
+from clean_python import IsNullFilter
+from clean_python import OrFilter
+from clean_python import PrefixFilter
 
 
 def test_filter_for_id():
@@ -20,3 +25,22 @@ def test_comparison_filter_init():
 def test_comparison_filter_err(values):
     with pytest.raises(ValueError):
         ComparisonFilter(field="foo", values=values, operator="gt")
+
+
+@pytest.mark.parametrize(
+    "cls,values",
+    [
+        (BetweenFilter, [1]),
+        (BetweenFilter, [1, 2, 3]),
+        (PrefixFilter, []),
+        (ILikeFilter, ["a", "b"]),
+    ],
+)
+def test_filter_values_err(cls, values):
+    with pytest.raises(ValueError):
+        cls(field="foo", values=values)
+
+
+def test_or_filter_init():
+    actual = OrFilter(filters=[IsNullFilter(field="foo"), Filter.for_id(2)])
+    assert actual.filters[0] == IsNullFilter(field="foo", values=[])
@@ -5,11 +5,23 @@ from unittest import mock
 import pytest
 
 from clean_python import AlreadyExists
+from clean_python import BadRequest
+from clean_python import BetweenFilter
+from clean_python import ComparisonFilter
 from clean_python import Conflict
+from clean_python import ContainsFilter
 from clean_python import DoesNotExist
 from clean_python import Filter
+from clean_python import ILikeFilter
 from clean_python import InMemoryGateway
+from clean_python import IsNullFilter
+from clean_python import Metric
+from clean_python import NotFilter
+from clean_python import OrFilter
 from clean_python import PageOptions
+from clean_python import PrefixFilter
+from clean_python import SortKey
+from clean_python.base.infrastructure.in_memory_gateway import _like_to_regex
 
 
 @pytest.fixture
@@ -170,3 +182,212 @@ async def test_exists_with_filter(in_memory_gateway):
 
 async def test_exists_with_filter_not(in_memory_gateway):
     assert not await in_memory_gateway.exists([Filter(field="name", values=["bb"])])
+
+
+async def test_add_many(in_memory_gateway):
+    actual = await in_memory_gateway.add_many([{"name": "d"}, {"id": 10, "name": "e"}])
+    assert actual == [{"id": 4, "name": "d"}, {"id": 10, "name": "e"}]
+    assert in_memory_gateway.data[4] == {"id": 4, "name": "d"}
+    assert in_memory_gateway.data[10] == {"id": 10, "name": "e"}
+
+
+async def test_upsert_many(in_memory_gateway):
+    actual = await in_memory_gateway.upsert_many(
+        [{"id": 3, "name": "d"}, {"id": 4, "name": "e"}]
+    )
+    assert actual == [{"id": 3, "name": "d"}, {"id": 4, "name": "e"}]
+    assert in_memory_gateway.data[3] == {"id": 3, "name": "d"}
+    assert in_memory_gateway.data[4] == {"id": 4, "name": "e"}
+
+
+async def test_remove_filtered(in_memory_gateway):
+    actual = await in_memory_gateway.remove_filtered(
+        [Filter(field="id", values=[1, 2])]
+    )
+    assert actual == 2
+    assert list(in_memory_gateway.data) == [3]
+
+
+async def test_update_filtered(in_memory_gateway):
+    actual = await in_memory_gateway.update_filtered(
+        [Filter(field="name", values=["a", "b"])], {"name": "d"}
+    )
+    assert actual == 2
+    assert [x["name"] for x in in_memory_gateway.data.values()] == ["d", "d", "c"]
+
+
+@pytest.mark.parametrize(
+    "page_options,expected",
+    [
+        (PageOptions(limit=2, cursor=1), [2, 3]),
+        (PageOptions(limit=2, cursor=3, ascending=False), [2, 1]),
+        (PageOptions(limit=2, cursor=1, order_by="name"), [4, 2]),
+        (PageOptions(limit=2, cursor=4, order_by="name"), [2, 3]),
+        (PageOptions(limit=2, cursor=2, order_by="name", ascending=False), [4, 1]),
+    ],
+)
+async def test_filter_with_cursor(in_memory_gateway, page_options, expected):
+    await in_memory_gateway.add({"id": 4, "name": "a"})
+    actual = await in_memory_gateway.filter([], params=page_options)
+    assert [x["id"] for x in actual] == expected
+
+
+async def test_filter_with_nonexisting_cursor(in_memory_gateway):
+    with pytest.raises(BadRequest):
+        await in_memory_gateway.filter(
+            [], params=PageOptions(limit=2, cursor=5, order_by="name")
+        )
+
+
+@pytest.mark.parametrize(
+    "params,expected_total", [(None, 3), (PageOptions(limit=5), 3)]
+)
+async def test_filter_with_total(in_memory_gateway, params, expected_total):
+    records, total = await in_memory_gateway.filter_with_total([], params)
+    assert len(records) == 3
+    assert total == expected_total
+
+
+@mock.patch.object(InMemoryGateway, "count")
+async def test_filter_with_total_calls_count(count_m, in_memory_gateway):
+    count_m.return_value = 123
+    records, total = await in_memory_gateway.filter_with_total([], PageOptions(limit=2))
+    assert len(records) == 2
+    assert total == 123
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 4])
+async def test_iter_filter(in_memory_gateway, batch_size):
+    actual = [x async for x in in_memory_gateway.iter_filter([], batch_size)]
+    assert actual == list(in_memory_gateway.data.values())
+
+
+@mock.patch.object(InMemoryGateway, "filter")
+async def test_iter_filter_batches(filter_m, in_memory_gateway):
+    filter_m.side_effect = [[{"id": 1}, {"id": 2}], [{"id": 3}]]
+    actual = [x async for x in in_memory_gateway.iter_filter([], batch_size=2)]
+    assert actual == [{"id": 1}, {"id": 2}, {"id": 3}]
+    assert filter_m.call_args_list == [
+        mock.call([], params=PageOptions(limit=2, offset=0)),
+        mock.call([], params=PageOptions(limit=2, offset=2)),
+    ]
+
+
+async def test_filter_rows(in_memory_gateway):
+    actual = await in_memory_gateway.filter_rows([Filter.for_id(1)])
+    assert actual.to_dicts() == [in_memory_gateway.data[1]]
+    assert actual.keys == tuple(in_memory_gateway.data[1])
+
+
+@pytest.mark.parametrize(
+    "fields,expected",
+    [
+        (["name"], {"id": 1, "name": "a"}),
+        ([], {"id": 1}),
+        (["id", "nonexisting"], {"id": 1}),
+    ],
+)
+async def test_filter_fields(in_memory_gateway, fields, expected):
+    actual = await in_memory_gateway.filter([Filter.for_id(1)], fields=fields)
+    assert actual == [expected]
+
+
+async def test_filter_rows_fields(in_memory_gateway):
+    actual = await in_memory_gateway.filter_rows([Filter.for_id(1)], fields=[])
+    assert actual.to_dicts() == [{"id": 1}]
+
+
+@pytest.fixture
+def in_memory_gateway_2():
+    return InMemoryGateway(
+        data=[
+            {"id": 1, "name": "Alice", "tags": ["a", "b"]},
+            {"id": 2, "name": "bob", "tags": ["b"]},
+            {"id": 3, "name": None, "tags": []},
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "filter,expected",
+    [
+        (IsNullFilter(field="name"), [3]),
+        (NotFilter(filters=[IsNullFilter(field="name")]), [1, 2]),
+        # comparisons with None are unknown, also when negated (like SQL)
+        (NotFilter(filters=[Filter(field="name", values=["bob"])]), [1]),
+        (
+            NotFilter(
+                filters=[
+                    OrFilter(
+                        filters=[Filter.for_id(1), Filter(field="name", values=["bob"])]
+                    )
+                ]
+            ),
+            [],
+        ),
+        (OrFilter(filters=[Filter.for_id(1), IsNullFilter(field="name")]), [1, 3]),
+        (OrFilter(filters=[]), []),
+        (BetweenFilter(field="id", values=[2, 3]), [2, 3]),
+        (PrefixFilter(field="name", values=["Al"]), [1]),
+        (ILikeFilter(field="name", values=["%O_"]), [2]),
+        (ContainsFilter(field="tags", values=["b"]), [1, 2]),
+        (ContainsFilter(field="tags", values=["a", "b"]), [1]),
+        (ComparisonFilter(field="id", values=[2], operator="gt"), [3]),
+        (ComparisonFilter(field="name", values=["b"], operator="lt"), [1]),
+        # a None value is IS NULL (like SQLBuilder)
+        (Filter(field="name", values=[None]), [3]),
+        (Filter(field="name", values=["bob", None]), [2, 3]),
+        (NotFilter(filters=[Filter(field="name", values=[None])]), [1, 2]),
+        (ComparisonFilter(field="name", values=[None], operator="eq"), [3]),
+        (ComparisonFilter(field="name", values=[None], operator="ne"), [1, 2]),
+        (ComparisonFilter(field="name", values=[None], operator="lt"), []),
+    ],
+)
+async def test_filter_algebra(in_memory_gateway_2, filter, expected):
+    actual = await in_memory_gateway_2.filter([filter])
+    assert [x["id"] for x in actual] == expected
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("a%b", True),
+        ("a___b", True),
+        ("a\\%b", False),
+        ("a\\_b", False),
+        ("A\\%\\_\\\\B", True),
+    ],
+)
+def test_like_to_regex_escape(pattern, expected):
+    assert bool(_like_to_regex(pattern).fullmatch("a%_\\b")) is expected
+
+
+@pytest.mark.parametrize(
+    "sort,cursor,expected",
+    [
+        ([SortKey(field="name")], None, [1, 2, 3]),
+        ([SortKey(field="name", nulls="first")], None, [3, 1, 2]),
+        ([SortKey(field="name", ascending=False)], None, [3, 2, 1]),
+        ([SortKey(field="name", ascending=False, nulls="last")], None, [2, 1, 3]),
+        (
+            [SortKey(field="tags", ascending=False), SortKey(field="id")],
+            None,
+            [2, 1, 3],
+        ),
+        ([SortKey(field="tags", ascending=False), SortKey(field="id")], 2, [1, 3]),
+        ([SortKey(field="name", ascending=False)], 2, [1]),
+    ],
+)
+async def test_filter_with_sort(in_memory_gateway_2, sort, cursor, expected):
+    params = PageOptions(limit=10, sort=sort, cursor=cursor)
+    actual = await in_memory_gateway_2.filter([], params=params)
+    assert [x["id"] for x in actual] == expected
+
+
+async def test_aggregate(in_memory_gateway_2):
+    actual = await in_memory_gateway_2.aggregate(
+        [NotFilter(filters=[IsNullFilter(field="name")])],
+        ["name"],
+        [Metric(function="count")],
+    )
+    assert actual == [{"name": "Alice", "count": 1}, {"name": "bob", "count": 1}]
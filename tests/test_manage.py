@@ -77,6 +77,17 @@ async def test_filter(manage_user):
     assert result is manage_user.repo.filter.return_value
 
 
+async def test_filter_fields(manage_user):
+    filters = [Filter(field="x", values=[1])]
+    result = await manage_user.filter(filters, fields=["name"])
+
+    manage_user.repo.filter.assert_awaited_once_with(
+        filters, params=None, fields=["name"]
+    )
+
+    assert result is manage_user.repo.filter.return_value
+
+
 async def test_count(manage_user):
     filters = [Filter(field="x", values=[1])]
     result = await manage_user.count(filters)
@@ -112,3 +123,50 @@ async def test_update_retry_on_conflict_opt_out(manage_user):
 
     with pytest.raises(Conflict):
         await manage_user.update(2, {"name": "jan"}, retry_on_conflict=False)
+
+
+async def test_update_existing(manage_user):
+    existing = User.create(id=2, name="piet")
+    result = await manage_user.update(2, {"name": "jan"}, existing=existing)
+
+    manage_user.repo.update.assert_awaited_once_with(
+        2, {"name": "jan"}, existing=existing
+    )
+    assert result is manage_user.repo.update.return_value
+
+
+async def test_update_existing_retry_on_conflict(manage_user):
+    existing = User.create(id=2, name="piet")
+    manage_user.repo.update.side_effect = (Conflict, {"name": "foo"})
+
+    result = await manage_user.update(2, {"name": "jan"}, existing=existing)
+
+    # the retry reads the object again
+    assert manage_user.repo.update.call_args_list == [
+        mock.call(2, {"name": "jan"}, existing=existing),
+        mock.call(2, {"name": "jan"}),
+    ]
+    assert result == {"name": "foo"}
+
+
+async def test_update_existing_retry_on_conflict_opt_out(manage_user):
+    existing = User.create(id=2, name="piet")
+    manage_user.repo.update.side_effect = (Conflict, {"name": "foo"})
+
+    with pytest.raises(Conflict):
+        await manage_user.update(
+            2, {"name": "jan"}, retry_on_conflict=False, existing=existing
+        )
+    assert manage_user.repo.update.call_count == 1
+
+
+async def test_iterate(manage_user):
+    async def iterate(filters, batch_size):
+        for x in ["a", "b"]:
+            yield x
+
+    manage_user.repo.iterate = mock.Mock(side_effect=iterate)
+    result = [x async for x in manage_user.iterate("foo", batch_size=10)]
+
+    manage_user.repo.iterate.assert_called_once_with("foo", batch_size=10)
+    assert result == ["a", "b"]
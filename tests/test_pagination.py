@@ -0,0 +1,42 @@
+import pytest
+
+from clean_python import PageOptions
+from clean_python import SortKey
+
+
+@pytest.mark.parametrize(
+    "params,expected",
+    [
+        (PageOptions(limit=5), [SortKey(field="id")]),
+        (
+            PageOptions(limit=5, order_by="name", ascending=False),
+            [
+                SortKey(field="name", ascending=False),
+                SortKey(field="id", ascending=False),
+            ],
+        ),
+        (
+            PageOptions(
+                limit=5,
+                sort=[SortKey(field="a", ascending=False), SortKey(field="b")],
+            ),
+            [
+                SortKey(field="a", ascending=False),
+                SortKey(field="b"),
+                SortKey(field="id"),
+            ],
+        ),
+        (
+            PageOptions(limit=5, sort=[SortKey(field="id"), SortKey(field="b")]),
+            [SortKey(field="id")],
+        ),
+    ],
+)
+def test_sort_keys(params, expected):
+    assert params.sort_keys() == expected
+
+
+def test_sort_sets_order_by():
+    params = PageOptions(limit=5, sort=[SortKey(field="a", ascending=False)])
+    assert params.order_by == "a"
+    assert params.ascending is False
@@ -105,6 +105,34 @@ async def test_update_validates(user_repository: UserRepository, optimistic: boo
         await user_repository.update(id=2, values={"id": 6}, optimistic=optimistic)
 
 
+async def test_update_existing(user_repository: UserRepository, users: List[User]):
+    with mock.patch.object(InMemoryGateway, "get") as get_m:
+        actual = await user_repository.update(
+            id=2, values={"name": "d"}, existing=users[1]
+        )
+    # the existing object is not read again
+    assert not get_m.called
+    assert actual.name == "d"
+    assert user_repository.gateway.data[2] == actual.model_dump()
+
+
+async def test_update_existing_outdated(
+    user_repository: UserRepository, users: List[User]
+):
+    outdated = users[1].model_copy(
+        update={"updated_at": users[1].updated_at - timedelta(seconds=1)}
+    )
+    with pytest.raises(Conflict):
+        await user_repository.update(id=2, values={"name": "d"}, existing=outdated)
+
+
+async def test_update_existing_other_id(
+    user_repository: UserRepository, users: List[User]
+):
+    with pytest.raises(ValueError):
+        await user_repository.update(id=2, values={"name": "d"}, existing=users[0])
+
+
 async def test_remove(user_repository: UserRepository):
     assert await user_repository.remove(2)
     assert 2 not in user_repository.gateway.data
@@ -147,15 +175,15 @@ async def test_filter_with_pagination(
 
 
 @pytest.mark.parametrize(
-    "page_options",
+    "page_options,next_cursor",
     [
-        PageOptions(limit=3, offset=0, order_by="id"),
-        PageOptions(limit=10, offset=1, order_by="id"),
+        (PageOptions(limit=3, offset=0, order_by="id"), 3),
+        (PageOptions(limit=10, offset=1, order_by="id"), None),
     ],
 )
 @mock.patch.object(InMemoryGateway, "count")
 async def test_filter_with_pagination_calls_count(
-    count_m, user_repository: UserRepository, users, page_options
+    count_m, user_repository: UserRepository, users, page_options, next_cursor
 ):
     count_m.return_value = 123
     actual = await user_repository.filter([], page_options)
@@ -164,6 +192,7 @@ async def test_filter_with_pagination_calls_count(
         items=users[page_options.offset :],
         limit=page_options.limit,
         offset=page_options.offset,
+        next_cursor=next_cursor,
     )
     assert count_m.called
 
@@ -211,3 +240,52 @@ async def test_update_conflict(user_repository: UserRepository, optimistic: bool
     user_repository.gateway.__class__ = ConflictInMemoryGateway
     with pytest.raises(Conflict):
         await user_repository.update(id=2, values={"name": "d"}, optimistic=optimistic)
+
+
+async def test_add_many(user_repository: UserRepository):
+    actual = await user_repository.add_many([User.create(name="d"), {"name": "e"}])
+    assert [x.name for x in actual] == ["d", "e"]
+    assert user_repository.gateway.data[4] == actual[0].model_dump()
+    assert user_repository.gateway.data[5] == actual[1].model_dump()
+
+
+async def test_upsert_many(user_repository: UserRepository):
+    actual = await user_repository.upsert_many(
+        [User.create(id=2, name="d"), User.create(id=4, name="e")]
+    )
+    assert [x.name for x in actual] == ["d", "e"]
+    assert user_repository.gateway.data[2] == actual[0].model_dump()
+    assert user_repository.gateway.data[4] == actual[1].model_dump()
+
+
+@mock.patch.object(InMemoryGateway, "count")
+async def test_filter_with_cursor(count_m, user_repository: UserRepository, users):
+    count_m.return_value = 3
+    actual = await user_repository.filter([], PageOptions(limit=2, cursor=1))
+    assert actual == Page(
+        total=3, items=users[1:], limit=2, offset=0, next_cursor=users[2].id
+    )
+    # a short page after a cursor is not the first page
+    assert count_m.called
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 4])
+async def test_iterate(user_repository: UserRepository, users, batch_size):
+    actual = [x async for x in user_repository.iterate([], batch_size=batch_size)]
+    assert actual == users
+
+
+async def test_filter_items(user_repository: UserRepository, users, page_options):
+    assert await user_repository.filter_items([], page_options) == users
+
+
+async def test_filter_fields(user_repository: UserRepository, page_options):
+    actual = await user_repository.filter([], page_options, fields=["name"])
+    assert actual.total == 3
+    assert actual.next_cursor is None
+    # partial records are returned as dictionaries, they are not valid entities
+    assert actual.items == [
+        {"id": 1, "name": "a"},
+        {"id": 2, "name": "b"},
+        {"id": 3, "name": "c"},
+    ]
@@ -0,0 +1,20 @@
+from clean_python import Rows
+
+
+def test_to_dicts():
+    rows = Rows(("id", "name"), [(1, "a"), (2, "b")])
+    assert rows.to_dicts() == [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+
+
+def test_from_dicts():
+    rows = Rows.from_dicts([{"id": 1, "name": "a"}, {"name": "b", "id": 2}])
+    assert rows == Rows(("id", "name"), [(1, "a"), (2, "b")])
+
+
+def test_from_dicts_empty():
+    assert Rows.from_dicts([]) == Rows((), [])
+
+
+def test_from_dicts_different_keys():
+    rows = Rows.from_dicts([{"id": 1}, {"id": 2, "name": "b"}])
+    assert rows == Rows(("id", "name"), [(1, None), (2, "b")])
@@ -77,6 +77,17 @@ def test_filter(manage_user):
     assert result is manage_user.repo.filter.return_value
 
 
+def test_filter_fields(manage_user):
+    filters = [Filter(field="x", values=[1])]
+    result = manage_user.filter(filters, fields=["name"])
+
+    manage_user.repo.filter.assert_called_once_with(
+        filters, params=None, fields=["name"]
+    )
+
+    assert result is manage_user.repo.filter.return_value
+
+
 def test_count(manage_user):
     filters = [Filter(field="x", values=[1])]
     result = manage_user.count(filters)
@@ -112,3 +123,10 @@ def test_update_retry_on_conflict_opt_out(manage_user):
 
     with pytest.raises(Conflict):
         manage_user.update(2, {"name": "jan"}, retry_on_conflict=False)
+
+
+def test_iterate(manage_user):
+    result = manage_user.iterate("foo", batch_size=10)
+
+    manage_user.repo.iterate.assert_called_once_with("foo", batch_size=10)
+    assert result is manage_user.repo.iterate.return_value
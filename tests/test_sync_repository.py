@@ -139,15 +139,15 @@ def test_filter_with_pagination(
 
 
 @pytest.mark.parametrize(
-    "page_options",
+    "page_options,next_cursor",
     [
-        PageOptions(limit=3, offset=0, order_by="id"),
-        PageOptions(limit=10, offset=1, order_by="id"),
+        (PageOptions(limit=3, offset=0, order_by="id"), 3),
+        (PageOptions(limit=10, offset=1, order_by="id"), None),
     ],
 )
 @mock.patch.object(InMemorySyncGateway, "count")
 def test_filter_with_pagination_calls_count(
-    count_m, user_repository: UserSyncRepository, users, page_options
+    count_m, user_repository: UserSyncRepository, users, page_options, next_cursor
 ):
     count_m.return_value = 123
     actual = user_repository.filter([], page_options)
@@ -156,6 +156,7 @@ def test_filter_with_pagination_calls_count(
         items=users[page_options.offset :],
         limit=page_options.limit,
         offset=page_options.offset,
+        next_cursor=next_cursor,
     )
     assert count_m.called
 
@@ -180,3 +181,52 @@ def test_count(gateway_count, user_repository):
 def test_exists(gateway_exists, user_repository):
     assert user_repository.exists("foo") is gateway_exists.return_value
     gateway_exists.assert_called_once_with("foo")
+
+
+def test_add_many(user_repository: UserSyncRepository):
+    actual = user_repository.add_many([User.create(name="d"), {"name": "e"}])
+    assert [x.name for x in actual] == ["d", "e"]
+    assert user_repository.gateway.data[4] == actual[0].model_dump()
+    assert user_repository.gateway.data[5] == actual[1].model_dump()
+
+
+def test_upsert_many(user_repository: UserSyncRepository):
+    actual = user_repository.upsert_many(
+        [User.create(id=2, name="d"), User.create(id=4, name="e")]
+    )
+    assert [x.name for x in actual] == ["d", "e"]
+    assert user_repository.gateway.data[2] == actual[0].model_dump()
+    assert user_repository.gateway.data[4] == actual[1].model_dump()
+
+
+@mock.patch.object(InMemorySyncGateway, "count")
+def test_filter_with_cursor(count_m, user_repository: UserSyncRepository, users):
+    count_m.return_value = 3
+    actual = user_repository.filter([], PageOptions(limit=2, cursor=1))
+    assert actual == Page(
+        total=3, items=users[1:], limit=2, offset=0, next_cursor=users[2].id
+    )
+    # a short page after a cursor is not the first page
+    assert count_m.called
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 4])
+def test_iterate(user_repository: UserSyncRepository, users, batch_size):
+    actual = list(user_repository.iterate([], batch_size=batch_size))
+    assert actual == users
+
+
+def test_filter_items(user_repository: UserSyncRepository, users, page_options):
+    assert user_repository.filter_items([], page_options) == users
+
+
+def test_filter_fields(user_repository: UserSyncRepository, page_options):
+    actual = user_repository.filter([], page_options, fields=["name"])
+    assert actual.total == 3
+    assert actual.next_cursor is None
+    # partial records are returned as dictionaries, they are not valid entities
+    assert actual.items == [
+        {"id": 1, "name": "a"},
+        {"id": 2, "name": "b"},
+        {"id": 3, "name": "c"},
+    ]
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from clean_python import ctx
+from clean_python import DeadlineExceeded
+from clean_python import Filter
+from clean_python import InMemorySyncGateway
+from clean_python import Metric
+from clean_python import PageOptions
+from clean_python import SyncGateway
+from clean_python import Tenant
+from clean_python import ThreadedGateway
+
+
+@pytest.fixture
+def sync_gateway():
+    return InMemorySyncGateway(
+        data=[
+            {"id": 1, "name": "a"},
+            {"id": 2, "name": "b"},
+        ]
+    )
+
+
+@pytest.fixture
+def gateway(sync_gateway):
+    gateway = ThreadedGateway(sync_gateway, max_workers=2, thread_name_prefix="db")
+    yield gateway
+    gateway.shutdown()
+
+
+async def test_get(gateway):
+    assert await gateway.get(1) == {"id": 1, "name": "a"}
+
+
+async def test_filter(gateway):
+    actual = await gateway.filter([Filter(field="name", values=["b"])])
+    assert actual == [{"id": 2, "name": "b"}]
+
+
+async def test_filter_fields(gateway):
+    actual = await gateway.filter([], fields=["id"])
+    assert actual == [{"id": 1}, {"id": 2}]
+
+
+async def test_filter_with_total(gateway):
+    actual = await gateway.filter_with_total([], PageOptions(limit=1))
+    assert actual == ([{"id": 1, "name": "a"}], 2)
+
+
+async def test_aggregate(gateway):
+    actual = await gateway.aggregate([], [], [Metric(function="count")])
+    assert actual == [{"count": 2}]
+
+
+async def test_add_update_remove(gateway, sync_gateway):
+    added = await gateway.add({"name": "c"})
+    assert sync_gateway.get(added["id"]) == added
+    await gateway.update({"id": added["id"], "name": "d"})
+    assert sync_gateway.get(added["id"])["name"] == "d"
+    assert await gateway.remove(added["id"])
+    assert sync_gateway.get(added["id"]) is None
+
+
+async def test_runs_in_named_thread():
+    sync_gateway = mock.Mock(SyncGateway)
+    sync_gateway.get.side_effect = lambda id: threading.current_thread().name
+    gateway = ThreadedGateway(sync_gateway, max_workers=1, thread_name_prefix="db")
+    assert (await gateway.get(1)).startswith("db")
+    gateway.shutdown()
+
+
+async def test_context_is_copied():
+    sync_gateway = mock.Mock(SyncGateway)
+    sync_gateway.get.side_effect = lambda id: ctx.tenant
+    gateway = ThreadedGateway(sync_gateway, max_workers=1)
+    ctx.tenant = Tenant(id=2, name="foo")
+    try:
+        assert await gateway.get(1) == Tenant(id=2, name="foo")
+    finally:
+        ctx.tenant = None
+        gateway.shutdown()
+
+
+async def test_backpressure():
+    event = threading.Event()
+    sync_gateway = mock.Mock(SyncGateway)
+    sync_gateway.get.side_effect = lambda id: event.wait(1.0)
+    gateway = ThreadedGateway(sync_gateway, max_workers=1)
+    tasks = [asyncio.create_task(gateway.get(i)) for i in range(3)]
+    await asyncio.sleep(0.05)
+    # one call runs in the thread, the others wait for it
+    assert gateway.waiters == 2
+    assert sync_gateway.get.call_count == 1
+    event.set()
+    assert await asyncio.gather(*tasks) == [True, True, True]
+    assert gateway.waiters == 0
+    gateway.shutdown()
+
+
+async def test_deadline_exceeded_while_waiting():
+    event = threading.Event()
+    sync_gateway = mock.Mock(SyncGateway)
+    sync_gateway.get.side_effect = lambda id: event.wait(1.0)
+    gateway = ThreadedGateway(sync_gateway, max_workers=1)
+    task = asyncio.create_task(gateway.get(1))
+    await asyncio.sleep(0.01)
+    ctx.deadline = time.monotonic() + 0.05
+    try:
+        with pytest.raises(DeadlineExceeded):
+            await gateway.get(2)
+    finally:
+        ctx.deadline = None
+        event.set()
+    assert await task
+    # the permit of the call that timed out was not leaked
+    await asyncio.sleep(0.01)
+    assert not gateway._semaphore.locked()
+    gateway.shutdown()
+
+
+async def test_cancelled_while_waiting():
+    event = threading.Event()
+    sync_gateway = mock.Mock(SyncGateway)
+    sync_gateway.get.side_effect = lambda id: event.wait(1.0)
+    gateway = ThreadedGateway(sync_gateway, max_workers=1)
+    task = asyncio.create_task(gateway.get(1))
+    waiting = asyncio.create_task(gateway.get(2))
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    event.set()
+    assert await task
+    await asyncio.sleep(0.01)
+    assert not gateway._semaphore.locked()
+    assert gateway.waiters == 0
+    gateway.shutdown()
+
+
+async def test_abandoned_acquire_is_released(sync_gateway):
+    # the acquire completed just as the timeout fired
+    gateway = ThreadedGateway(sync_gateway, max_workers=1)
+    task = asyncio.ensure_future(gateway._semaphore.acquire())
+    await task
+    assert gateway._semaphore.locked()
+    gateway._abandon(task)
+    await asyncio.sleep(0)
+    assert not gateway._semaphore.locked()
+    gateway.shutdown()